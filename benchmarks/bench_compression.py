@@ -0,0 +1,67 @@
+"""CPU cost vs bytes saved for response compression on realistic note pages.
+
+Usage: PYTHONPATH=src python benchmarks/bench_compression.py [--pages 50] [--page-size 100]
+"""
+
+import argparse
+import json
+import random
+import time
+
+from studynotes.compression import CompressionMiddleware, available_encodings
+
+WORDS = (
+    "graph tree heap stack queue hash table binary search sort merge quick dynamic "
+    "programming greedy recursion complexity proof lemma theorem invariant matrix "
+    "vector eigenvalue integral derivative limit series probability variance lecture "
+    "exam homework seminar definition example note remember important see also"
+).split()
+
+
+def make_page(rng: random.Random, size: int) -> bytes:
+    items = []
+    for i in range(size):
+        # Body lengths skew short with a long tail, capped at the schema limit.
+        n_words = min(int(rng.lognormvariate(4.5, 1.0)), 1500)
+        body = " ".join(rng.choice(WORDS) for _ in range(n_words))[:10_000]
+        items.append(
+            {
+                "id": 100_000 - i,
+                "title": " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))),
+                "body": body,
+                "owner_id": 42,
+                "tags": rng.sample(WORDS, rng.randint(0, 4)),
+            }
+        )
+    return json.dumps(items).encode()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    pages = [make_page(rng, args.page_size) for _ in range(args.pages)]
+    raw = sum(len(p) for p in pages)
+    print(f"{args.pages} pages x {args.page_size} notes, avg {raw // args.pages} bytes/page")
+    print(f"{'codec':<10}{'level':>6}{'ratio':>8}{'ms/page':>10}{'MB/s':>9}")
+
+    settings = {"gzip": (1, 4, 6, 9), "br": (1, 4, 6), "zstd": (1, 3, 9)}
+    for encoding in available_encodings()[::-1]:
+        for level in settings[encoding]:
+            mw = CompressionMiddleware(
+                None, gzip_level=level, brotli_quality=level, zstd_level=level
+            )
+            t0 = time.perf_counter()
+            out = sum(len(mw.codec(encoding).finish(p)) for p in pages)
+            elapsed = time.perf_counter() - t0
+            print(
+                f"{encoding:<10}{level:>6}{raw / out:>8.2f}"
+                f"{elapsed * 1000 / len(pages):>10.2f}{raw / elapsed / 1e6:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Note creates/sec with and without group commit at several concurrency levels.
+
+Runs against a throwaway SQLite file so the fsync cost per commit is real.
+Usage: PYTHONPATH=src python benchmarks/bench_group_commit.py [--writes 2000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from studynotes.batching import GroupCommitter
+from studynotes.database import Base
+from studynotes.models import Note, User
+
+
+def make_session_factory(path: str) -> sessionmaker:
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+
+def insert_note(db, owner_id: int, i: int) -> int:
+    note = Note(title=f"note {i}", body="lorem ipsum " * 40, owner_id=owner_id)
+    db.add(note)
+    db.flush()
+    return note.id
+
+
+def run(factory: sessionmaker, owner_id: int, writes: int, workers: int, batched: bool) -> float:
+    committer = GroupCommitter(factory) if batched else None
+
+    def direct(i: int) -> int:
+        db = factory()
+        try:
+            note_id = insert_note(db, owner_id, i)
+            db.commit()
+            return note_id
+        finally:
+            db.close()
+
+    def grouped(i: int) -> int:
+        return committer.submit(lambda db: insert_note(db, owner_id, i))
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(grouped if batched else direct, range(writes)))
+    elapsed = time.perf_counter() - t0
+    if committer is not None:
+        committer.close()
+    return writes / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writes", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        factory = make_session_factory(os.path.join(tmp, "bench.db"))
+        db = factory()
+        user = User(email="bench@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        owner_id = user.id
+        db.close()
+
+        print(f"{'workers':>8}{'direct/s':>12}{'grouped/s':>12}{'speedup':>9}")
+        for workers in (1, 4, 16, 64):
+            direct = run(factory, owner_id, args.writes, workers, batched=False)
+            grouped = run(factory, owner_id, args.writes, workers, batched=True)
+            print(f"{workers:>8}{direct:>12.0f}{grouped:>12.0f}{grouped / direct:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
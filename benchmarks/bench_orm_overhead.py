@@ -0,0 +1,107 @@
+"""Python-side ORM cost per call of the hot request paths, rebuilt vs prebuilt statements.
+
+The database is tiny so SQLite time is negligible and what remains is query
+construction, cache-key generation, compilation lookup and result handling.
+"rebuilt" is how these paths built their queries before statements were
+cached; "prebuilt" is what the app does now.
+
+Runs in a throwaway working directory so the app's ./app.db is a fresh file.
+Usage: PYTHONPATH=src python benchmarks/bench_orm_overhead.py [--calls 5000]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath("src"))
+    os.chdir(tempfile.mkdtemp(prefix="bench-orm-"))
+
+    from sqlalchemy import insert
+
+    from studynotes import main as app_main
+    from studynotes import security
+    from studynotes.database import SessionLocal
+    from studynotes.main import (
+        NoteFilter,
+        _ensure_tags,
+        _list_note_rows,
+        _list_statement,
+    )
+    from studynotes.models import Note, NoteTag, Tag, User
+
+    db = SessionLocal()
+    db.add_all([User(email=f"u{i}@example.com", hashed_password="x") for i in range(1, 101)])
+    db.execute(insert(Tag), [{"name": f"t{i}"} for i in range(50)])
+    db.execute(
+        insert(Note),
+        [{"title": f"n{i}", "body": "x" * 200, "owner_id": 1 + i % 100} for i in range(2000)],
+    )
+    db.execute(insert(NoteTag), [{"note_id": i, "tag_id": 1 + i % 50} for i in range(1, 2001)])
+    db.commit()
+    user = db.get(User, 1)
+
+    def rebuilt_user():
+        return db.query(User).filter(User.email == "u50@example.com").first()
+
+    def prebuilt_user():
+        return db.execute(security._USER_BY_EMAIL, {"email": "u50@example.com"}).scalars().first()
+
+    def rebuilt_tags():
+        out = []
+        for name in ("t1", "t2", "t3"):
+            out.append(db.query(Tag).filter(Tag.name == name).first())
+        return out
+
+    def prebuilt_tags():
+        return _ensure_tags(db, ["t1", "t2", "t3"])
+
+    wanted = {"id", "title", "tags"}
+    filt = NoteFilter(tags=("t1",), q="n")
+
+    def list_page():
+        return _list_note_rows(db, user, wanted, filt, None, 20, 0)
+
+    def rebuilt_list():
+        # Same statement, built from scratch on every call.
+        app_main._list_statement = _list_statement.__wrapped__
+        try:
+            return list_page()
+        finally:
+            app_main._list_statement = _list_statement
+
+    cases = [
+        ("current user lookup", rebuilt_user, prebuilt_user),
+        ("ensure 3 tags", rebuilt_tags, prebuilt_tags),
+        ("list notes page", rebuilt_list, list_page),
+    ]
+
+    def per_call_us(fn) -> float:
+        for _ in range(200):
+            fn()
+        samples = []
+        for _ in range(args.rounds):
+            t0 = time.perf_counter()
+            for _ in range(args.calls):
+                fn()
+            samples.append((time.perf_counter() - t0) / args.calls * 1e6)
+        return statistics.median(samples)
+
+    print(f"{'path':<22}{'rebuilt us':>12}{'prebuilt us':>13}{'speedup':>9}")
+    for name, before, after in cases:
+        b, a = per_call_us(before), per_call_us(after)
+        print(f"{name:<22}{b:>12.1f}{a:>13.1f}{b / a:>8.2f}x")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Latency of multi-tag note filters for a user with tens of thousands of tagged notes.
+
+Runs in a throwaway working directory so the app's ./app.db is a fresh file.
+Usage: PYTHONPATH=src python benchmarks/bench_tag_filter.py [--notes 30000] [--tags 300]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=int, default=30_000)
+    parser.add_argument("--tags", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath("src"))
+    os.chdir(tempfile.mkdtemp(prefix="bench-tags-"))
+
+    from sqlalchemy import insert
+
+    from studynotes.database import ReadSessionLocal, SessionLocal
+    from studynotes.main import NoteFilter, _list_note_rows
+    from studynotes.models import Note, NoteTag, Tag, User
+
+    rng = random.Random(1)
+    db = SessionLocal()
+    db.add_all([User(email=f"u{i}@example.com", hashed_password="x") for i in (1, 2)])
+    db.execute(insert(Tag), [{"name": f"t{i}"} for i in range(args.tags)])
+    for owner_id in (1, 2):
+        base = (owner_id - 1) * args.notes
+        db.execute(
+            insert(Note),
+            [
+                {"id": base + i + 1, "title": f"n{i}", "body": "x" * 200, "owner_id": owner_id}
+                for i in range(args.notes)
+            ],
+        )
+        # Zipf-like tag popularity: tag k is picked with weight 1/(k+1).
+        weights = [1 / (k + 1) for k in range(args.tags)]
+        links = set()
+        for i in range(args.notes):
+            for tag in rng.choices(range(args.tags), weights=weights, k=rng.randint(0, 5)):
+                links.add((base + i + 1, tag + 1))
+        db.execute(insert(NoteTag), [{"note_id": n, "tag_id": t} for n, t in links])
+    db.commit()
+    db.close()
+
+    cases = {
+        "tag=popular": NoteFilter(tags=("t0",)),
+        "tag=rare": NoteFilter(tags=(f"t{args.tags - 1}",)),
+        "all(2 popular)": NoteFilter(tags=("t0", "t1")),
+        "all(popular,rare)": NoteFilter(tags=("t0", f"t{args.tags - 1}")),
+        "any(3)": NoteFilter(tags=("t0", "t5", "t50"), match="any"),
+        "exclude popular": NoteFilter(exclude=("t0",)),
+        "all(2)+exclude": NoteFilter(tags=("t0", "t1"), exclude=("t2",)),
+    }
+    db = ReadSessionLocal()
+    user = db.get(User, 1)
+    print(f"{args.notes} notes/user, {args.tags} tags")
+    print(f"{'filter':<22}{'rows':>6}{'p50 ms':>9}{'max ms':>9}")
+    for name, filt in cases.items():
+        timings = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            rows = _list_note_rows(db, user, {"id", "title"}, filt, None, 50, 0)
+            timings.append((time.perf_counter() - t0) * 1000)
+        print(f"{name:<22}{len(rows):>6}{statistics.median(timings):>9.2f}{max(timings):>9.2f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Request throughput of the pre-fork server with 1 worker vs N workers.
+
+Starts ``python -m studynotes.serve`` on a free port against a fresh
+database, seeds one user with a few hundred notes, then hammers a mix of
+reads (note by id, list page) and writes (create note) from several client
+processes with keep-alive connections. Workers scale with CPU cores; on a
+single-core machine expect roughly flat numbers.
+
+Runs in a throwaway working directory so the app's ./app.db is a fresh file.
+Usage: PYTHONPATH=src python benchmarks/bench_workers.py [--workers 1 4] [--seconds 10]
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _call(conn, method, path, body=None, headers=None):
+    headers = dict(headers or {})
+    payload = None
+    if body is not None:
+        payload = json.dumps(body)
+        headers["Content-Type"] = "application/json"
+    conn.request(method, path, body=payload, headers=headers)
+    r = conn.getresponse()
+    return r.status, r.read()
+
+
+def _client(port, headers, note_ids, seconds, write_ratio, out) -> None:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    rng = random.Random(os.getpid())
+    done = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        roll = rng.random()
+        if roll < write_ratio:
+            status, _ = _call(conn, "POST", "/api/v1/notes", {"title": "w", "body": "b"}, headers)
+        elif roll < 0.5:
+            status, _ = _call(conn, "GET", "/api/v1/notes?limit=20", headers=headers)
+        else:
+            status, _ = _call(conn, "GET", f"/api/v1/notes/{rng.choice(note_ids)}", headers=headers)
+        done += 1
+        errors += status >= 400
+    conn.close()
+    out.put((done, errors))
+
+
+def run(workers: int, args) -> None:
+    port = _free_port()
+    env = dict(os.environ, JOB_WORKERS="0")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "studynotes.serve", "--workers", str(workers)]
+        + ["--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+                _call(conn, "GET", "/health")
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+        creds = {"email": f"bench{workers}@example.com", "password": "Password123"}
+        _call(conn, "POST", "/api/v1/auth/register", creds)
+        token = json.loads(_call(conn, "POST", "/api/v1/auth/login", creds)[1])["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        note_ids = [
+            json.loads(
+                _call(
+                    conn, "POST", "/api/v1/notes", {"title": f"n{i}", "body": "x" * 500}, headers
+                )[1]
+            )["id"]
+            for i in range(300)
+        ]
+        conn.close()
+
+        out = multiprocessing.Queue()
+        clients = [
+            multiprocessing.Process(
+                target=_client,
+                args=(port, headers, note_ids, args.seconds, args.write_ratio, out),
+            )
+            for _ in range(args.clients)
+        ]
+        for c in clients:
+            c.start()
+        results = [out.get() for _ in clients]
+        for c in clients:
+            c.join()
+        total = sum(r[0] for r in results)
+        errors = sum(r[1] for r in results)
+        print(f"{workers:>8}{total / args.seconds:>12.0f}{errors:>8}")
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(60)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    args = parser.parse_args()
+
+    os.environ["PYTHONPATH"] = os.pathsep.join(
+        [os.path.abspath("src"), os.environ.get("PYTHONPATH", "")]
+    )
+    os.environ.setdefault("JWT_SECRET", "bench_secret_1234567890abcdef")
+    print(f"cpus: {os.cpu_count()}, clients: {args.clients}, writes: {args.write_ratio:.0%}")
+    print(f"{'workers':>8}{'req/s':>12}{'errors':>8}")
+    for workers in args.workers:
+        os.chdir(tempfile.mkdtemp(prefix="bench-workers-"))
+        run(workers, args)
+
+
+if __name__ == "__main__":
+    main()
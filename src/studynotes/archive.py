@@ -0,0 +1,345 @@
+import argparse
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, select, update
+from sqlalchemy.orm import Session, selectinload
+
+from .database import SessionLocal
+from .jobs import JobContext, job_handler
+from .models import ArchivedNote, Note, NoteTag, Tag
+from .sharding import shard_router
+from .tagindex import tag_index
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_SEGMENT_MAX_BYTES = int(os.getenv("ARCHIVE_SEGMENT_MAX_BYTES", str(64 * 1024 * 1024)))
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "500"))
+ARCHIVE_TOUCH_FLUSH_SECONDS = float(os.getenv("ARCHIVE_TOUCH_FLUSH_SECONDS", "60"))
+
+# Record framing: 4-byte big-endian length, then a zlib-compressed JSON note.
+_LENGTH = struct.Struct(">I")
+
+
+class SegmentWriter:
+    """Appends records to fresh segment files owned by one archive run.
+
+    Every run starts new files, so segments are written by exactly one
+    writer and never modified once the run has finished.
+    """
+
+    def __init__(
+        self, directory: str, prefix: str, max_bytes: int = ARCHIVE_SEGMENT_MAX_BYTES
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self._stamp = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{os.getpid()}"
+        self._seq = 0
+        self._file = None
+        self._name = ""
+
+    def append(self, record: Dict[str, Any]) -> Tuple[str, int, int]:
+        data = zlib.compress(json.dumps(record, separators=(",", ":")).encode(), 6)
+        if self._file is None or self._file.tell() >= self.max_bytes:
+            self._roll()
+        offset = self._file.tell()
+        self._file.write(_LENGTH.pack(len(data)) + data)
+        return self._name, offset, _LENGTH.size + len(data)
+
+    def sync(self) -> None:
+        # Stubs pointing at a record are only committed after this returns.
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def _roll(self) -> None:
+        self.close()
+        self._seq += 1
+        self._name = f"{self.prefix}-{self._stamp}-{self._seq:04d}.seg"
+        self._file = open(os.path.join(self.directory, self._name), "ab")
+
+
+def read_record(directory: str, segment: str, offset: int, length: int) -> Dict[str, Any]:
+    with open(os.path.join(directory, segment), "rb") as f:
+        f.seek(offset)
+        frame = f.read(length)
+    (size,) = _LENGTH.unpack_from(frame)
+    return json.loads(zlib.decompress(frame[_LENGTH.size : _LENGTH.size + size]))
+
+
+class ArchiveStore:
+    """Cold tier for notes: records live in segment files, stubs in the database.
+
+    The ``archived_notes`` stub is the id -> (segment, offset, length) index,
+    so a lookup is one primary-key read plus one seek. Stubs live in the
+    same database as the live notes, so moving a note is a single commit.
+    """
+
+    def __init__(
+        self, directory: str = ARCHIVE_DIR, segment_max_bytes: int = ARCHIVE_SEGMENT_MAX_BYTES
+    ) -> None:
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+
+    def get(self, db: Session, note_id: int) -> Optional[Dict[str, Any]]:
+        stub = db.get(ArchivedNote, note_id)
+        if stub is None:
+            return None
+        return self._load(stub)
+
+    def scan(self, db: Session, owner_id: Optional[int]) -> Iterator[Dict[str, Any]]:
+        """Archived notes by descending id, optionally for one owner, loaded lazily."""
+        query = select(ArchivedNote).order_by(ArchivedNote.note_id.desc())
+        if owner_id is not None:
+            query = query.where(ArchivedNote.owner_id == owner_id)
+        for stub in db.execute(query.execution_options(yield_per=200)).scalars():
+            yield self._load(stub)
+
+    def archive(
+        self,
+        db: Session,
+        prefix: str,
+        older_than: float,
+        limit: Optional[int] = None,
+        batch: int = ARCHIVE_BATCH,
+        now: Optional[float] = None,
+        on_batch: Optional[Callable[[int], None]] = None,
+    ) -> int:
+        """Move notes untouched for ``older_than`` seconds into segment files.
+
+        ``on_batch`` is called with the running total after every committed
+        batch; an exception from it stops the run with that batch kept.
+        """
+        now = time.time() if now is None else now
+        # Rows from before activity tracking start their clock now.
+        db.execute(update(Note).where(Note.touched_at.is_(None)).values(touched_at=int(now)))
+        db.commit()
+        cutoff = int(now - older_than)
+        notes_table = Note.__table__
+        writer = SegmentWriter(self.directory, prefix, self.segment_max_bytes)
+        moved = 0
+        try:
+            while limit is None or moved < limit:
+                size = batch if limit is None else min(batch, limit - moved)
+                notes = (
+                    db.execute(
+                        select(Note)
+                        .options(selectinload(Note.tags).selectinload(NoteTag.tag))
+                        .where(Note.touched_at < cutoff)
+                        .order_by(Note.id)
+                        .limit(size)
+                    )
+                    .scalars()
+                    .all()
+                )
+                if not notes:
+                    break
+                stubs = {}
+                tags = {}
+                for n in notes:
+                    tags[n.id] = [nt.tag.name for nt in n.tags]
+                    record = {
+                        "id": n.id,
+                        "title": n.title,
+                        "body": n.body,
+                        "owner_id": n.owner_id,
+                        "tags": tags[n.id],
+                    }
+                    segment, offset, length = writer.append(record)
+                    stubs[n.id] = ArchivedNote(
+                        note_id=n.id,
+                        owner_id=n.owner_id,
+                        segment=segment,
+                        offset=offset,
+                        length=length,
+                        archived_at=int(now),
+                    )
+                writer.sync()
+                db.expunge_all()
+                # The batch was read without the write lock. A note edited or
+                # deleted since then is no longer old enough (or gone), so the
+                # DELETE skips it and its record in the segment is never referenced.
+                ids = (
+                    db.execute(
+                        delete(notes_table)
+                        .where(notes_table.c.id.in_(list(stubs)), notes_table.c.touched_at < cutoff)
+                        .returning(notes_table.c.id)
+                    )
+                    .scalars()
+                    .all()
+                )
+                db.execute(delete(NoteTag).where(NoteTag.note_id.in_(ids)))
+                db.add_all(stubs[i] for i in ids)
+                db.commit()
+                db.expunge_all()
+                # Suggestions rank tags by live usage, as the recount does.
+                for i in ids:
+                    for name in tags[i]:
+                        tag_index.add(name, -1)
+                moved += len(ids)
+                if on_batch is not None:
+                    on_batch(moved)
+        finally:
+            writer.close()
+        return moved
+
+    def restore(self, db: Session, note_id: int) -> Optional[Note]:
+        """Bring an archived note back into ``notes``; the caller commits.
+
+        The caller also counts the note's tags in ``tag_index`` again once
+        that commit has succeeded.
+        """
+        from .quotas import charge
+
+        stub = db.get(ArchivedNote, note_id)
+        if stub is None:
+            return None
+        record = self._load(stub)
+        note = Note(
+            id=record["id"],
+            title=record["title"],
+            body=record["body"],
+            owner_id=record["owner_id"],
+            touched_at=int(time.time()),
+        )
+        db.add(note)
+        db.delete(stub)
+        db.flush()
+        for name in record["tags"]:
+            tag = db.execute(select(Tag).where(Tag.name == name)).scalar_one_or_none()
+            if tag is None:
+                # Recreated for the owner, like any tag their write introduces.
+                charge(db, record["owner_id"], tags=1)
+                tag = Tag(name=name, created_by=record["owner_id"])
+                db.add(tag)
+                db.flush()
+            db.add(NoteTag(note_id=note.id, tag_id=tag.id))
+        db.flush()
+        db.refresh(note)
+        return note
+
+    def _load(self, stub: ArchivedNote) -> Dict[str, Any]:
+        return read_record(self.directory, stub.segment, stub.offset, stub.length)
+
+
+class TouchTracker:
+    """Buffers note reads and writes them back as ``touched_at`` in batches.
+
+    Per-read UPDATEs would turn every GET into a write; instead the ids are
+    collected in memory and flushed at most every ``flush_interval`` seconds.
+    Note ids are unique across shards, so a flush is applied everywhere.
+    """
+
+    def __init__(self, flush_interval: float = ARCHIVE_TOUCH_FLUSH_SECONDS) -> None:
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending: Dict[int, int] = {}
+        self._next_flush = time.monotonic() + flush_interval
+
+    def touch(self, note_id: int) -> None:
+        with self._lock:
+            self._pending[note_id] = int(time.time())
+
+    def flush_due(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_flush or not self._pending:
+                return False
+            self._next_flush = now + self.flush_interval
+            return True
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        notes = Note.__table__
+        stmt = (
+            update(notes)
+            .where(notes.c.id == bindparam("note_id"))
+            .values(touched_at=bindparam("ts"))
+        )
+        params = [{"note_id": note_id, "ts": ts} for note_id, ts in pending.items()]
+        for factory in _session_factories().values():
+            db = factory()
+            try:
+                db.execute(stmt, params)
+                db.commit()
+            finally:
+                db.close()
+        return len(pending)
+
+
+def _session_factories() -> Dict[str, Callable[[], Session]]:
+    factories: Dict[str, Callable[[], Session]] = {"app": SessionLocal}
+    if shard_router is not None:
+        for i in range(shard_router.count):
+            factories[f"notes-{i}"] = partial(shard_router.session, i)
+    return factories
+
+
+archive_store = ArchiveStore()
+touch_tracker = TouchTracker()
+
+
+def archive_all(
+    older_than_days: float = ARCHIVE_AFTER_DAYS,
+    limit: Optional[int] = None,
+    on_batch: Optional[Callable[[int], None]] = None,
+) -> Dict[str, int]:
+    """Archive inactive notes in app.db and every shard.
+
+    ``on_batch`` receives the number of notes moved so far across databases.
+    Only this process's buffered reads are flushed first; with pre-forked
+    workers, reads from the last flush interval in the others can be missed.
+    """
+    touch_tracker.flush()
+    moved: Dict[str, int] = {}
+    for prefix, factory in _session_factories().items():
+        base = sum(moved.values())
+        report = None if on_batch is None else (lambda n, base=base: on_batch(base + n))
+        db = factory()
+        try:
+            moved[prefix] = archive_store.archive(
+                db, prefix, older_than_days * 86400, limit, on_batch=report
+            )
+        finally:
+            db.close()
+    return moved
+
+
+@job_handler("archive")
+def _archive_job(ctx: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    moved = archive_all(
+        float(params.get("older_than_days", ARCHIVE_AFTER_DAYS)),
+        params.get("limit"),
+        on_batch=lambda n: ctx.progress(n, message="archiving"),
+    )
+    return {"archived": moved}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m studynotes.archive")
+    parser.add_argument("--days", type=float, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--limit", type=int, default=None, help="max notes per database")
+    args = parser.parse_args(argv)
+    for prefix, count in archive_all(args.days, args.limit).items():
+        print(f"{prefix}: archived {count} notes")
+
+
+if __name__ == "__main__":
+    main()
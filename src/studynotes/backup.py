@@ -0,0 +1,245 @@
+import argparse
+import fcntl
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Engine
+
+from .database import engine as main_engine
+from .sharding import shard_router
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "./backups")
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP_MS = float(os.getenv("BACKUP_STEP_SLEEP_MS", "5"))
+# Upper bound on pages copied per second, in bytes (0 = only the per-step sleep).
+BACKUP_MAX_BYTES_PER_SEC = int(os.getenv("BACKUP_MAX_BYTES_PER_SEC", str(32 * 1024 * 1024)))
+
+_COPY_CHUNK = 1024 * 1024
+_LOCK_FILE = ".backup.lock"
+_STATE_FILE = "last-backup.json"
+
+
+@dataclass
+class BackupResult:
+    name: str
+    path: str
+    pages: int
+    size: int
+    seconds: float
+    compressed: bool
+
+
+class _Throttle:
+    def __init__(self, max_bytes_per_sec: int, step_sleep: float) -> None:
+        self.max_bytes_per_sec = max_bytes_per_sec
+        self.step_sleep = step_sleep
+        self.start = time.monotonic()
+
+    def wait(self, done_bytes: int) -> None:
+        delay = self.step_sleep
+        if self.max_bytes_per_sec > 0:
+            due = self.start + done_bytes / self.max_bytes_per_sec
+            delay = max(delay, due - time.monotonic())
+        if delay > 0:
+            time.sleep(delay)
+
+
+def backup_engine(
+    engine: Engine,
+    dest: str,
+    *,
+    name: str = "app",
+    compress: bool = False,
+    pages_per_step: int = BACKUP_PAGES_PER_STEP,
+    step_sleep: float = BACKUP_STEP_SLEEP_MS / 1000,
+    max_bytes_per_sec: int = BACKUP_MAX_BYTES_PER_SEC,
+) -> BackupResult:
+    """Copy the engine's SQLite database to ``dest`` while the app keeps running.
+
+    Pages are copied ``pages_per_step`` at a time with the sqlite3 backup API,
+    sleeping between steps so the copy stays under ``max_bytes_per_sec``.
+    The source connection holds one read transaction for the whole copy:
+    under WAL writers are not blocked, and the backup sees a single snapshot
+    instead of restarting every time another connection commits. With
+    ``compress`` the finished copy is gzipped into ``dest``: the backup API
+    only writes SQLite databases, so the uncompressed copy needs disk space
+    next to ``dest`` until then.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    tmp = dest + ".part"
+    started = time.monotonic()
+    raw = engine.raw_connection()
+    try:
+        src: sqlite3.Connection = raw.driver_connection
+        src.execute("BEGIN")
+        src.execute("SELECT count(*) FROM sqlite_master").fetchall()
+        page_size = src.execute("PRAGMA page_size").fetchone()[0]
+        throttle = _Throttle(max_bytes_per_sec, step_sleep)
+        total_pages = 0
+
+        def progress(_status: int, remaining: int, total: int) -> None:
+            nonlocal total_pages
+            total_pages = total
+            if remaining:
+                throttle.wait((total - remaining) * page_size)
+
+        dst = sqlite3.connect(tmp)
+        try:
+            src.backup(dst, pages=pages_per_step, progress=progress)
+        finally:
+            dst.close()
+    finally:
+        raw.rollback()
+        raw.close()
+
+    if compress:
+        throttle = _Throttle(max_bytes_per_sec, 0)
+        done = 0
+        with open(tmp, "rb") as f_in, gzip.open(dest + ".tmp", "wb", compresslevel=6) as f_out:
+            while chunk := f_in.read(_COPY_CHUNK):
+                f_out.write(chunk)
+                done += len(chunk)
+                throttle.wait(done)
+        os.replace(dest + ".tmp", dest)
+        os.remove(tmp)
+    else:
+        os.replace(tmp, dest)
+    return BackupResult(
+        name=name,
+        path=dest,
+        pages=total_pages,
+        size=os.path.getsize(dest),
+        seconds=round(time.monotonic() - started, 3),
+        compressed=compress,
+    )
+
+
+def backup_targets() -> List[Tuple[str, Engine]]:
+    targets = [("app", main_engine)]
+    if shard_router is not None:
+        targets += [(f"notes-{i}", e) for i, e in enumerate(shard_router.engines)]
+    return targets
+
+
+def backup_all(directory: str = BACKUP_DIR, compress: bool = False, **kwargs) -> List[BackupResult]:
+    """Back up app.db and every shard, one after another, into ``directory``."""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    suffix = ".db.gz" if compress else ".db"
+    return [
+        backup_engine(
+            eng,
+            os.path.join(directory, f"{name}-{stamp}{suffix}"),
+            name=name,
+            compress=compress,
+            **kwargs,
+        )
+        for name, eng in backup_targets()
+    ]
+
+
+class BackupRunner:
+    """Runs at most one backup at a time and remembers how the last one went.
+
+    Both live next to the backups, so every server process sees the same
+    state: a running backup holds an flock on ``.backup.lock``, which the
+    kernel drops if its process dies, and the outcome is written to
+    ``last-backup.json``.
+    """
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._held: Optional[Tuple[int, str]] = None
+
+    def try_start(self) -> bool:
+        directory = self.directory or BACKUP_DIR
+        with self._lock:
+            if self._held is not None:
+                return False
+            os.makedirs(directory, exist_ok=True)
+            fd = os.open(os.path.join(directory, _LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._held = (fd, directory)
+            return True
+
+    def run(self, directory: Optional[str] = None, compress: bool = False) -> None:
+        # Call only after try_start() returned True.
+        fd, state_dir = self._held
+        started_at = datetime.now(timezone.utc).isoformat()
+        try:
+            results = backup_all(directory or state_dir, compress)
+            last = {"ok": True, "files": [asdict(r) for r in results]}
+        except Exception as exc:
+            last = {"ok": False, "error": str(exc)}
+        tmp = os.path.join(state_dir, _STATE_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"started_at": started_at, **last}, f)
+        os.replace(tmp, os.path.join(state_dir, _STATE_FILE))
+        with self._lock:
+            self._held = None
+            os.close(fd)
+
+    def status(self) -> Dict[str, Any]:
+        directory = self.directory or BACKUP_DIR
+        try:
+            with open(os.path.join(directory, _STATE_FILE)) as f:
+                last = json.load(f)
+        except FileNotFoundError:
+            last = None
+        return {"running": self._running(directory), "last": last}
+
+    def _running(self, directory: str) -> bool:
+        try:
+            fd = os.open(os.path.join(directory, _LOCK_FILE), os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+        return False
+
+
+backup_runner = BackupRunner()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m studynotes.backup")
+    parser.add_argument("--dir", default=BACKUP_DIR)
+    parser.add_argument("--gzip", action="store_true", help="gzip the finished copies")
+    parser.add_argument("--pages", type=int, default=BACKUP_PAGES_PER_STEP)
+    parser.add_argument("--sleep-ms", type=float, default=BACKUP_STEP_SLEEP_MS)
+    parser.add_argument(
+        "--max-rate",
+        type=float,
+        default=BACKUP_MAX_BYTES_PER_SEC / (1024 * 1024),
+        help="MiB per second, 0 for no limit",
+    )
+    args = parser.parse_args(argv)
+
+    results = backup_all(
+        args.dir,
+        compress=args.gzip,
+        pages_per_step=args.pages,
+        step_sleep=args.sleep_ms / 1000,
+        max_bytes_per_sec=int(args.max_rate * 1024 * 1024),
+    )
+    for r in results:
+        print(f"{r.name}: {r.pages} pages -> {r.path} ({r.size} bytes, {r.seconds}s)")
+
+
+if __name__ == "__main__":
+    main()
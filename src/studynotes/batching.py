@@ -0,0 +1,133 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional, TypeVar
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from .database import SessionLocal
+
+T = TypeVar("T")
+
+NOTE_WRITE_BATCHING = os.getenv("NOTE_WRITE_BATCHING", "0") == "1"
+NOTE_WRITE_BATCH_MAX = int(os.getenv("NOTE_WRITE_BATCH_MAX", "32"))
+NOTE_WRITE_BATCH_WAIT_MS = float(os.getenv("NOTE_WRITE_BATCH_WAIT_MS", "2"))
+
+_STOP = object()
+
+
+class GroupCommitter:
+    """Single writer thread that applies queued writes and commits them in groups.
+
+    Each submitted callable receives the writer's session and must not commit.
+    A group is closed when it reaches ``max_batch`` writes or ``max_wait``
+    seconds after its first write arrived; one commit (one fsync) then covers
+    the whole group. Writes that queue up while a commit is in progress form
+    the next group. If the group fails, its writes are retried one by one so
+    a single bad write only fails its own caller.
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker = SessionLocal,
+        max_batch: int = NOTE_WRITE_BATCH_MAX,
+        max_wait: float = NOTE_WRITE_BATCH_WAIT_MS / 1000,
+    ) -> None:
+        self._session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.commits = 0
+        self.writes = 0
+
+    def submit(self, fn: Callable[[Session], T]) -> T:
+        self._ensure_started()
+        fut: "Future[T]" = Future()
+        self._queue.put((fn, fut))
+        return fut.result()
+
+    def close(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="note-group-commit", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        last_size = 0
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            # A lone writer is not delayed: the group only waits for stragglers
+            # when the previous group showed there is concurrent write load.
+            wait = self.max_wait if last_size > 1 else 0
+            deadline = time.monotonic() + wait
+            stop = False
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = (
+                        self._queue.get(timeout=timeout)
+                        if timeout > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit_group(batch)
+            last_size = len(batch)
+            if stop:
+                return
+
+    def _commit_group(self, batch: list) -> None:
+        db = self._session_factory()
+        try:
+            try:
+                results = [fn(db) for fn, _ in batch]
+                db.commit()
+                self.commits += 1
+            except Exception:
+                db.rollback()
+                results = None
+            if results is not None:
+                self.writes += len(batch)
+                for (_, fut), result in zip(batch, results):
+                    fut.set_result(result)
+                return
+            for fn, fut in batch:
+                try:
+                    result = fn(db)
+                    db.commit()
+                except Exception as exc:
+                    db.rollback()
+                    fut.set_exception(exc)
+                else:
+                    self.commits += 1
+                    self.writes += 1
+                    fut.set_result(result)
+        except BaseException as exc:  # pragma: no cover - never strand callers
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(exc)
+        finally:
+            db.close()
+
+
+note_writer = GroupCommitter()
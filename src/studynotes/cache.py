@@ -0,0 +1,191 @@
+import fcntl
+import mmap
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+NOTE_CACHE_MAX_BYTES = int(os.getenv("NOTE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+NOTE_CACHE_TTL_SECONDS = float(os.getenv("NOTE_CACHE_TTL_SECONDS", "300"))
+NOTE_CACHE_MAX_VERSIONS = 100_000
+
+# (epoch, local counter, shared counter)
+Version = Tuple[int, int, int]
+
+
+class SharedCounters:
+    """Fixed array of counters in shared memory.
+
+    Created before ``fork()``, it is shared by every worker process, which
+    lets one worker invalidate what the others have cached. It lives in a
+    memfd, so a re-executed master can reopen it from ``fd`` and the old
+    and new worker generations keep seeing each other's writes. Keys are
+    hashed into ``slots``; a collision only costs a spurious cache miss.
+    """
+
+    def __init__(self, slots: int = 1 << 16, fd: Optional[int] = None) -> None:
+        if fd is None:
+            fd = os.memfd_create("studynotes-note-versions")
+            os.ftruncate(fd, slots * 8)
+        else:
+            slots = os.fstat(fd).st_size // 8
+        self.fd = fd
+        self.slots = slots
+        self._buf = mmap.mmap(fd, slots * 8)
+        self._counts = memoryview(self._buf).cast("Q")
+        self._lock = threading.Lock()
+
+    def get(self, key: int) -> int:
+        return self._counts[key % self.slots]
+
+    def bump(self, key: int) -> None:
+        # The record lock excludes other processes, whichever master forked
+        # them; it is per process, so threads still need the local lock.
+        with self._lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+            try:
+                self._counts[key % self.slots] += 1
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+
+@dataclass(frozen=True)
+class CachedNote:
+    note_id: int
+    version: Version
+    owner_id: int
+    payload: bytes
+    expires_at: float
+
+
+class NoteCache:
+    """LRU/TTL cache of serialized NoteOut payloads bounded by total bytes.
+
+    Every write bumps the note's version; a reader only stores what it loaded
+    if the version it saw before querying is still current, so a read racing
+    with a write can never put a stale payload back into the cache.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = NOTE_CACHE_MAX_BYTES,
+        ttl_seconds: float = NOTE_CACHE_TTL_SECONDS,
+        max_versions: int = NOTE_CACHE_MAX_VERSIONS,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._max_versions = max_versions
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, CachedNote]" = OrderedDict()
+        self._versions: "OrderedDict[int, int]" = OrderedDict()
+        # Bumped when a version counter is forgotten, which retires every
+        # version handed out before that point.
+        self._epoch = 0
+        self._shared: Optional[SharedCounters] = None
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, note_id: int) -> Optional[CachedNote]:
+        with self._lock:
+            entry = self._entries.get(note_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(note_id)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if self._shared is not None and entry.version[2] != self._shared.get(note_id):
+                # Another process wrote the note since this entry was stored.
+                self._remove(note_id)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(note_id)
+            self.hits += 1
+            return entry
+
+    def share_versions(self, counters: SharedCounters) -> None:
+        """Make invalidations visible across processes forked after this call."""
+        with self._lock:
+            self._shared = counters
+            self._entries.clear()
+            self._size = 0
+
+    def version(self, note_id: int) -> Version:
+        with self._lock:
+            return self._version(note_id)
+
+    def put(self, note_id: int, version: Version, owner_id: int, payload: bytes) -> CachedNote:
+        entry = CachedNote(
+            note_id=note_id,
+            version=version,
+            owner_id=owner_id,
+            payload=payload,
+            expires_at=time.monotonic() + self.ttl_seconds,
+        )
+        if len(payload) > self.max_bytes or self.ttl_seconds <= 0:
+            return entry
+        with self._lock:
+            if version != self._version(note_id):
+                return entry
+            self._remove(note_id)
+            self._entries[note_id] = entry
+            self._size += len(payload)
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return entry
+
+    def invalidate(self, note_id: int) -> None:
+        if self._shared is not None:
+            self._shared.bump(note_id)
+        with self._lock:
+            self._versions[note_id] = self._versions.pop(note_id, 0) + 1
+            if len(self._versions) > self._max_versions:
+                self._versions.popitem(last=False)
+                self._epoch += 1
+            if self._remove(note_id):
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self._epoch += 1
+            self._versions.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _version(self, note_id: int) -> Version:
+        shared = self._shared.get(note_id) if self._shared is not None else 0
+        return (self._epoch, self._versions.get(note_id, 0), shared)
+
+    def _remove(self, note_id: int) -> bool:
+        entry = self._entries.pop(note_id, None)
+        if entry is None:
+            return False
+        self._size -= len(entry.payload)
+        return True
+
+
+note_cache = NoteCache()
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+from .cache import SharedCounters
+
+T = TypeVar("T")
+
+LIST_COALESCE_WINDOW_SECONDS = float(os.getenv("LIST_COALESCE_WINDOW_SECONDS", "0"))
+_SWEEP_THRESHOLD = 1024
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "done_at", "version")
+
+    def __init__(self, version: int) -> None:
+        self.version = version
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.done_at: Optional[float] = None
+
+
+class SingleFlight:
+    """Runs one execution per key at a time and shares its result.
+
+    Keys are tuples whose first element is a scope (the user id for note
+    lists); ``forget(scope)`` detaches every call for that scope so requests
+    arriving after a write never join a query that started before it.
+    With ``window > 0`` finished results are also reused for that long.
+    """
+
+    def __init__(self, window: float = LIST_COALESCE_WINDOW_SECONDS) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        self._calls: Dict[Tuple[Hashable, ...], _Call] = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.window_hits = 0
+        self._shared: Optional[SharedCounters] = None
+
+    def share_versions(self, counters: SharedCounters) -> None:
+        """Count forgotten scopes in ``counters``, shared with other processes.
+
+        A forget() in one process then also keeps every other process from
+        reusing results or joining calls made for that scope before it.
+        """
+        with self._lock:
+            self._calls.clear()
+            self._shared = counters
+
+    def do(self, key: Tuple[Hashable, ...], fn: Callable[[], T]) -> T:
+        version = self._version(key[0])
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.version != version:
+                del self._calls[key]
+                call = None
+            if call is not None and call.done_at is not None:
+                if time.monotonic() - call.done_at < self.window:
+                    self.window_hits += 1
+                    return call.result
+                del self._calls[key]
+                call = None
+            if call is None:
+                if len(self._calls) >= _SWEEP_THRESHOLD:
+                    self._sweep()
+                call = self._calls[key] = _Call(version)
+                self.executions += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            with self._lock:
+                self._detach(key, call)
+            call.event.set()
+            raise
+        with self._lock:
+            call.done_at = time.monotonic()
+            if self.window <= 0:
+                self._detach(key, call)
+        call.event.set()
+        return call.result
+
+    def forget(self, scope: Hashable) -> None:
+        with self._lock:
+            for key in [k for k in self._calls if k[0] == scope]:
+                del self._calls[key]
+        if self._shared is not None:
+            self._shared.bump(self._slot(scope))
+
+    def _version(self, scope: Hashable) -> int:
+        return 0 if self._shared is None else self._shared.get(self._slot(scope))
+
+    @staticmethod
+    def _slot(scope: Hashable) -> int:
+        # Stable across processes, unlike hash() of a str.
+        return zlib.crc32(repr(scope).encode())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "window_hits": self.window_hits,
+                "in_flight": sum(1 for c in self._calls.values() if c.done_at is None),
+                "window_seconds": self.window,
+            }
+
+    def _detach(self, key: Tuple[Hashable, ...], call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def _sweep(self) -> None:
+        cutoff = time.monotonic() - self.window
+        for key in [
+            k for k, c in self._calls.items() if c.done_at is not None and c.done_at <= cutoff
+        ]:
+            del self._calls[key]
+
+
+list_coalescer = SingleFlight()
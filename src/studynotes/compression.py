@@ -0,0 +1,205 @@
+import os
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:  # optional codecs
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the environment
+    zstandard = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "4"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+
+COMPRESSIBLE_TYPES = frozenset(
+    {
+        "application/json",
+        "application/problem+json",
+        "application/x-ndjson",
+        "application/ndjson",
+    }
+)
+
+
+class _GzipCodec:
+    def __init__(self, level: int) -> None:
+        self._c = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._c.compress(data) + self._c.flush()
+
+
+class _BrotliCodec:
+    def __init__(self, quality: int) -> None:
+        self._c = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data) + self._c.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._c.process(data) + self._c.finish()
+
+
+class _ZstdCodec:
+    def __init__(self, level: int) -> None:
+        self._c = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data) + self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._c.compress(data) + self._c.flush()
+
+
+def available_encodings() -> list[str]:
+    # Server preference order.
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: str, supported: list[str]) -> Optional[str]:
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for enc in supported:
+        q = accepted.get(enc, wildcard)
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        gzip_level: int = COMPRESSION_GZIP_LEVEL,
+        brotli_quality: int = COMPRESSION_BROTLI_QUALITY,
+        zstd_level: int = COMPRESSION_ZSTD_LEVEL,
+        encodings: Optional[list[str]] = None,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.zstd_level = zstd_level
+        self.encodings = encodings or available_encodings()
+
+    def codec(self, encoding: str):
+        if encoding == "zstd":
+            return _ZstdCodec(self.zstd_level)
+        if encoding == "br":
+            return _BrotliCodec(self.brotli_quality)
+        return _GzipCodec(self.gzip_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate_encoding(accept, self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingResponder:
+    def __init__(self, mw: CompressionMiddleware, encoding: str, send: Send) -> None:
+        self.mw = mw
+        self.encoding = encoding
+        self._send = send
+        self.start: Optional[Message] = None
+        self.active = False
+        self.started = False
+        self.codec = None
+        self.pending: list[bytes] = []
+        self.pending_size = 0
+
+    async def send(self, message: Message) -> None:
+        kind = message["type"]
+        if kind == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+            self.active = media_type in COMPRESSIBLE_TYPES and "content-encoding" not in headers
+            if self.active:
+                self.start = message
+            else:
+                await self._send(message)
+            return
+        if kind != "http.response.body" or not self.active:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.started:
+            if more_body:
+                chunk = self.codec.compress(body)
+                if chunk:
+                    await self._send({"type": kind, "body": chunk, "more_body": True})
+            else:
+                await self._send({"type": kind, "body": self.codec.finish(body)})
+            return
+
+        # Buffer until we know whether the body clears the size threshold.
+        self.pending.append(body)
+        self.pending_size += len(body)
+        if more_body and self.pending_size < self.mw.minimum_size:
+            return
+        data = b"".join(self.pending)
+        self.pending = []
+        headers = MutableHeaders(scope=self.start)
+        headers.add_vary_header("Accept-Encoding")
+
+        if not more_body and len(data) < self.mw.minimum_size:
+            await self._send(self.start)
+            await self._send({"type": kind, "body": data})
+            return
+
+        self.codec = self.mw.codec(self.encoding)
+        headers["Content-Encoding"] = self.encoding
+        self.started = True
+        if more_body:
+            # Streaming: length is unknown, each chunk is flushed so clients
+            # see data as soon as the application produces it.
+            del headers["Content-Length"]
+            await self._send(self.start)
+            await self._send({"type": kind, "body": self.codec.compress(data), "more_body": True})
+        else:
+            compressed = self.codec.finish(data)
+            headers["Content-Length"] = str(len(compressed))
+            await self._send(self.start)
+            await self._send({"type": kind, "body": compressed})
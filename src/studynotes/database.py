@@ -1,11 +1,77 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import Engine, create_engine, event, inspect
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from sqlalchemy.schema import CreateColumn
 
 DB_URL = "sqlite:///./app.db"
+READ_DB_URL = "sqlite:///file:./app.db?mode=ro&uri=true"
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", str(max(8, 2 * (os.cpu_count() or 1)))))
+# Compiled SQL per engine. Note list queries alone have a few hundred
+# shapes (fields x tag plans), so the default of 500 would keep evicting.
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "2000"))
+
+
+def set_sqlite_pragmas(engine: Engine, *pragmas: str) -> None:
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, _record) -> None:
+        cursor = dbapi_conn.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+
+def create_missing_indexes(engine: Engine, tables) -> None:
+    # create_all() skips existing tables, so indexes added later are created here.
+    for table in tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def add_missing_columns(engine: Engine, tables) -> None:
+    # Nullable columns added to a model later are appended with ALTER TABLE;
+    # anything that needs a backfill or a constraint is not handled here.
+    existing_tables = set(inspect(engine).get_table_names())
+    with engine.begin() as conn:
+        for table in tables:
+            if table.name not in existing_tables:
+                continue
+            present = {c["name"] for c in inspect(conn).get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in present and column.nullable:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+
+
+def create_read_engine(url: str, **kwargs) -> Engine:
+    # mode=ro plus query_only: readers can never take the write lock, and
+    # under WAL they read a snapshot without blocking the writer.
+    read_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=READ_POOL_SIZE,
+        max_overflow=READ_POOL_SIZE,
+        query_cache_size=SQL_CACHE_SIZE,
+        **kwargs,
+    )
+    set_sqlite_pragmas(read_engine, "query_only = ON")
+    return read_engine
 
-engine = create_engine(DB_URL, connect_args={"check_same_thread": False})
+
+# studynotes_note_ids: notes get ids from the persistent counter in
+# sharding.init_note_id_counter instead of SQLite's max(rowid) + 1.
+engine = create_engine(
+    DB_URL,
+    connect_args={"check_same_thread": False},
+    query_cache_size=SQL_CACHE_SIZE,
+    execution_options={"studynotes_note_ids": True},
+)
+set_sqlite_pragmas(engine, "journal_mode = WAL")
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+read_engine = create_read_engine(READ_DB_URL)
+ReadSessionLocal = sessionmaker(bind=read_engine, autoflush=False, autocommit=False)
+
 
 class Base(DeclarativeBase):
     pass
@@ -17,3 +83,11 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import threading
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_BUFFER_SIZE = int(os.getenv("SSE_BUFFER_SIZE", "100"))
+SSE_HISTORY_SIZE = int(os.getenv("SSE_HISTORY_SIZE", "1000"))
+SSE_RETRY_MS = 3000
+
+
+@dataclass(frozen=True)
+class NoteEvent:
+    id: int
+    owner_id: int
+    kind: str
+    data: Dict[str, Any]
+
+    def encode(self) -> str:
+        payload = json.dumps(self.data, separators=(",", ":"), ensure_ascii=False)
+        return f"id: {self.id}\nevent: {self.kind}\ndata: {payload}\n\n"
+
+
+@dataclass(eq=False)
+class Subscription:
+    owner_id: int
+    loop: asyncio.AbstractEventLoop
+    queue: asyncio.Queue
+    backlog: list[NoteEvent] = field(default_factory=list)
+    gap: bool = False
+    closed: bool = False
+
+    def _offer(self, event: Optional[NoteEvent]) -> None:
+        # Runs on the subscriber's loop. A slow consumer is disconnected rather
+        # than silently losing events; it resumes via Last-Event-ID.
+        if self.closed:
+            return
+        if event is None:
+            self.closed = True
+        elif self.queue.full():
+            self.closed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = None
+        self.queue.put_nowait(event)
+
+
+class NoteEventBroker:
+    def __init__(
+        self,
+        buffer_size: int = SSE_BUFFER_SIZE,
+        history_size: int = SSE_HISTORY_SIZE,
+    ) -> None:
+        self._buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._history: deque[NoteEvent] = deque(maxlen=history_size)
+        self._subscribers: Dict[int, set[Subscription]] = defaultdict(set)
+        self._relay: Optional[Callable[[int, str, Dict[str, Any]], None]] = None
+
+    def relay_through(self, send: Callable[[int, str, Dict[str, Any]], None]) -> None:
+        """Hand new events to ``send`` instead of delivering them here.
+
+        Used when several processes serve the API: a relay numbers events
+        once and feeds them back to every process through ``deliver``.
+        """
+        self._relay = send
+
+    def publish(self, owner_id: int, kind: str, data: Dict[str, Any]) -> Optional[NoteEvent]:
+        if self._relay is not None:
+            self._relay(owner_id, kind, data)
+            return None
+        with self._lock:
+            return self._append(self._seq + 1, owner_id, kind, data)
+
+    def deliver(self, event_id: int, owner_id: int, kind: str, data: Dict[str, Any]) -> NoteEvent:
+        """Deliver an event numbered elsewhere; ids must keep increasing."""
+        with self._lock:
+            return self._append(event_id, owner_id, kind, data)
+
+    def _append(self, event_id: int, owner_id: int, kind: str, data: Dict[str, Any]) -> NoteEvent:
+        self._seq = event_id
+        event = NoteEvent(id=event_id, owner_id=owner_id, kind=kind, data=data)
+        self._history.append(event)
+        # Delivered under the lock so every subscriber sees ids in order.
+        subs = self._subscribers.get(owner_id)
+        if subs:
+            dead = [s for s in subs if not self._deliver(s, event)]
+            subs.difference_update(dead)
+        return event
+
+    def subscribe(self, owner_id: int, last_event_id: Optional[int] = None) -> Subscription:
+        sub = Subscription(
+            owner_id=owner_id,
+            loop=asyncio.get_running_loop(),
+            queue=asyncio.Queue(maxsize=self._buffer_size),
+        )
+        with self._lock:
+            if last_event_id is not None:
+                oldest = self._history[0].id if self._history else self._seq + 1
+                sub.gap = last_event_id > self._seq or last_event_id < oldest - 1
+                if not sub.gap:
+                    sub.backlog = [
+                        e for e in self._history if e.owner_id == owner_id and e.id > last_event_id
+                    ]
+            self._subscribers[owner_id].add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subscribers.get(sub.owner_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.owner_id]
+
+    def subscriber_count(self, owner_id: Optional[int] = None) -> int:
+        with self._lock:
+            if owner_id is not None:
+                return len(self._subscribers.get(owner_id, ()))
+            return sum(len(s) for s in self._subscribers.values())
+
+    def close(self) -> None:
+        with self._lock:
+            subs = [s for group in self._subscribers.values() for s in group]
+            self._subscribers.clear()
+        for sub in subs:
+            self._deliver(sub, None)
+
+    @staticmethod
+    def _deliver(sub: Subscription, event: Optional[NoteEvent]) -> bool:
+        try:
+            sub.loop.call_soon_threadsafe(sub._offer, event)
+        except RuntimeError:
+            # Loop already closed: the connection is gone.
+            return False
+        return True
+
+
+def parse_last_event_id(raw: Optional[str]) -> Optional[int]:
+    if raw is None:
+        return None
+    try:
+        value = int(raw.strip())
+    except ValueError:
+        return None
+    return value if value >= 0 else None
+
+
+async def sse_stream(
+    broker: NoteEventBroker,
+    owner_id: int,
+    last_event_id: Optional[int],
+    is_disconnected: Callable[[], Awaitable[bool]],
+    heartbeat: float = SSE_HEARTBEAT_SECONDS,
+) -> AsyncIterator[str]:
+    # Subscribing inside the generator ties the subscription to the lifetime
+    # of the response body, so the finally block always releases it.
+    sub = broker.subscribe(owner_id, last_event_id)
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        if sub.gap:
+            # History no longer covers the requested id: the client must refetch.
+            yield "event: reset\ndata: {}\n\n"
+        for event in sub.backlog:
+            yield event.encode()
+        sub.backlog = []
+        while True:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                break
+            yield event.encode()
+    finally:
+        broker.unsubscribe(sub)
+
+
+broker = NoteEventBroker()
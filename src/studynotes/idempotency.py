@@ -0,0 +1,128 @@
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "300"))
+IDEMPOTENCY_PURGE_BATCH = int(os.getenv("IDEMPOTENCY_PURGE_BATCH", "1000"))
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    status_code: int
+    body: bytes
+
+
+def fingerprint(method: str, path: str, payload: bytes = b"") -> str:
+    digest = hashlib.sha256(f"{method} {path}\n".encode())
+    digest.update(payload)
+    return digest.hexdigest()
+
+
+class KeyReuseError(Exception):
+    """The key was already used for a different request by the same user."""
+
+
+class IdempotencyStore:
+    """Key -> response records kept in the same database as the writes they guard.
+
+    ``lookup`` and ``record`` take the caller's session, so the record is
+    committed (or rolled back) together with the write it describes: a
+    retry either finds the original response or redoes the whole write.
+    Expired records are ignored on lookup and deleted in bounded batches.
+    """
+
+    def __init__(
+        self,
+        ttl: int = IDEMPOTENCY_TTL_SECONDS,
+        purge_interval: float = IDEMPOTENCY_PURGE_INTERVAL_SECONDS,
+        purge_batch: int = IDEMPOTENCY_PURGE_BATCH,
+    ) -> None:
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.purge_batch = purge_batch
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+
+    def lookup(
+        self, db: Session, user_id: int, key: str, fp: str, now: Optional[float] = None
+    ) -> Optional[StoredResponse]:
+        now = time.time() if now is None else now
+        row = db.execute(
+            select(IdempotencyKey).where(
+                IdempotencyKey.user_id == user_id, IdempotencyKey.key == key
+            )
+        ).scalar_one_or_none()
+        if row is None:
+            return None
+        if row.expires_at <= now:
+            # Free the key for reuse; the purge would drop it eventually anyway.
+            db.delete(row)
+            db.flush()
+            return None
+        if row.fingerprint != fp:
+            raise KeyReuseError(key)
+        return StoredResponse(row.status_code, row.response_body)
+
+    def record(
+        self,
+        db: Session,
+        user_id: int,
+        key: str,
+        fp: str,
+        status_code: int,
+        body: bytes,
+        now: Optional[float] = None,
+    ) -> None:
+        now = time.time() if now is None else now
+        db.add(
+            IdempotencyKey(
+                user_id=user_id,
+                key=key,
+                fingerprint=fp,
+                status_code=status_code,
+                response_body=body,
+                expires_at=int(now) + self.ttl,
+            )
+        )
+        # Flush now so a concurrent duplicate fails here, before commit.
+        db.flush()
+
+    def purge_expired(self, db: Session, now: Optional[float] = None) -> int:
+        """Delete expired records, committing every ``purge_batch`` rows."""
+        now = time.time() if now is None else now
+        removed = 0
+        while True:
+            expired = (
+                select(IdempotencyKey.id)
+                .where(IdempotencyKey.expires_at <= now)
+                .limit(self.purge_batch)
+                .scalar_subquery()
+            )
+            count = db.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.id.in_(expired))
+            ).rowcount
+            db.commit()
+            removed += count
+            if count < self.purge_batch:
+                return removed
+
+    def purge_due(self) -> bool:
+        """True at most once per ``purge_interval`` across threads."""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_purge:
+                return False
+            self._next_purge = now + self.purge_interval
+            return True
+
+
+idempotency_store = IdempotencyStore()
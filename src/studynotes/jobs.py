@@ -0,0 +1,363 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import Job
+
+logger = logging.getLogger("studynotes")
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_PROGRESS_SECONDS = float(os.getenv("JOB_PROGRESS_SECONDS", "0.5"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "300"))
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler at its next progress report once it should stop."""
+
+
+class UnknownJobKind(ValueError):
+    pass
+
+
+class JobContext:
+    """Handed to a running handler for progress reports and cancellation checks.
+
+    Progress is written at most every ``JOB_PROGRESS_SECONDS``; each write
+    also refreshes the heartbeat and reads the cancel flag, so a handler
+    that reports progress regularly is also cancellable.
+    """
+
+    def __init__(self, runner: "JobRunner", job_id: int) -> None:
+        self.runner = runner
+        self.job_id = job_id
+        self.done = 0
+        self.total: Optional[int] = None
+        self.message: Optional[str] = None
+        self._next_write = 0.0
+
+    def progress(
+        self, done: int, total: Optional[int] = None, message: Optional[str] = None
+    ) -> None:
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message[:255]
+        if time.monotonic() >= self._next_write:
+            self.check()
+
+    def check(self) -> None:
+        self._next_write = time.monotonic() + self.runner.progress_interval
+        db = self.runner.session_factory()
+        try:
+            db.execute(
+                update(Job)
+                .where(Job.id == self.job_id)
+                .values(
+                    done=self.done,
+                    total=self.total,
+                    message=self.message,
+                    heartbeat_at=int(time.time()),
+                )
+            )
+            db.commit()
+        finally:
+            db.close()
+        if self.runner.stopping or self.runner._cancel_requested(self.job_id):
+            raise JobCancelled()
+
+
+Handler = Callable[[JobContext, Dict[str, Any]], Optional[Dict[str, Any]]]
+_handlers: Dict[str, Handler] = {}
+
+
+def job_handler(kind: str) -> Callable[[Handler], Handler]:
+    """Register ``fn(ctx, params) -> result`` as the handler for ``kind``.
+
+    Jobs interrupted by a shutdown or a crashed process are queued again,
+    so handlers must be safe to run a second time over partly done work.
+    """
+
+    def register(fn: Handler) -> Handler:
+        _handlers[kind] = fn
+        return fn
+
+    return register
+
+
+def job_kinds() -> List[str]:
+    return sorted(_handlers)
+
+
+def as_dict(job: Job) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "params": json.loads(job.params),
+        "done": job.done,
+        "total": job.total,
+        "progress": min(1.0, job.done / job.total) if job.total else None,
+        "message": job.message,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "cancel_requested": job.cancel_requested,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class JobRunner:
+    """Runs queued jobs on a small pool of worker threads.
+
+    Jobs live in the ``jobs`` table, so the queue survives restarts and can
+    be shared by several server processes: a worker claims a job with a
+    conditional UPDATE (``status = 'queued'``), which only one claimer wins.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        workers: int = JOB_WORKERS,
+        poll_interval: float = JOB_POLL_SECONDS,
+        progress_interval: float = JOB_PROGRESS_SECONDS,
+        stale_after: float = JOB_STALE_SECONDS,
+        retention: float = JOB_RETENTION_DAYS * 86400,
+    ) -> None:
+        self.session_factory = session_factory
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+        self.stale_after = stale_after
+        self.retention = retention
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"[:64]
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._next_purge = 0.0
+        self._next_requeue = 0.0
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop.is_set()
+
+    def submit(
+        self,
+        db: Session,
+        kind: str,
+        params: Optional[Dict[str, Any]] = None,
+        user_id: Optional[int] = None,
+    ) -> Job:
+        if kind not in _handlers:
+            raise UnknownJobKind(kind)
+        job = Job(
+            kind=kind,
+            params=json.dumps(params or {}),
+            status=QUEUED,
+            user_id=user_id,
+            created_at=int(time.time()),
+        )
+        db.add(job)
+        db.commit()
+        self._wake.set()
+        return job
+
+    def cancel(self, db: Session, job_id: int) -> Optional[Job]:
+        """Cancel a queued job at once, or ask a running one to stop."""
+        job = db.get(Job, job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        if job.status == QUEUED:
+            db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == QUEUED)
+                .values(status=CANCELLED, cancel_requested=True, finished_at=int(time.time()))
+            )
+        db.execute(update(Job).where(Job.id == job_id).values(cancel_requested=True))
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def start(self) -> None:
+        if self.workers <= 0 or self._threads:
+            return
+        self.requeue_stale()
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"studynotes-job-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: Optional[float] = 10.0) -> None:
+        # Running handlers see JobCancelled at their next progress report and
+        # their jobs go back to the queue for the next start.
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def requeue_stale(self, now: Optional[float] = None) -> int:
+        """Put running jobs whose worker stopped heartbeating back in the queue."""
+        now = time.time() if now is None else now
+        db = self.session_factory()
+        try:
+            requeued = db.execute(
+                update(Job)
+                .where(Job.status == RUNNING, Job.heartbeat_at < int(now - self.stale_after))
+                .values(status=QUEUED, worker=None)
+            ).rowcount
+            db.commit()
+        finally:
+            db.close()
+        if requeued:
+            logger.warning("requeued %d interrupted job(s)", requeued)
+        return requeued
+
+    def purge_finished(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        db = self.session_factory()
+        try:
+            purged = db.execute(
+                delete(Job).where(
+                    Job.status.in_(FINISHED), Job.finished_at < int(now - self.retention)
+                )
+            ).rowcount
+            db.commit()
+        finally:
+            db.close()
+        return purged
+
+    def run_pending(self) -> bool:
+        """Claim and run the oldest queued job; False if there was none."""
+        job = self._claim()
+        if job is None:
+            return False
+        self._execute(job)
+        return True
+
+    def _claim(self) -> Optional[Job]:
+        db = self.session_factory()
+        try:
+            while True:
+                job = db.execute(
+                    select(Job).where(Job.status == QUEUED).order_by(Job.id).limit(1)
+                ).scalar_one_or_none()
+                if job is None:
+                    return None
+                now = int(time.time())
+                claimed = db.execute(
+                    update(Job)
+                    .where(Job.id == job.id, Job.status == QUEUED)
+                    .values(status=RUNNING, worker=self.worker_id, started_at=now, heartbeat_at=now)
+                ).rowcount
+                db.commit()
+                if claimed:
+                    db.refresh(job)
+                    db.expunge(job)
+                    return job
+        finally:
+            db.close()
+
+    def _heartbeat(self, job_id: int, finished: threading.Event) -> None:
+        # Keeps handlers that never report progress from looking stale.
+        while not finished.wait(self.stale_after / 3):
+            db = self.session_factory()
+            try:
+                db.execute(
+                    update(Job)
+                    .where(Job.id == job_id, Job.status == RUNNING)
+                    .values(heartbeat_at=int(time.time()))
+                )
+                db.commit()
+            except Exception:
+                logger.exception("job %s heartbeat failed", job_id)
+            finally:
+                db.close()
+
+    def _execute(self, job: Job) -> None:
+        ctx = JobContext(self, job.id)
+        ctx.done, ctx.total = job.done, job.total
+        values: Dict[str, Any] = {}
+        finished = threading.Event()
+        threading.Thread(
+            target=self._heartbeat,
+            args=(job.id, finished),
+            name="studynotes-job-heartbeat",
+            daemon=True,
+        ).start()
+        try:
+            handler = _handlers.get(job.kind)
+            if handler is None:
+                raise UnknownJobKind(job.kind)
+            result = handler(ctx, json.loads(job.params))
+            values = {"status": SUCCEEDED, "result": json.dumps(result) if result else None}
+            if ctx.total is not None:
+                ctx.done = ctx.total
+        except JobCancelled:
+            if self.stopping and not self._cancel_requested(job.id):
+                values = {"status": QUEUED, "worker": None}
+            else:
+                values = {"status": CANCELLED}
+        except Exception as exc:
+            logger.exception("job %s (%s) failed", job.id, job.kind)
+            values = {"status": FAILED, "error": f"{type(exc).__name__}: {exc}"}
+        finally:
+            finished.set()
+        if values["status"] != QUEUED:
+            values["finished_at"] = int(time.time())
+        db = self.session_factory()
+        try:
+            db.execute(
+                update(Job)
+                .where(Job.id == job.id)
+                .values(done=ctx.done, total=ctx.total, message=ctx.message, **values)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _cancel_requested(self, job_id: int) -> bool:
+        db = self.session_factory()
+        try:
+            return bool(db.execute(select(Job.cancel_requested).where(Job.id == job_id)).scalar())
+        finally:
+            db.close()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() >= self._next_requeue:
+                    # Jobs of a process that died mid-run go back to the queue.
+                    self._next_requeue = time.monotonic() + self.stale_after / 2
+                    self.requeue_stale()
+                if self.run_pending():
+                    continue
+                if time.monotonic() >= self._next_purge:
+                    self._next_purge = time.monotonic() + 3600
+                    self.purge_finished()
+            except Exception:
+                logger.exception("job worker error")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+
+job_runner = JobRunner()
@@ -1,42 +1,136 @@
+import heapq
+import json
 import logging
-from typing import Any, Dict, List, Optional
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    TypeVar,
+    Union,
+)
 from uuid import uuid4
 
-from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi import (
+    BackgroundTasks,
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+)
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, load_only, selectinload
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
-from .database import Base, engine, get_db
-from .models import Note, NoteTag, Tag, User
+from .archive import ARCHIVE_AFTER_DAYS, archive_store, touch_tracker
+from .backup import backup_runner
+from .batching import NOTE_WRITE_BATCHING, note_writer
+from .cache import note_cache
+from .coalesce import list_coalescer
+from .compression import CompressionMiddleware
+from .database import (
+    Base,
+    ReadSessionLocal,
+    SessionLocal,
+    add_missing_columns,
+    create_missing_indexes,
+    engine,
+    get_db,
+    get_read_db,
+)
+from .events import broker, parse_last_event_id, sse_stream
+from .idempotency import KeyReuseError, StoredResponse, fingerprint, idempotency_store
+from .jobs import FINISHED, JobContext, UnknownJobKind, as_dict, job_handler, job_runner
+from .models import Job, Note, NoteTag, Tag, User
+from .quotas import (
+    UNLIMITED,
+    Limits,
+    QuotaExceeded,
+    body_size,
+    charge,
+    limits_for,
+    usage_for,
+    usage_session,
+)
+from .revocation import revocation_list
 from .schemas import (
+    NOTE_FIELDS,
+    JobCreate,
+    JobOut,
     LoginIn,
     NoteCreate,
     NoteOut,
     NotePatch,
+    NoteSparseOut,
+    QuotaLimits,
+    QuotaOut,
     TagCreate,
     TagOut,
+    TagSuggestion,
     Token,
+    TokenRevoke,
     UserCreate,
     UserOut,
 )
 from .security import (
+    ARGON2_CALIBRATE,
+    DEFAULT_TTL_SECONDS,
     ProblemDetailsException,
+    calibrate_argon2,
+    configure_password_hashing,
     create_access_token,
+    decode_access_token,
     get_current_user,
     hash_password,
+    oauth2_scheme,
+    password_needs_rehash,
     require_admin,
     verify_password,
 )
+from .sharding import init_note_id_counter, shard_router
+from .tagindex import tag_index
 
 logger = logging.getLogger("studynotes")
 
+T = TypeVar("T")
 
-app = FastAPI(title="Study Notes API", version="1.0")
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    if ARGON2_CALIBRATE:
+        configure_password_hashing(calibrate_argon2())
+    tag_index.ensure_loaded(_tag_usage_rows)
+    job_runner.start()
+    yield
+    # Let open SSE streams finish so the server can shut down, and flush
+    # any queued group-commit writes. Unfinished jobs go back to the queue.
+    job_runner.stop()
+    broker.close()
+    note_writer.close()
+
+
+app = FastAPI(title="Study Notes API", version="1.0", lifespan=lifespan)
+app.add_middleware(CompressionMiddleware)
 
 Base.metadata.create_all(bind=engine)
+add_missing_columns(engine, Base.metadata.sorted_tables)
+create_missing_indexes(engine, Base.metadata.sorted_tables)
+init_note_id_counter(engine)
 
 
 def _code_by_status(status: int) -> str:
@@ -180,6 +274,38 @@ async def problem_details_exception_handler(
     )
 
 
+@app.exception_handler(KeyReuseError)
+async def key_reuse_exception_handler(request: Request, exc: KeyReuseError) -> JSONResponse:
+    cid = getattr(request.state, "correlation_id", str(uuid4()))
+    return problem_json_ext(
+        status=422,
+        title="Idempotency Key Reused",
+        detail="Idempotency-Key was already used for a different request",
+        instance=str(request.url),
+        correlation_id=cid,
+        code="IDEMPOTENCY_KEY_REUSED",
+    )
+
+
+@app.exception_handler(QuotaExceeded)
+async def quota_exceeded_exception_handler(request: Request, exc: QuotaExceeded) -> JSONResponse:
+    cid = getattr(request.state, "correlation_id", str(uuid4()))
+    return problem_json_ext(
+        status=409,
+        title="Quota Exceeded",
+        detail=f"This would exceed your {exc.resource} quota of {exc.limit}",
+        instance=str(request.url),
+        correlation_id=cid,
+        code="QUOTA_EXCEEDED",
+        details={
+            "resource": exc.resource,
+            "limit": exc.limit,
+            "used": exc.used,
+            "requested": exc.requested,
+        },
+    )
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -216,154 +342,918 @@ def login(payload: LoginIn, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.email == payload.email).first()
     if not user or not verify_password(payload.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Incorrect email or password")
+    if password_needs_rehash(user.hashed_password):
+        # The plaintext is only available here, so stale hashes are upgraded on login.
+        user.hashed_password = hash_password(payload.password)
+        db.commit()
     token = create_access_token(sub=user.email)
     return {"access_token": token}
 
 
+@app.post("/api/v1/auth/logout", status_code=204)
+def logout(
+    token: str = Depends(oauth2_scheme),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    claims = decode_access_token(token)
+    if not claims.get("jti"):
+        raise ProblemDetailsException(
+            400, "TOKEN_NOT_REVOCABLE", "Token has no jti claim", title="Bad Request"
+        )
+    revocation_list.revoke(db, claims["jti"], user.id, int(claims["exp"]))
+    return Response(status_code=204)
+
+
+def _notes_shard(request: Request, user: User) -> int:
+    index = shard_router.shard_for(user.id)
+    note_id = request.path_params.get("note_id")
+    if user.role == "admin" and note_id is not None and note_id.isdigit():
+        # Admins may address any note: find the shard that holds it.
+        located = shard_router.locate_note(int(note_id))
+        if located is not None:
+            index = located
+    return index
+
+
+def get_notes_db(
+    request: Request,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    if shard_router is None:
+        yield db
+        return
+    notes_db = shard_router.session(_notes_shard(request, user))
+    try:
+        yield notes_db
+    finally:
+        notes_db.close()
+
+
+def get_notes_read_db(
+    request: Request,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    if shard_router is None:
+        yield db
+        return
+    notes_db = shard_router.read_session(_notes_shard(request, user))
+    try:
+        yield notes_db
+    finally:
+        notes_db.close()
+
+
 @app.post("/api/v1/tags", response_model=TagOut)
-def create_tag(body: TagCreate, _: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_tag(
+    body: TagCreate,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    notes_db: Session = Depends(get_notes_db),
+):
     name = body.name.strip()
     tag = db.query(Tag).filter(Tag.name == name).first()
     if tag:
         return tag
-    tag = Tag(name=name)
-    db.add(tag)
-    db.commit()
-    db.refresh(tag)
+    # Created next to the user's notes, where their tag counter lives, and
+    # registered in the global catalogue when that is a different database.
+    tag = _ensure_tags(notes_db, [name], user.id, limits_for(user))[0]
+    notes_db.commit()
+    if notes_db is not db:
+        _sync_tag_catalogue([name])
+        tag = db.query(Tag).filter(Tag.name == name).one()
+    tag_index.add(tag.name)
     return tag
 
 
 @app.get("/api/v1/tags", response_model=List[TagOut])
 def list_tags(
     _: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0),
 ):
     return db.query(Tag).order_by(Tag.name).limit(limit).offset(offset).all()
 
 
-def _ensure_tags(db: Session, names: Optional[list[str]]):
+def _tag_usage_rows() -> list[tuple[str, int]]:
+    def usage(db: Session) -> list[tuple[str, int]]:
+        query = db.query(Tag.name, func.count(NoteTag.id)).outerjoin(NoteTag)
+        return [(name, count) for name, count in query.group_by(Tag.name)]
+
+    db = ReadSessionLocal()
+    try:
+        rows = usage(db)
+    finally:
+        db.close()
+    if shard_router is not None:
+        for part in shard_router.fan_out(usage):
+            rows.extend(part)
+    return rows
+
+
+@job_handler("tag_recount")
+def _tag_recount_job(ctx: JobContext, params: dict) -> dict:
+    rows = _tag_usage_rows()
+    tag_index.refresh(rows)
+    return {"tags": len({name for name, _ in rows})}
+
+
+@app.get("/api/v1/tags/suggest", response_model=List[TagSuggestion])
+def suggest_tags(
+    _: User = Depends(get_current_user),
+    prefix: str = Query(min_length=1, max_length=64),
+    limit: int = Query(10, ge=1, le=20),
+):
+    tag_index.ensure_loaded(_tag_usage_rows)
+    return [TagSuggestion(name=n, usage=u) for n, u in tag_index.suggest(prefix.strip(), limit)]
+
+
+_TAGS_BY_NAME = select(Tag).where(Tag.name.in_(bindparam("names", expanding=True)))
+
+
+def _ensure_tags(
+    db: Session,
+    names: Optional[list[str]],
+    owner_id: Optional[int] = None,
+    limits: Limits = UNLIMITED,
+):
     if not names:
         return []
-    tags = []
-    for raw in names:
-        name = raw.strip()
-        t = db.query(Tag).filter(Tag.name == name).first()
-        if not t:
-            t = Tag(name=name)
-            db.add(t)
-            db.flush()
-        tags.append(t)
-    return tags
+    names = [raw.strip() for raw in names]
+    # One IN lookup for every name instead of a query per tag.
+    found = {t.name: t for t in db.execute(_TAGS_BY_NAME, {"names": names}).scalars()}
+    missing = [name for name in dict.fromkeys(names) if name not in found]
+    if missing:
+        new = set(missing)
+        if owner_id is not None and shard_router is not None:
+            # A shard only copies names the global catalogue already has;
+            # the user is charged for names that are new everywhere.
+            new -= _catalogued(missing)
+        if owner_id is not None and new:
+            charge(db, owner_id, limits, tags=len(new))
+        for name in missing:
+            found[name] = Tag(name=name, created_by=owner_id if name in new else None)
+            db.add(found[name])
+        db.flush()
+    return [found[name] for name in names]
 
 
-@app.post("/api/v1/notes", response_model=NoteOut)
-def create_note(
-    body: NoteCreate, user: User = Depends(get_current_user), db: Session = Depends(get_db)
-):
-    note = Note(title=body.title, body=body.body, owner_id=user.id)
+def _catalogued(names: list[str]) -> set[str]:
+    db = SessionLocal()
+    try:
+        return {t.name for t in db.execute(_TAGS_BY_NAME, {"names": names}).scalars()}
+    finally:
+        db.close()
+
+
+def _sync_tag_catalogue(names: Optional[list[str]]) -> None:
+    # Shards keep their own tag rows for joins; list_tags still serves the
+    # global catalogue, so new names are registered there too.
+    if shard_router is None or not names:
+        return
+    # The note is already committed: a request registering the same name at
+    # the same time must not turn the saved write into an error.
+    rows = [{"name": name} for name in dict.fromkeys(raw.strip() for raw in names)]
+    db = SessionLocal()
+    try:
+        db.execute(sqlite_insert(Tag).on_conflict_do_nothing(index_elements=["name"]), rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _run_idempotent(
+    db: Session,
+    user_id: int,
+    key: Optional[str],
+    fp: str,
+    write: Callable[[Session], T],
+    status_code: int = 200,
+    submit: Optional[Callable[[Callable[[Session], Any]], Any]] = None,
+) -> Union[T, StoredResponse]:
+    """Run ``write`` and commit it together with its Idempotency-Key record.
+
+    Without a key this is just write + commit. With one, a live record for
+    the key short-circuits to the stored response, and a concurrent request
+    that committed the same key first is detected by the unique constraint.
+    """
+
+    def guarded(s: Session):
+        if key:
+            stored = idempotency_store.lookup(s, user_id, key, fp)
+            if stored is not None:
+                return stored
+        result = write(s)
+        if key:
+            body = result.model_dump_json().encode() if result is not None else b""
+            idempotency_store.record(s, user_id, key, fp, status_code, body)
+        return result
+
+    try:
+        if submit is not None:
+            return submit(guarded)
+        result = guarded(db)
+        db.commit()
+        return result
+    except IntegrityError:
+        if not key:
+            raise
+        db.rollback()
+        stored = idempotency_store.lookup(db, user_id, key, fp)
+        if stored is None:
+            raise
+        return stored
+
+
+def _replay(stored: StoredResponse) -> Response:
+    return Response(
+        content=stored.body,
+        status_code=stored.status_code,
+        media_type="application/json" if stored.body else None,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def _purge_idempotency_keys() -> int:
+    factories: list[Callable[[], Session]] = [SessionLocal]
+    if shard_router is not None:
+        factories += [partial(shard_router.session, i) for i in range(shard_router.count)]
+    removed = 0
+    for factory in factories:
+        db = factory()
+        try:
+            removed += idempotency_store.purge_expired(db)
+        finally:
+            db.close()
+    return removed
+
+
+def _schedule_idempotency_purge(key: Optional[str], background: BackgroundTasks) -> None:
+    if key and idempotency_store.purge_due():
+        background.add_task(_purge_idempotency_keys)
+
+
+def _insert_note(db: Session, owner_id: int, body: NoteCreate, limits: Limits) -> NoteOut:
+    charge(db, owner_id, limits, notes=1, body_bytes=body_size(body.body))
+    note = Note(title=body.title, body=body.body, owner_id=owner_id, touched_at=int(time.time()))
     db.add(note)
     db.flush()
-    for t in _ensure_tags(db, body.tags):
+    tags = _ensure_tags(db, body.tags, owner_id, limits)
+    for t in tags:
         db.add(NoteTag(note_id=note.id, tag_id=t.id))
-    db.commit()
-    db.refresh(note)
+    db.flush()
     return NoteOut(
         id=note.id,
         title=note.title,
         body=note.body,
-        owner_id=note.owner_id,
-        tags=[nt.tag.name for nt in note.tags],
+        owner_id=owner_id,
+        tags=[t.name for t in tags],
+    )
+
+
+@app.post("/api/v1/notes", response_model=NoteOut)
+def create_note(
+    request: Request,
+    body: NoteCreate,
+    background: BackgroundTasks,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_notes_db),
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255),
+):
+    owner_id = user.id
+    limits = limits_for(user)
+    submit = None
+    if NOTE_WRITE_BATCHING:
+        submit = (shard_router.writer_for(owner_id) if shard_router else note_writer).submit
+    out = _run_idempotent(
+        db,
+        owner_id,
+        idempotency_key,
+        fingerprint(request.method, request.url.path, body.model_dump_json().encode()),
+        lambda s: _insert_note(s, owner_id, body, limits),
+        submit=submit,
+    )
+    if isinstance(out, StoredResponse):
+        return _replay(out)
+    _schedule_idempotency_purge(idempotency_key, background)
+    _sync_tag_catalogue(body.tags)
+    for name in out.tags:
+        tag_index.add(name, 1)
+    _forget_lists(out.owner_id)
+    broker.publish(out.owner_id, "note.created", out.model_dump())
+    return out
+
+
+@app.get("/api/v1/notes/events")
+async def note_events(
+    request: Request,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    last_event_id: Optional[str] = Header(None),
+):
+    owner_id = user.id
+    # The stream may stay open for hours; don't pin a pooled connection to it.
+    db.close()
+    return StreamingResponse(
+        sse_stream(broker, owner_id, parse_last_event_id(last_event_id), request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
 @app.get("/api/v1/notes/{note_id}", response_model=NoteOut)
-def get_note(note_id: int, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    note = db.get(Note, note_id)
-    if not note or (note.owner_id != user.id and user.role != "admin"):
+def get_note(
+    note_id: int,
+    background: BackgroundTasks,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_notes_read_db),
+):
+    cached = note_cache.get(note_id)
+    if cached is None:
+        version = note_cache.version(note_id)
+        note = db.get(Note, note_id)
+        if note:
+            out = NoteOut(
+                id=note.id,
+                title=note.title,
+                body=note.body,
+                owner_id=note.owner_id,
+                tags=[nt.tag.name for nt in note.tags],
+            )
+        else:
+            record = archive_store.get(db, note_id)
+            if record is None:
+                raise HTTPException(status_code=404, detail="Note not found")
+            out = NoteOut(**record)
+        cached = note_cache.put(note_id, version, out.owner_id, out.model_dump_json().encode())
+    # Authorization is checked on every request, cached or not.
+    if cached.owner_id != user.id and user.role != "admin":
         raise HTTPException(status_code=404, detail="Note not found")
-    return NoteOut(
-        id=note.id,
-        title=note.title,
-        body=note.body,
-        owner_id=note.owner_id,
-        tags=[nt.tag.name for nt in note.tags],
-    )
+    touch_tracker.touch(note_id)
+    if touch_tracker.flush_due():
+        background.add_task(touch_tracker.flush)
+    return Response(content=cached.payload, media_type="application/json")
+
+
+def _parse_fields(raw: Optional[str]) -> set[str]:
+    if raw is None:
+        return set(NOTE_FIELDS)
+    wanted = {f.strip() for f in raw.split(",") if f.strip()}
+    unknown = sorted(wanted - set(NOTE_FIELDS))
+    if unknown or not wanted:
+        raise ProblemDetailsException(
+            422,
+            "VALIDATION_ERROR",
+            "Invalid fields parameter",
+            title="Validation Error",
+            details={"unknown": unknown, "allowed": list(NOTE_FIELDS)},
+        )
+    return wanted
+
+
+@dataclass(frozen=True)
+class NoteFilter:
+    tags: tuple[str, ...] = ()
+    match: str = "all"
+    exclude: tuple[str, ...] = ()
+    q: Optional[str] = None
 
+    def matches(self, title: str, body: str, tags: list[str]) -> bool:
+        # In-memory twin of _plan_note_filter, for archived notes.
+        names = set(tags)
+        if self.tags:
+            wanted = set(self.tags)
+            if not (wanted <= names if self.match == "all" else wanted & names):
+                return False
+        if names & set(self.exclude):
+            return False
+        if self.q:
+            q = self.q.casefold()
+            return q in title.casefold() or q in body.casefold()
+        return True
 
-@app.get("/api/v1/notes", response_model=List[NoteOut])
+
+@app.get(
+    "/api/v1/notes",
+    response_model=List[NoteSparseOut],
+    response_model_exclude_unset=True,
+)
 def list_notes(
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    tag: Optional[str] = None,
+    db: Session = Depends(get_notes_read_db),
+    tag: Optional[List[str]] = Query(None, max_length=20),
+    match: Literal["all", "any"] = "all",
+    exclude_tag: Optional[List[str]] = Query(None, max_length=20),
     q: Optional[str] = None,
+    fields: Optional[str] = Query(None, max_length=100),
+    excerpt: Optional[int] = Query(None, ge=1, le=1000),
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    include_archived: bool = False,
 ):
-    query = db.query(Note).filter((Note.owner_id == user.id) | (user.role == "admin"))
-    if tag:
-        query = query.join(NoteTag).join(Tag).filter(Tag.name == tag)
-    if q:
-        like = f"%{q}%"
-        query = query.filter((Note.title.like(like)) | (Note.body.like(like)))
-    items = query.order_by(Note.id.desc()).limit(limit).offset(offset).all()
-    out = []
-    for n in items:
-        out.append(
-            NoteOut(
-                id=n.id,
-                title=n.title,
-                body=n.body,
-                owner_id=n.owner_id,
-                tags=[nt.tag.name for nt in n.tags],
+    wanted = _parse_fields(fields)
+    filt = NoteFilter(
+        tags=tuple(sorted({t.strip() for t in tag or () if t.strip()})),
+        match=match,
+        exclude=tuple(sorted({t.strip() for t in exclude_tag or () if t.strip()})),
+        q=q or None,
+    )
+    # Identical concurrent requests share one query and one serialization.
+    key = (
+        _list_scope(user),
+        filt,
+        tuple(sorted(wanted)),
+        excerpt,
+        limit,
+        offset,
+        include_archived,
+    )
+    payload = list_coalescer.do(
+        key,
+        lambda: _list_notes_payload(
+            db, user, wanted, filt, excerpt, limit, offset, include_archived
+        ),
+    )
+    return Response(content=payload, media_type="application/json")
+
+
+# Admins list every user's notes, so their results share one scope that
+# every write forgets along with the owner's.
+_ADMIN_LISTS = "admin"
+
+
+def _list_scope(user: User) -> Union[int, str]:
+    return _ADMIN_LISTS if user.role == "admin" else user.id
+
+
+def _forget_lists(owner_id: int) -> None:
+    list_coalescer.forget(owner_id)
+    list_coalescer.forget(_ADMIN_LISTS)
+
+
+# Tags linked to at most this many notes are cheaper to expand into an id
+# list; more common ones are checked per candidate note with EXISTS so the
+# id-ordered scan stops as soon as the page is full.
+SELECTIVE_TAG_USAGE = 1000
+LIST_STATEMENT_CACHE_SIZE = 512
+
+
+def _has_tags(tag_ids):
+    return (
+        select(NoteTag.id).where(NoteTag.note_id == Note.id, NoteTag.tag_id.in_(tag_ids)).exists()
+    )
+
+
+_TAG_IDS_BY_NAME = select(Tag.name, Tag.id).where(Tag.name.in_(bindparam("names", expanding=True)))
+
+
+@dataclass(frozen=True)
+class _ListShape:
+    """Everything that changes the SQL of a note list query, but no values."""
+
+    columns: tuple[str, ...]
+    excerpt: bool
+    tags: bool
+    admin: bool
+    # One predicate per entry, over the id list bound as tags_<i>: "in"
+    # expands the tag's notes into an id list, "exists" probes per note.
+    tag_plan: tuple[str, ...] = ()
+    exclude: bool = False
+    search: bool = False
+
+
+def _plan_note_filter(
+    db: Session, filt: NoteFilter
+) -> Optional[tuple[tuple[str, ...], bool, Dict[str, Any]]]:
+    """Pick the tag predicates for ``filt``; None when nothing can match."""
+    plan: list[str] = []
+    params: Dict[str, Any] = {}
+    if filt.tags or filt.exclude:
+        tag_index.ensure_loaded(_tag_usage_rows)
+        names = sorted(set(filt.tags) | set(filt.exclude))
+        ids = dict(db.execute(_TAG_IDS_BY_NAME, {"names": names}).all())
+    if filt.tags:
+        found = sorted((tag_index.usage(n) or 0, ids[n]) for n in filt.tags if n in ids)
+        if not found or (filt.match == "all" and len(found) < len(filt.tags)):
+            return None
+        if filt.match == "any":
+            selective = sum(usage for usage, _ in found) <= SELECTIVE_TAG_USAGE
+            plan.append("in" if selective else "exists")
+            params["tags_0"] = [tag_id for _, tag_id in found]
+        else:
+            # Drive from the rarest tag when it is selective, then require
+            # the others with index-only EXISTS probes on (note_id, tag_id).
+            for i, (usage, tag_id) in enumerate(found):
+                selective = i == 0 and usage <= SELECTIVE_TAG_USAGE
+                plan.append("in" if selective else "exists")
+                params[f"tags_{i}"] = [tag_id]
+    excluded_ids = [ids[n] for n in filt.exclude if n in ids]
+    if excluded_ids:
+        params["exclude"] = excluded_ids
+    if filt.q:
+        params["like"] = f"%{filt.q}%"
+    return tuple(plan), bool(excluded_ids), params
+
+
+@lru_cache(maxsize=LIST_STATEMENT_CACHE_SIZE)
+def _list_statement(shape: _ListShape):
+    # Built once per shape and reused, so repeated requests skip statement
+    # construction and cache-key generation and hit the compiled cache.
+    columns = [Note.id] + [getattr(Note, c) for c in shape.columns]
+    stmt = select(Note).options(load_only(*columns))
+    if shape.excerpt:
+        stmt = stmt.add_columns(func.substr(Note.body, 1, bindparam("excerpt")))
+    if shape.tags:
+        stmt = stmt.options(selectinload(Note.tags).selectinload(NoteTag.tag))
+    if not shape.admin:
+        stmt = stmt.where(Note.owner_id == bindparam("owner_id"))
+    for i, kind in enumerate(shape.tag_plan):
+        tag_ids = bindparam(f"tags_{i}", expanding=True)
+        if kind == "in":
+            stmt = stmt.where(
+                Note.id.in_(select(NoteTag.note_id).where(NoteTag.tag_id.in_(tag_ids)))
+            )
+        else:
+            stmt = stmt.where(_has_tags(tag_ids))
+    if shape.exclude:
+        stmt = stmt.where(~_has_tags(bindparam("exclude", expanding=True)))
+    if shape.search:
+        like = bindparam("like")
+        stmt = stmt.where(Note.title.like(like) | Note.body.like(like))
+    return stmt.order_by(Note.id.desc()).limit(bindparam("limit")).offset(bindparam("offset"))
+
+
+def _list_notes_payload(
+    db: Session,
+    user: User,
+    wanted: set[str],
+    filt: NoteFilter,
+    excerpt: Optional[int],
+    limit: int,
+    offset: int,
+    include_archived: bool = False,
+) -> bytes:
+    if shard_router is not None and user.role == "admin":
+        # Admins list every shard: each returns its first offset+limit rows
+        # in parallel and the pages are merged by id.
+        parts = shard_router.fan_out(
+            lambda s: _note_rows(
+                s, user, wanted, filt, excerpt, limit + offset, 0, include_archived
             )
         )
+        merged = heapq.merge(*parts, key=lambda r: r[0], reverse=True)
+        rows = list(islice(merged, offset, offset + limit))
+    else:
+        rows = _note_rows(db, user, wanted, filt, excerpt, limit, offset, include_archived)
+    out = [item for _, item in rows]
+    return json.dumps(out, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _note_rows(
+    db: Session,
+    user: User,
+    wanted: set[str],
+    filt: NoteFilter,
+    excerpt: Optional[int],
+    limit: int,
+    offset: int,
+    include_archived: bool,
+) -> list[tuple[int, Dict[str, Any]]]:
+    if not include_archived:
+        return _list_note_rows(db, user, wanted, filt, excerpt, limit, offset)
+    live = _list_note_rows(db, user, wanted, filt, excerpt, limit + offset, 0)
+    archived = _archived_note_rows(db, user, wanted, filt, excerpt)
+    merged = heapq.merge(live, archived, key=lambda r: r[0], reverse=True)
+    return list(islice(merged, offset, offset + limit))
+
+
+def _archived_note_rows(
+    db: Session, user: User, wanted: set[str], filt: NoteFilter, excerpt: Optional[int]
+) -> Iterator[tuple[int, Dict[str, Any]]]:
+    # Archived records are decoded lazily, so a page only reads as many as
+    # the merge with the live rows actually consumes.
+    owner_id = None if user.role == "admin" else user.id
+    for record in archive_store.scan(db, owner_id):
+        if not filt.matches(record["title"], record["body"], record["tags"]):
+            continue
+        item = {f: record[f] for f in NOTE_FIELDS if f in wanted}
+        if "body" in item and excerpt is not None:
+            item["body"] = item["body"][:excerpt]
+        yield record["id"], item
+
+
+def _list_note_rows(
+    db: Session,
+    user: User,
+    wanted: set[str],
+    filt: NoteFilter,
+    excerpt: Optional[int],
+    limit: int,
+    offset: int,
+) -> list[tuple[int, Dict[str, Any]]]:
+    # Only load the columns the client asked for; the body column lives in
+    # overflow pages for long notes and is never read unless selected.
+    planned = _plan_note_filter(db, filt)
+    if planned is None:
+        return []
+    tag_plan, exclude, params = planned
+    with_body = "body" in wanted
+    shape = _ListShape(
+        columns=tuple(c for c in ("title", "owner_id") if c in wanted)
+        + (("body",) if with_body and excerpt is None else ()),
+        excerpt=with_body and excerpt is not None,
+        tags="tags" in wanted,
+        admin=user.role == "admin",
+        tag_plan=tag_plan,
+        exclude=exclude,
+        search="like" in params,
+    )
+    params.update(owner_id=user.id, excerpt=excerpt, limit=limit, offset=offset)
+    result = db.execute(_list_statement(shape), params)
+    rows = result.all() if shape.excerpt else result.scalars().all()
+    out = []
+    for row in rows:
+        n, body = row if shape.excerpt else (row, None)
+        item: Dict[str, Any] = {}
+        if "id" in wanted:
+            item["id"] = n.id
+        if "title" in wanted:
+            item["title"] = n.title
+        if with_body:
+            item["body"] = n.body if excerpt is None else body
+        if "owner_id" in wanted:
+            item["owner_id"] = n.owner_id
+        if "tags" in wanted:
+            item["tags"] = [nt.tag.name for nt in n.tags]
+        out.append((n.id, item))
     return out
 
 
+def _live_note(s: Session, note_id: int, restored: list[str]) -> Optional[Note]:
+    # Writes to an archived note bring it back first; its tags are collected
+    # so the caller can count them as used again once the write commits.
+    note = s.get(Note, note_id)
+    if note is None:
+        note = archive_store.restore(s, note_id)
+        if note is not None:
+            restored.extend(nt.tag.name for nt in note.tags)
+    return note
+
+
 @app.patch("/api/v1/notes/{note_id}", response_model=NoteOut)
 def patch_note(
+    request: Request,
     note_id: int,
     body: NotePatch,
+    background: BackgroundTasks,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_notes_db),
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255),
 ):
-    note = db.get(Note, note_id)
-    if not note or (note.owner_id != user.id and user.role != "admin"):
-        raise HTTPException(status_code=404, detail="Note not found")
-    if body.title is not None:
-        note.title = body.title
-    if body.body is not None:
-        note.body = body.body
+    old_tags: list[str] = []
+    restored: list[str] = []
+    limits = limits_for(user)
+
+    def write(s: Session) -> NoteOut:
+        note = _live_note(s, note_id, restored)
+        if not note or (note.owner_id != user.id and user.role != "admin"):
+            raise HTTPException(status_code=404, detail="Note not found")
+        if body.title is not None:
+            note.title = body.title
+        if body.body is not None:
+            charge(s, note.owner_id, limits, body_bytes=body_size(body.body) - body_size(note.body))
+            note.body = body.body
+        note.touched_at = int(time.time())
+        if body.tags is not None:
+            for nt in list(note.tags):
+                old_tags.append(nt.tag.name)
+                s.delete(nt)
+            for t in _ensure_tags(s, body.tags, note.owner_id, limits):
+                s.add(NoteTag(note_id=note.id, tag_id=t.id))
+        s.flush()
+        s.refresh(note)
+        return NoteOut(
+            id=note.id,
+            title=note.title,
+            body=note.body,
+            owner_id=note.owner_id,
+            tags=[nt.tag.name for nt in note.tags],
+        )
+
+    fp = fingerprint(request.method, request.url.path, body.model_dump_json().encode())
+    out = _run_idempotent(db, user.id, idempotency_key, fp, write)
+    if isinstance(out, StoredResponse):
+        return _replay(out)
+    _schedule_idempotency_purge(idempotency_key, background)
+    _sync_tag_catalogue(body.tags)
+    for name in restored:
+        tag_index.add(name, 1)
     if body.tags is not None:
-        for nt in list(note.tags):
-            db.delete(nt)
-        for t in _ensure_tags(db, body.tags):
-            db.add(NoteTag(note_id=note.id, tag_id=t.id))
-    db.commit()
-    db.refresh(note)
-    return NoteOut(
-        id=note.id,
-        title=note.title,
-        body=note.body,
-        owner_id=note.owner_id,
-        tags=[nt.tag.name for nt in note.tags],
-    )
+        for name in old_tags:
+            tag_index.add(name, -1)
+        for name in body.tags:
+            tag_index.add(name.strip(), 1)
+    note_cache.invalidate(note_id)
+    _forget_lists(out.owner_id)
+    broker.publish(out.owner_id, "note.updated", out.model_dump())
+    return out
 
 
 @app.delete("/api/v1/notes/{note_id}", status_code=204)
 def delete_note(
-    note_id: int, user: User = Depends(get_current_user), db: Session = Depends(get_db)
+    request: Request,
+    note_id: int,
+    background: BackgroundTasks,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_notes_db),
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255),
 ):
-    note = db.get(Note, note_id)
-    if not note or (note.owner_id != user.id and user.role != "admin"):
-        raise HTTPException(status_code=404, detail="Note not found")
-    db.delete(note)
-    db.commit()
+    deleted: dict[str, Any] = {}
+    restored: list[str] = []
+
+    def write(s: Session) -> None:
+        note = _live_note(s, note_id, restored)
+        if not note or (note.owner_id != user.id and user.role != "admin"):
+            raise HTTPException(status_code=404, detail="Note not found")
+        deleted["owner_id"] = note.owner_id
+        deleted["tags"] = [nt.tag.name for nt in note.tags]
+        charge(s, note.owner_id, notes=-1, body_bytes=-body_size(note.body))
+        s.delete(note)
+
+    fp = fingerprint(request.method, request.url.path)
+    stored = _run_idempotent(db, user.id, idempotency_key, fp, write, status_code=204)
+    if isinstance(stored, StoredResponse):
+        return _replay(stored)
+    _schedule_idempotency_purge(idempotency_key, background)
+    owner_id, tag_names = deleted["owner_id"], deleted["tags"]
+    for name in restored:
+        tag_index.add(name, 1)
+    for name in tag_names:
+        tag_index.add(name, -1)
+    note_cache.invalidate(note_id)
+    _forget_lists(owner_id)
+    broker.publish(owner_id, "note.deleted", {"id": note_id})
     return JSONResponse(status_code=204, content=None)
 
 
 @app.get("/api/v1/admin/users", response_model=list[UserOut])
-def adm_list_users(_: User = Depends(require_admin), db: Session = Depends(get_db)):
+def adm_list_users(_: User = Depends(require_admin), db: Session = Depends(get_read_db)):
     return db.query(User).all()
+
+
+@app.get("/api/v1/admin/cache/notes")
+def adm_note_cache_stats(_: User = Depends(require_admin)):
+    return note_cache.stats()
+
+
+@app.get("/api/v1/admin/coalescing/notes")
+def adm_list_coalescing_stats(_: User = Depends(require_admin)):
+    return list_coalescer.stats()
+
+
+@app.post("/api/v1/admin/backups", status_code=202)
+def adm_start_backup(
+    background: BackgroundTasks,
+    _: User = Depends(require_admin),
+    compress: bool = False,
+):
+    if not backup_runner.try_start():
+        raise ProblemDetailsException(
+            409, "BACKUP_IN_PROGRESS", "A backup is already running", title="Conflict"
+        )
+    background.add_task(backup_runner.run, compress=compress)
+    return {"status": "started"}
+
+
+@app.get("/api/v1/admin/backups")
+def adm_backup_status(_: User = Depends(require_admin)):
+    return backup_runner.status()
+
+
+@app.post("/api/v1/admin/revocations", status_code=204)
+def adm_revoke_token(
+    body: TokenRevoke, _: User = Depends(require_admin), db: Session = Depends(get_db)
+):
+    # The token itself is not at hand, so keep the entry for the longest token lifetime.
+    expires_at = int(time.time()) + DEFAULT_TTL_SECONDS
+    revocation_list.revoke(db, body.jti, None, expires_at)
+    return Response(status_code=204)
+
+
+@app.get("/api/v1/admin/revocations")
+def adm_revocation_stats(_: User = Depends(require_admin)):
+    return revocation_list.stats()
+
+
+@app.post("/api/v1/admin/archive", response_model=JobOut, status_code=202)
+def adm_archive_notes(
+    user: User = Depends(require_admin),
+    db: Session = Depends(get_db),
+    older_than_days: float = Query(ARCHIVE_AFTER_DAYS, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+):
+    params = {"older_than_days": older_than_days, "limit": limit}
+    return as_dict(job_runner.submit(db, "archive", params, user_id=user.id))
+
+
+def _get_job(db: Session, job_id: int) -> Job:
+    job = db.get(Job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/api/v1/admin/jobs", response_model=JobOut, status_code=202)
+def adm_submit_job(
+    body: JobCreate, user: User = Depends(require_admin), db: Session = Depends(get_db)
+):
+    try:
+        job = job_runner.submit(db, body.kind, body.params, user_id=user.id)
+    except UnknownJobKind:
+        raise ProblemDetailsException(
+            422, "UNKNOWN_JOB_KIND", f"Unknown job kind: {body.kind}", title="Unprocessable Entity"
+        )
+    return as_dict(job)
+
+
+@app.get("/api/v1/admin/jobs", response_model=List[JobOut])
+def adm_list_jobs(
+    _: User = Depends(require_admin),
+    db: Session = Depends(get_read_db),
+    status: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    query = select(Job).order_by(Job.id.desc()).limit(limit)
+    if status is not None:
+        query = query.where(Job.status == status)
+    return [as_dict(job) for job in db.execute(query).scalars()]
+
+
+@app.get("/api/v1/admin/jobs/{job_id}", response_model=JobOut)
+def adm_get_job(job_id: int, _: User = Depends(require_admin), db: Session = Depends(get_read_db)):
+    return as_dict(_get_job(db, job_id))
+
+
+@app.post("/api/v1/admin/jobs/{job_id}/cancel", response_model=JobOut, status_code=202)
+def adm_cancel_job(job_id: int, _: User = Depends(require_admin), db: Session = Depends(get_db)):
+    job = _get_job(db, job_id)
+    if job.status in FINISHED:
+        raise ProblemDetailsException(
+            409, "JOB_FINISHED", f"Job is already {job.status}", title="Conflict"
+        )
+    return as_dict(job_runner.cancel(db, job_id))
+
+
+def _quota_out(user: User) -> QuotaOut:
+    db = usage_session(user.id)
+    try:
+        used = usage_for(db, user.id)
+    finally:
+        db.close()
+    limits = limits_for(user)
+    return QuotaOut(
+        user_id=user.id,
+        **used,
+        max_notes=limits.notes,
+        max_body_bytes=limits.body_bytes,
+        max_tags=limits.tags,
+    )
+
+
+def _get_user(db: Session, user_id: int) -> User:
+    user = db.get(User, user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+
+@app.get("/api/v1/admin/quotas/{user_id}", response_model=QuotaOut)
+def adm_get_quota(user_id: int, _: User = Depends(require_admin), db: Session = Depends(get_db)):
+    return _quota_out(_get_user(db, user_id))
+
+
+@app.patch("/api/v1/admin/quotas/{user_id}", response_model=QuotaOut)
+def adm_set_quota(
+    user_id: int,
+    body: QuotaLimits,
+    _: User = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    user = _get_user(db, user_id)
+    # null resets a limit to the server default; fields left out are unchanged.
+    for field in body.model_fields_set:
+        setattr(user, field, getattr(body, field))
+    db.commit()
+    return _quota_out(user)
+
+
+@app.post("/api/v1/admin/quotas/reconcile", response_model=JobOut, status_code=202)
+def adm_reconcile_quotas(
+    user: User = Depends(require_admin),
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Query(None, ge=1),
+):
+    return as_dict(job_runner.submit(db, "quota_reconcile", {"user_id": user_id}, user_id=user.id))
@@ -1,4 +1,15 @@
-from sqlalchemy import ForeignKey, Integer, String, Text, UniqueConstraint
+from typing import Optional
+
+from sqlalchemy import (
+    Boolean,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+    UniqueConstraint,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .database import Base
@@ -10,6 +21,10 @@ class User(Base):
     email: Mapped[str] = mapped_column(String(255), unique=True, index=True, nullable=False)
     hashed_password: Mapped[str] = mapped_column(String(255), nullable=False)
     role: Mapped[str] = mapped_column(String(32), default="user")
+    # Per-user quota overrides; NULL falls back to the QUOTA_MAX_* defaults, 0 is unlimited.
+    max_notes: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    max_body_bytes: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    max_tags: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
 
     notes = relationship("Note", back_populates="owner", cascade="all, delete-orphan")
 
@@ -20,6 +35,8 @@ class Note(Base):
     title: Mapped[str] = mapped_column(String(255), index=True)
     body: Mapped[str] = mapped_column(Text)
     owner_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    # Unix time of the last read or write; NULL until first seen by the archiver.
+    touched_at: Mapped[Optional[int]] = mapped_column(Integer, index=True, nullable=True)
 
     owner = relationship("User", back_populates="notes")
     tags = relationship("NoteTag", back_populates="note", cascade="all, delete-orphan")
@@ -29,16 +46,91 @@ class Tag(Base):
     __tablename__ = "tags"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    # User whose write introduced the tag; counted against their tag quota.
+    created_by: Mapped[Optional[int]] = mapped_column(Integer, index=True, nullable=True)
 
     notes = relationship("NoteTag", back_populates="tag", cascade="all, delete-orphan")
 
 
 class NoteTag(Base):
     __tablename__ = "note_tags"
-    __table_args__ = (UniqueConstraint("note_id", "tag_id", name="uix_note_tag"),)
+    __table_args__ = (
+        UniqueConstraint("note_id", "tag_id", name="uix_note_tag"),
+        # Covering index for tag filters: tag -> note ids without row lookups.
+        Index("ix_note_tags_tag_note", "tag_id", "note_id"),
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     note_id: Mapped[int] = mapped_column(ForeignKey("notes.id"), index=True)
     tag_id: Mapped[int] = mapped_column(ForeignKey("tags.id"), index=True)
 
     note = relationship("Note", back_populates="tags")
     tag = relationship("Tag", back_populates="notes")
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uix_idempotency_user_key"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    key: Mapped[str] = mapped_column(String(255), nullable=False)
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    status_code: Mapped[int] = mapped_column(Integer, nullable=False)
+    response_body: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    expires_at: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+    # AUTOINCREMENT: ids never go back even after expired rows are deleted,
+    # which incremental refreshes (id > last seen) rely on.
+    __table_args__ = {"sqlite_autoincrement": True}
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    jti: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
+    user_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    expires_at: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
+
+
+class ArchivedNote(Base):
+    """Stub left behind for a note moved to an archive segment file."""
+
+    __tablename__ = "archived_notes"
+    note_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    owner_id: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
+    segment: Mapped[str] = mapped_column(String(255), nullable=False)
+    offset: Mapped[int] = mapped_column(Integer, nullable=False)
+    length: Mapped[int] = mapped_column(Integer, nullable=False)
+    archived_at: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class Job(Base):
+    """Background job run by the worker pool in ``studynotes.jobs``."""
+
+    __tablename__ = "jobs"
+    # AUTOINCREMENT: ids of purged jobs are never handed out again.
+    __table_args__ = (Index("ix_jobs_status_id", "status", "id"), {"sqlite_autoincrement": True})
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(64), nullable=False)
+    params: Mapped[str] = mapped_column(Text, nullable=False, default="{}")
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    done: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    message: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    result: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    cancel_requested: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    user_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    worker: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    created_at: Mapped[int] = mapped_column(Integer, nullable=False)
+    started_at: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    finished_at: Mapped[Optional[int]] = mapped_column(Integer, index=True, nullable=True)
+    heartbeat_at: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
+
+class UserUsage(Base):
+    """Running totals for quota checks, kept in the database that holds the user's notes."""
+
+    __tablename__ = "user_usage"
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    notes: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    body_bytes: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    tags: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
@@ -0,0 +1,241 @@
+import os
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import (
+    Integer,
+    LargeBinary,
+    bindparam,
+    cast,
+    delete,
+    func,
+    or_,
+    select,
+    union,
+    update,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .archive import archive_store
+from .database import SessionLocal
+from .jobs import JobContext, job_handler
+from .models import ArchivedNote, Note, Tag, User, UserUsage
+from .sharding import shard_router
+
+QUOTA_MAX_NOTES = int(os.getenv("QUOTA_MAX_NOTES", "10000"))
+QUOTA_MAX_BODY_BYTES = int(os.getenv("QUOTA_MAX_BODY_BYTES", str(64 * 1024 * 1024)))
+QUOTA_MAX_TAGS = int(os.getenv("QUOTA_MAX_TAGS", "1000"))
+QUOTA_RECONCILE_BATCH = int(os.getenv("QUOTA_RECONCILE_BATCH", "500"))
+
+RESOURCES = ("notes", "body_bytes", "tags")
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, resource: str, limit: int, used: int, requested: int) -> None:
+        super().__init__(f"{resource} quota of {limit} exceeded")
+        self.resource = resource
+        self.limit = limit
+        self.used = used
+        self.requested = requested
+
+
+@dataclass(frozen=True)
+class Limits:
+    """Effective limits for one user; None means unlimited."""
+
+    notes: Optional[int] = None
+    body_bytes: Optional[int] = None
+    tags: Optional[int] = None
+
+
+UNLIMITED = Limits()
+
+
+def limits_for(user: User) -> Limits:
+    # Read in the request thread: the write itself may run on the group-commit writer.
+    if user.role == "admin":
+        return UNLIMITED
+
+    def pick(override: Optional[int], default: int) -> Optional[int]:
+        value = default if override is None else override
+        return value or None
+
+    return Limits(
+        notes=pick(user.max_notes, QUOTA_MAX_NOTES),
+        body_bytes=pick(user.max_body_bytes, QUOTA_MAX_BODY_BYTES),
+        tags=pick(user.max_tags, QUOTA_MAX_TAGS),
+    )
+
+
+def body_size(body: str) -> int:
+    return len(body.encode())
+
+
+_usage = UserUsage.__table__
+
+
+def _within(column, resource: str):
+    delta = bindparam(f"d_{resource}", type_=Integer)
+    limit = bindparam(f"max_{resource}", type_=Integer)
+    return or_(delta <= 0, limit.is_(None), column + delta <= limit)
+
+
+# One conditional UPDATE both checks and bumps the counters, so two writers
+# racing for the last slot cannot both win. Shrinking never fails, which
+# keeps deletes and edits possible for users above a lowered limit.
+_CHARGE = (
+    update(_usage)
+    .where(
+        _usage.c.user_id == bindparam("uid"),
+        *(_within(_usage.c[r], r) for r in RESOURCES),
+    )
+    .values({r: _usage.c[r] + bindparam(f"d_{r}", type_=Integer) for r in RESOURCES})
+)
+_USAGE = select(_usage.c.notes, _usage.c.body_bytes, _usage.c.tags).where(
+    _usage.c.user_id == bindparam("uid")
+)
+
+
+def charge(
+    db: Session,
+    user_id: int,
+    limits: Limits = UNLIMITED,
+    notes: int = 0,
+    body_bytes: int = 0,
+    tags: int = 0,
+) -> None:
+    """Add to a user's counters in ``db``'s transaction, or raise QuotaExceeded.
+
+    Negative amounts release usage. Users without a counter row yet (data
+    written before quotas existed) are measured once and seeded.
+    """
+    deltas = {"notes": notes, "body_bytes": body_bytes, "tags": tags}
+    if not any(deltas.values()):
+        return
+    params: Dict[str, Any] = {"uid": user_id}
+    for r in RESOURCES:
+        params[f"d_{r}"] = deltas[r]
+        params[f"max_{r}"] = getattr(limits, r)
+    if db.execute(_CHARGE, params).rowcount:
+        return
+    row = db.execute(_USAGE, {"uid": user_id}).first()
+    if row is None:
+        db.execute(
+            sqlite_insert(_usage)
+            .values(user_id=user_id, **measure(db, [user_id]).get(user_id, _zero()))
+            .on_conflict_do_nothing()
+        )
+        if db.execute(_CHARGE, params).rowcount:
+            return
+        row = db.execute(_USAGE, {"uid": user_id}).first()
+    used = row._asdict()
+    for r in RESOURCES:
+        limit = getattr(limits, r)
+        if deltas[r] > 0 and limit is not None and used[r] + deltas[r] > limit:
+            raise QuotaExceeded(r, limit, used[r], deltas[r])
+    raise RuntimeError(f"usage counters for user {user_id} could not be updated")
+
+
+def _zero() -> Dict[str, int]:
+    return dict.fromkeys(RESOURCES, 0)
+
+
+def measure(db: Session, user_ids: List[int]) -> Dict[int, Dict[str, int]]:
+    """Count what ``user_ids`` actually store in ``db``, archived notes included."""
+    out: Dict[int, Dict[str, int]] = {uid: _zero() for uid in user_ids}
+    live = db.execute(
+        select(Note.owner_id, func.count(), func.sum(func.length(cast(Note.body, LargeBinary))))
+        .where(Note.owner_id.in_(user_ids))
+        .group_by(Note.owner_id)
+    )
+    for uid, count, size in live:
+        out[uid]["notes"] += count
+        out[uid]["body_bytes"] += size or 0
+    tags = db.execute(
+        select(Tag.created_by, func.count())
+        .where(Tag.created_by.in_(user_ids))
+        .group_by(Tag.created_by)
+    )
+    for uid, count in tags:
+        out[uid]["tags"] = count
+    archived = db.execute(
+        select(ArchivedNote.owner_id).where(ArchivedNote.owner_id.in_(user_ids)).distinct()
+    ).scalars()
+    for uid in archived.all():
+        for record in archive_store.scan(db, uid):
+            out[uid]["notes"] += 1
+            out[uid]["body_bytes"] += body_size(record["body"])
+    return out
+
+
+def usage_for(db: Session, user_id: int) -> Dict[str, int]:
+    row = db.execute(_USAGE, {"uid": user_id}).first()
+    if row is None:
+        return measure(db, [user_id])[user_id]
+    return row._asdict()
+
+
+def reconcile(
+    db: Session,
+    user_ids: Optional[List[int]] = None,
+    batch: int = QUOTA_RECONCILE_BATCH,
+    on_batch: Optional[Callable[[int], None]] = None,
+) -> int:
+    """Recount the counters of ``user_ids`` (everyone with data in ``db`` by default)."""
+    if user_ids is None:
+        owners = union(
+            select(Note.owner_id),
+            select(ArchivedNote.owner_id),
+            select(Tag.created_by).where(Tag.created_by.is_not(None)),
+            select(_usage.c.user_id),
+        )
+        user_ids = sorted(db.execute(owners).scalars())
+    done = 0
+    for start in range(0, len(user_ids), batch):
+        chunk = user_ids[start : start + batch]
+        # Deleting first takes the write lock, so no write can slip in
+        # between counting a user's rows and storing the result.
+        db.execute(delete(_usage).where(_usage.c.user_id.in_(chunk)))
+        counts = measure(db, chunk)
+        db.execute(sqlite_insert(_usage), [{"user_id": uid, **counts[uid]} for uid in chunk])
+        db.commit()
+        done += len(chunk)
+        if on_batch is not None:
+            on_batch(done)
+    return done
+
+
+def usage_session(user_id: int) -> Session:
+    """A session on the database that holds ``user_id``'s notes and counters."""
+    return shard_router.session_for(user_id) if shard_router is not None else SessionLocal()
+
+
+def _session_factories() -> List[Callable[[], Session]]:
+    factories: List[Callable[[], Session]] = [SessionLocal]
+    if shard_router is not None:
+        factories += [partial(shard_router.session, i) for i in range(shard_router.count)]
+    return factories
+
+
+@job_handler("quota_reconcile")
+def _reconcile_job(ctx: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    user_id = params.get("user_id")
+    if user_id is not None:
+        db = usage_session(int(user_id))
+        try:
+            return {"users": reconcile(db, [int(user_id)])}
+        finally:
+            db.close()
+    total = 0
+    for factory in _session_factories():
+        base = total
+        db = factory()
+        try:
+            total += reconcile(
+                db, on_batch=lambda n, base=base: ctx.progress(base + n, message="reconciling")
+            )
+        finally:
+            db.close()
+    return {"users": total}
@@ -0,0 +1,130 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .models import RevokedToken
+
+REVOCATION_REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", "5"))
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (no deletes; rebuild to shrink)."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing (Kirsch-Mitzenmacher): k positions from one digest.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class RevocationList:
+    """In-memory view of revoked token ids, kept in sync with ``revoked_tokens``.
+
+    The hot path (``is_revoked``) is a Bloom filter probe that rejects
+    almost every live token without touching the set or the database.
+    The table is append-only by id, so a refresh only reads rows newer
+    than the last one seen, at most once per ``refresh_interval``. Tokens
+    revoked by this process are visible immediately; revocations made by
+    other workers within one refresh interval.
+    """
+
+    def __init__(
+        self,
+        refresh_interval: float = REVOCATION_REFRESH_SECONDS,
+        bloom_capacity: int = REVOCATION_BLOOM_CAPACITY,
+    ) -> None:
+        self.refresh_interval = refresh_interval
+        self.bloom_capacity = bloom_capacity
+        self._lock = threading.Lock()
+        self._revoked: Dict[str, int] = {}
+        self._bloom = BloomFilter(bloom_capacity)
+        self._last_id = 0
+        self._next_refresh = 0.0
+
+    def is_revoked(self, jti: str, db: Session) -> bool:
+        if time.monotonic() >= self._next_refresh:
+            self.refresh(db)
+        if jti not in self._bloom:
+            return False
+        with self._lock:
+            return jti in self._revoked
+
+    def refresh(self, db: Session, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._next_refresh = time.monotonic() + self.refresh_interval
+            last_id = self._last_id
+        rows = db.execute(
+            select(RevokedToken.id, RevokedToken.jti, RevokedToken.expires_at)
+            .where(RevokedToken.id > last_id)
+            .order_by(RevokedToken.id)
+        ).all()
+        with self._lock:
+            for row_id, jti, expires_at in rows:
+                self._remember(jti, expires_at)
+                self._last_id = max(self._last_id, row_id)
+            expired = [j for j, exp in self._revoked.items() if exp <= now]
+            for jti in expired:
+                del self._revoked[jti]
+            if expired or self._bloom.count > self._bloom.capacity:
+                self._rebuild()
+
+    def revoke(self, db: Session, jti: str, user_id: Optional[int], expires_at: int) -> None:
+        db.execute(
+            sqlite_insert(RevokedToken)
+            .values(jti=jti, user_id=user_id, expires_at=expires_at)
+            .on_conflict_do_nothing()
+        )
+        # Rows for tokens that have expired anyway are dead weight.
+        db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= int(time.time())))
+        db.commit()
+        with self._lock:
+            self._remember(jti, expires_at)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "revoked": len(self._revoked),
+                "bloom_bits": self._bloom.size,
+                "bloom_hashes": self._bloom.hashes,
+                "last_id": self._last_id,
+            }
+
+    def _remember(self, jti: str, expires_at: int) -> None:
+        if jti not in self._revoked:
+            self._bloom.add(jti)
+        self._revoked[jti] = expires_at
+
+    def _rebuild(self) -> None:
+        # Bloom filters cannot forget, so expiry and growth rebuild it.
+        bloom = BloomFilter(max(self.bloom_capacity, 2 * len(self._revoked)))
+        for jti in self._revoked:
+            bloom.add(jti)
+        self._bloom = bloom
+
+
+revocation_list = RevocationList()
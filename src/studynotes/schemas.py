@@ -61,11 +61,21 @@ class TagOut(BaseModel):
     name: str
 
 
+class TagSuggestion(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    name: str
+    usage: int
+
+
+NOTE_BODY_MAX_LENGTH = 10_000
+
+
 class NoteBase(BaseModel):
     model_config = ConfigDict(extra="forbid")
 
     title: str = Field(min_length=1, max_length=200)
-    body: str = Field(min_length=1, max_length=10_000)
+    body: str = Field(min_length=1, max_length=NOTE_BODY_MAX_LENGTH)
 
 
 class NoteCreate(NoteBase):
@@ -76,7 +86,7 @@ class NotePatch(BaseModel):
     model_config = ConfigDict(extra="forbid")
 
     title: Optional[str] = Field(default=None, min_length=1, max_length=200)
-    body: Optional[str] = Field(default=None, min_length=1, max_length=10_000)
+    body: Optional[str] = Field(default=None, min_length=1, max_length=NOTE_BODY_MAX_LENGTH)
     tags: Optional[list[str]] = None
 
 
@@ -86,3 +96,68 @@ class NoteOut(NoteBase):
     id: int
     owner_id: int
     tags: list[str] = Field(default_factory=list)
+
+
+NOTE_FIELDS = ("id", "title", "body", "owner_id", "tags")
+
+
+class NoteSparseOut(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    id: Optional[int] = None
+    title: Optional[str] = None
+    body: Optional[str] = None
+    owner_id: Optional[int] = None
+    tags: Optional[list[str]] = None
+
+
+class TokenRevoke(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    jti: str = Field(min_length=1, max_length=64)
+
+
+class JobCreate(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    kind: str = Field(min_length=1, max_length=64)
+    params: dict = Field(default_factory=dict)
+
+
+class JobOut(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    id: int
+    kind: str
+    status: str
+    params: dict
+    done: int
+    total: Optional[int] = None
+    progress: Optional[float] = None
+    message: Optional[str] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    cancel_requested: bool
+    created_at: int
+    started_at: Optional[int] = None
+    finished_at: Optional[int] = None
+
+
+class QuotaLimits(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    max_notes: Optional[int] = Field(default=None, ge=0)
+    max_body_bytes: Optional[int] = Field(default=None, ge=0)
+    max_tags: Optional[int] = Field(default=None, ge=0)
+
+
+class QuotaOut(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    user_id: int
+    notes: int
+    body_bytes: int
+    tags: int
+    max_notes: Optional[int] = None
+    max_body_bytes: Optional[int] = None
+    max_tags: Optional[int] = None
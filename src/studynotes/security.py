@@ -1,7 +1,10 @@
 import logging
 import os
+import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Optional
 from uuid import uuid4
 
 from fastapi import Depends, HTTPException, Request, status
@@ -9,31 +12,148 @@ from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from sqlalchemy import bindparam, select
 from sqlalchemy.orm import Session
 
-from .database import get_db
+from .database import get_read_db
 from .models import User
+from .revocation import revocation_list
 
 logger = logging.getLogger("studynotes")
 
 MIN_JWT_SECRET_LENGTH = 8
 
-_pwd_ctx = CryptContext(
-    schemes=["argon2"],
-    default="argon2",
-    deprecated="auto",
-    argon2__memory_cost=262_144,
-    argon2__time_cost=3,
-    argon2__parallelism=1,
-)
+# NFR-01 floor: calibration may raise these but never go below them.
+ARGON2_MIN_MEMORY_KIB = 262_144
+ARGON2_MIN_TIME_COST = 3
+ARGON2_PARALLELISM = 1
+
+ARGON2_CALIBRATE = os.getenv("ARGON2_CALIBRATE", "0") == "1"
+ARGON2_TARGET_MS = float(os.getenv("ARGON2_TARGET_MS", "500"))
+ARGON2_MAX_MEMORY_KIB = int(os.getenv("ARGON2_MAX_MEMORY_KIB", str(1024 * 1024)))
+# Memory all concurrent hashes and verifications may use together; requests
+# beyond what fits wait for a slot instead of allocating more.
+ARGON2_MEMORY_BUDGET_KIB = int(os.getenv("ARGON2_MEMORY_BUDGET_KIB", str(2 * 1024 * 1024)))
+
+
+@dataclass(frozen=True)
+class Argon2Params:
+    memory_cost: int
+    time_cost: int
+    parallelism: int = ARGON2_PARALLELISM
+
+    def floored(self) -> "Argon2Params":
+        return Argon2Params(
+            max(self.memory_cost, ARGON2_MIN_MEMORY_KIB),
+            max(self.time_cost, ARGON2_MIN_TIME_COST),
+            ARGON2_PARALLELISM,
+        )
+
+
+def _params_from_env() -> Argon2Params:
+    return Argon2Params(
+        int(os.getenv("ARGON2_MEMORY_COST", str(ARGON2_MIN_MEMORY_KIB))),
+        int(os.getenv("ARGON2_TIME_COST", str(ARGON2_MIN_TIME_COST))),
+    ).floored()
+
+
+def _make_context(params: Argon2Params) -> CryptContext:
+    return CryptContext(
+        schemes=["argon2"],
+        default="argon2",
+        deprecated="auto",
+        argon2__memory_cost=params.memory_cost,
+        argon2__time_cost=params.time_cost,
+        argon2__parallelism=params.parallelism,
+    )
+
+
+def _hash_slots(params: Argon2Params) -> threading.BoundedSemaphore:
+    # Argon2 is CPU-bound, so more parallel hashes than cores only add memory.
+    fits = ARGON2_MEMORY_BUDGET_KIB // params.memory_cost
+    return threading.BoundedSemaphore(max(1, min(fits, os.cpu_count() or 1)))
+
+
+argon2_params = _params_from_env()
+_pwd_ctx = _make_context(argon2_params)
+_slots = _hash_slots(argon2_params)
+
+
+def configure_password_hashing(params: Argon2Params) -> None:
+    """Hash new passwords with ``params``; existing hashes keep verifying."""
+    global argon2_params, _pwd_ctx, _slots
+    params = params.floored()
+    argon2_params, _pwd_ctx, _slots = params, _make_context(params), _hash_slots(params)
+
+
+def _time_hash_ms(params: Argon2Params, rounds: int = 2) -> float:
+    ctx = _make_context(params)
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        ctx.hash("calibration")
+        best = min(best, (time.perf_counter() - started) * 1000)
+    return best
+
+
+def calibrate_argon2(
+    target_ms: float = ARGON2_TARGET_MS,
+    max_memory_kib: int = ARGON2_MAX_MEMORY_KIB,
+    timer: Callable[[Argon2Params], float] = _time_hash_ms,
+) -> Argon2Params:
+    """Strongest parameters whose hash time on this host stays within ``target_ms``.
+
+    Memory is the main defence against GPU cracking, so it is doubled first
+    (up to ``max_memory_kib``), then time_cost takes whatever latency budget
+    is left. The NFR-01 floor always wins: on a host too slow to meet the
+    target at the floor, the floor is returned.
+    """
+    params = Argon2Params(ARGON2_MIN_MEMORY_KIB, ARGON2_MIN_TIME_COST)
+    elapsed = timer(params)
+    while params.memory_cost * 2 <= max_memory_kib and elapsed * 2 <= target_ms:
+        params = Argon2Params(params.memory_cost * 2, params.time_cost)
+        elapsed = timer(params)
+    per_pass = elapsed / params.time_cost
+    time_cost = max(ARGON2_MIN_TIME_COST, int(target_ms // per_pass))
+    if time_cost != params.time_cost:
+        params = Argon2Params(params.memory_cost, time_cost)
+    if elapsed > target_ms:
+        logger.warning(
+            "argon2 floor exceeds latency target",
+            extra={"target_ms": target_ms, "elapsed_ms": round(elapsed, 1)},
+        )
+    return params
 
 
 def hash_password(password: str) -> str:
-    return _pwd_ctx.hash(password)
+    with _slots:
+        return _pwd_ctx.hash(password)
 
 
 def verify_password(password: str, hashed: str) -> bool:
-    return _pwd_ctx.verify(password, hashed)
+    with _slots:
+        return _pwd_ctx.verify(password, hashed)
+
+
+def _hash_params(hashed: str) -> Optional[Argon2Params]:
+    # $argon2id$v=19$m=262144,t=3,p=1$<salt>$<hash>
+    try:
+        kv = dict(item.split("=") for item in hashed.split("$")[3].split(","))
+        return Argon2Params(int(kv["m"]), int(kv["t"]), int(kv["p"]))
+    except (IndexError, KeyError, ValueError):
+        return None
+
+
+def password_needs_rehash(hashed: str) -> bool:
+    # Only weaker hashes are upgraded. Calibration is timing-noisy, so hosts
+    # (or restarts) that settle on slightly different parameters must not keep
+    # rewriting each other's hashes on every login.
+    stored = _hash_params(hashed)
+    if stored is None or not hashed.startswith("$argon2id$v=19$"):
+        return True
+    return (
+        stored.memory_cost < argon2_params.memory_cost or stored.time_cost < argon2_params.time_cost
+    )
 
 
 ALGORITHM = "HS256"
@@ -79,6 +199,7 @@ def create_access_token(
         "sub": sub,
         "iat": int(now.timestamp()),
         "exp": int((now + timedelta(seconds=ttl)).timestamp()),
+        "jti": uuid4().hex,
     }
     if extra_claims:
         payload.update(extra_claims)
@@ -103,8 +224,12 @@ def decode_access_token(token: str) -> Dict[str, Any]:
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
 
+# Prebuilt once: every authenticated request runs this lookup.
+_USER_BY_EMAIL = select(User).where(User.email == bindparam("email")).limit(1)
+
+
 def get_current_user(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     token: str = Depends(oauth2_scheme),
 ) -> User:
     cred_exc = HTTPException(
@@ -123,8 +248,11 @@ def get_current_user(
             raise cred_exc
     except JWTError:
         raise cred_exc
+    jti = payload.get("jti")
+    if jti and revocation_list.is_revoked(jti, db):
+        raise cred_exc
 
-    user = db.query(User).filter(User.email == sub).first()
+    user = db.execute(_USER_BY_EMAIL, {"email": sub}).scalars().first()
     if not user:
         raise cred_exc
 
@@ -194,3 +322,11 @@ def problem_details_exception_handler(
         content=body,
         media_type="application/problem+json",
     )
+
+
+if __name__ == "__main__":
+    # python -m studynotes.security: print calibrated settings for this host.
+    found = calibrate_argon2()
+    print(f"ARGON2_MEMORY_COST={found.memory_cost}")
+    print(f"ARGON2_TIME_COST={found.time_cost}")
+    print(f"# {_time_hash_ms(found):.0f} ms per hash on this host")
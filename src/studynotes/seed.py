@@ -0,0 +1,242 @@
+import argparse
+import math
+import random
+import time
+from bisect import bisect
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import Connection, Engine, func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .database import Base, add_missing_columns, create_missing_indexes
+from .database import engine as main_engine
+from .models import Note, NoteTag, Tag, User
+from .schemas import NOTE_BODY_MAX_LENGTH
+from .security import hash_password
+from .sharding import ShardRouter, init_note_id_counter, shard_meta, shard_router
+
+_WORDS = (
+    "algebra analysis array base biology cache calculus cell chemistry circuit class compiler "
+    "data derivative design economics energy entropy equation essay exam force function "
+    "genetics geometry graph grammar history integral kernel lab lecture limit linear logic "
+    "market matrix memory method model network neuron optics physics probability proof "
+    "protein quantum query reading recursion review sample schema seminar signal sorting "
+    "statistics stream syntax theorem theory thermo topic tree vector velocity vocabulary"
+).split()
+
+
+@dataclass
+class SeedStats:
+    users: int = 0
+    notes: int = 0
+    tags: int = 0
+    links: int = 0
+    seconds: float = 0.0
+
+
+def tag_names(count: int) -> List[str]:
+    """Tag names by popularity rank: ``tag_names(n)[0]`` is the most used one."""
+    return [f"{_WORDS[k % len(_WORDS)]}-{k}" for k in range(count)]
+
+
+class _NoteFactory:
+    """Draws note bodies and tag sets with a fixed seed.
+
+    Body lengths are log-normal around ``body_median`` characters (many short
+    notes, a long tail of long ones); tag ranks follow a Zipf law with
+    exponent ``zipf_s`` so a few tags dominate, as they do in real data.
+    """
+
+    def __init__(
+        self, rng: random.Random, tags: int, zipf_s: float, max_tags: int, body_median: int
+    ) -> None:
+        self.rng = rng
+        self.max_tags = max_tags
+        self.body_mu = math.log(body_median)
+        self._cum = list(accumulate(1 / (k + 1) ** zipf_s for k in range(tags)))
+        words = [rng.choice(_WORDS) for _ in range(200_000)]
+        self._text = " ".join(words)
+
+    def body(self) -> str:
+        # Longer bodies could not be served back through NoteOut.
+        n = min(NOTE_BODY_MAX_LENGTH, max(20, int(self.rng.lognormvariate(self.body_mu, 0.9))))
+        start = self.rng.randrange(len(self._text) - n)
+        return self._text[start : start + n]
+
+    def title(self) -> str:
+        return " ".join(self.rng.choices(_WORDS, k=self.rng.randint(2, 6))).capitalize()
+
+    def tag_ranks(self) -> set[int]:
+        k = self.rng.randint(0, self.max_tags)
+        total = self._cum[-1]
+        return {bisect(self._cum, self.rng.random() * total) for _ in range(k)}
+
+
+@contextmanager
+def _bulk_connection(engine: Engine) -> Iterator[Connection]:
+    # Seeding is restartable, so trading durability for speed is fine here.
+    with engine.connect() as conn:
+        previous = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+        conn.exec_driver_sql("PRAGMA synchronous = OFF")
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+            conn.exec_driver_sql(f"PRAGMA synchronous = {int(previous)}")
+
+
+def _ensure_tag_ids(conn: Connection, names: List[str]) -> List[int]:
+    conn.execute(sqlite_insert(Tag).on_conflict_do_nothing(), [{"name": n} for n in names])
+    ids: Dict[str, int] = {}
+    for start in range(0, len(names), 500):
+        chunk = names[start : start + 500]
+        ids.update(conn.execute(select(Tag.name, Tag.id).where(Tag.name.in_(chunk))).all())
+    return [ids[n] for n in names]
+
+
+def _reserve_note_ids(conn: Connection, count: int) -> int:
+    """First id of a block of ``count`` unused note ids."""
+    last = conn.execute(
+        update(shard_meta)
+        .where(shard_meta.c.key == "next_note_id")
+        .values(value=shard_meta.c.value + count)
+        .returning(shard_meta.c.value)
+    ).scalar_one()
+    return last - count + 1
+
+
+def seed(
+    users: int,
+    notes_per_user: float,
+    tags: int = 500,
+    *,
+    zipf_s: float = 1.0,
+    max_tags_per_note: int = 5,
+    body_median: int = 400,
+    password: str = "Password123",
+    email_prefix: str = "seed",
+    batch: int = 10_000,
+    random_seed: int = 0,
+    engine: Engine = main_engine,
+    router: Optional[ShardRouter] = shard_router,
+) -> SeedStats:
+    """Bulk-insert synthetic users, notes and tags, bypassing the API.
+
+    Every user shares one password hash computed up front. Notes per user
+    are exponentially distributed around ``notes_per_user``. With a shard
+    router, notes go to their owner's shard exactly as the API would place
+    them. Rows are inserted with executemany in ``batch``-sized chunks.
+    """
+    started = time.monotonic()
+    rng = random.Random(random_seed)
+    factory = _NoteFactory(rng, tags, zipf_s, max_tags_per_note, body_median)
+    stats = SeedStats()
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine, Base.metadata.sorted_tables)
+    create_missing_indexes(engine, Base.metadata.sorted_tables)
+    init_note_id_counter(engine)
+    names = tag_names(tags)
+
+    hashed = hash_password(password)
+    with _bulk_connection(engine) as conn:
+        first_uid = (conn.execute(select(func.max(User.id))).scalar() or 0) + 1
+        owner_ids = list(range(first_uid, first_uid + users))
+        for start in range(0, users, batch):
+            conn.execute(
+                insert(User),
+                [
+                    {
+                        "id": uid,
+                        "email": f"{email_prefix}{uid}@example.com",
+                        "hashed_password": hashed,
+                    }
+                    for uid in owner_ids[start : start + batch]
+                ],
+            )
+        main_tag_ids = _ensure_tag_ids(conn, names)
+        conn.commit()
+    stats.users = users
+    stats.tags = tags
+
+    targets: Dict[Optional[int], List[int]] = {}
+    for uid in owner_ids:
+        index = router.shard_for(uid) if router is not None else None
+        targets.setdefault(index, []).append(uid)
+
+    for index, owners in targets.items():
+        target_engine = engine if index is None else router.engines[index]
+        counts = [int(rng.expovariate(1 / notes_per_user)) for _ in owners]
+        with _bulk_connection(target_engine) as conn:
+            tag_ids = main_tag_ids if index is None else _ensure_tag_ids(conn, names)
+            next_id = _reserve_note_ids(conn, sum(counts))
+            notes: List[dict] = []
+            links: List[dict] = []
+            for owner_id, count in zip(owners, counts):
+                for _ in range(count):
+                    notes.append(
+                        {
+                            "id": next_id,
+                            "title": factory.title(),
+                            "body": factory.body(),
+                            "owner_id": owner_id,
+                        }
+                    )
+                    links.extend(
+                        {"note_id": next_id, "tag_id": tag_ids[r]} for r in factory.tag_ranks()
+                    )
+                    next_id += 1
+                    if len(notes) >= batch:
+                        stats.notes += len(notes)
+                        stats.links += len(links)
+                        _flush(conn, notes, links)
+            stats.notes += len(notes)
+            stats.links += len(links)
+            _flush(conn, notes, links)
+            conn.commit()
+    stats.seconds = round(time.monotonic() - started, 2)
+    return stats
+
+
+def _flush(conn: Connection, notes: List[dict], links: List[dict]) -> None:
+    if notes:
+        conn.execute(insert(Note), notes)
+    if links:
+        conn.execute(insert(NoteTag), links)
+    notes.clear()
+    links.clear()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m studynotes.seed")
+    parser.add_argument("--users", type=int, required=True)
+    parser.add_argument("--notes-per-user", type=float, default=50)
+    parser.add_argument("--tags", type=int, default=500)
+    parser.add_argument("--zipf", type=float, default=1.0, help="tag popularity exponent")
+    parser.add_argument("--max-tags-per-note", type=int, default=5)
+    parser.add_argument("--body-median", type=int, default=400, help="median body length")
+    parser.add_argument("--password", default="Password123", help="shared by all seeded users")
+    parser.add_argument("--email-prefix", default="seed")
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args(argv)
+
+    stats = seed(
+        args.users,
+        args.notes_per_user,
+        args.tags,
+        zipf_s=args.zipf,
+        max_tags_per_note=args.max_tags_per_note,
+        body_median=args.body_median,
+        password=args.password,
+        email_prefix=args.email_prefix,
+        batch=args.batch,
+        random_seed=args.seed,
+    )
+    print(", ".join(f"{k}={v}" for k, v in asdict(stats).items()))
+
+
+if __name__ == "__main__":
+    main()
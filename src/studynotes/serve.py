@@ -0,0 +1,518 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+
+from .cache import SharedCounters
+
+logger = logging.getLogger("studynotes")
+
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "0"))
+SERVE_GRACEFUL_TIMEOUT = float(os.getenv("SERVE_GRACEFUL_TIMEOUT", "30"))
+SERVE_READY_TIMEOUT = float(os.getenv("SERVE_READY_TIMEOUT", "60"))
+SERVE_WARM_CONNECTIONS = int(os.getenv("SERVE_WARM_CONNECTIONS", "4"))
+
+# Handed over to the re-executed master on a graceful reload.
+_ENV_LISTEN_FD = "STUDYNOTES_LISTEN_FD"
+_ENV_WORKERS = "STUDYNOTES_WORKERS"
+_ENV_EVENT_SEQ = "STUDYNOTES_EVENT_SEQ"
+_ENV_CACHE_FD = "STUDYNOTES_CACHE_FD"
+
+# Relay messages are single SOCK_SEQPACKET datagrams; notes stay far below this.
+_MAX_MESSAGE = 1 << 18
+# How long a draining worker waits for requests on connections it accepted
+# just before it stopped accepting.
+_ACCEPT_GRACE_SECONDS = 0.5
+
+
+def default_workers() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _send(sock: socket.socket, message: Dict[str, Any]) -> None:
+    sock.send(json.dumps(message, separators=(",", ":")).encode())
+
+
+def _engines() -> list:
+    from .database import engine, read_engine
+    from .sharding import shard_router
+
+    engines = [engine, read_engine]
+    if shard_router is not None:
+        engines += shard_router.engines + shard_router.read_engines
+    return engines
+
+
+def preload(cache_fd: Optional[int] = None) -> SharedCounters:
+    """Import the app and warm process-wide state once, before any fork().
+
+    Workers inherit the loaded tag index, the revocation list and the
+    compiled SQL cache copy-on-write instead of each building their own.
+    Returns the shared note version counters; after a reload ``cache_fd``
+    reopens the previous master's, which its adopted workers still use.
+    """
+    from . import main
+    from .database import ReadSessionLocal
+    from .models import User
+    from .revocation import revocation_list
+    from .schemas import NOTE_FIELDS
+    from .security import _USER_BY_EMAIL, calibrate_argon2, configure_password_hashing
+
+    if main.ARGON2_CALIBRATE:
+        configure_password_hashing(calibrate_argon2())
+        main.ARGON2_CALIBRATE = False  # workers inherit the calibrated parameters
+    main.tag_index.ensure_loaded(main._tag_usage_rows)
+    db = ReadSessionLocal()
+    try:
+        revocation_list.refresh(db)
+        db.execute(_USER_BY_EMAIL, {"email": ""}).first()
+        main._list_note_rows(
+            db, User(id=0, role="user"), set(NOTE_FIELDS), main.NoteFilter(), None, 1, 0
+        )
+    finally:
+        db.close()
+    counters = SharedCounters(fd=cache_fd)
+    main.note_cache.share_versions(counters)
+    main.list_coalescer.share_versions(counters)
+    # SQLite connections must not cross fork(); workers open their own.
+    for engine in _engines():
+        engine.dispose()
+    return counters
+
+
+def _warm_pool() -> None:
+    from .database import READ_POOL_SIZE, engine, read_engine
+
+    connections = [
+        read_engine.connect() for _ in range(min(SERVE_WARM_CONNECTIONS, READ_POOL_SIZE))
+    ]
+    connections.append(engine.connect())
+    for conn in connections:
+        conn.exec_driver_sql("SELECT 1")
+    for conn in connections:
+        conn.close()
+
+
+class _MasterLink:
+    """Worker side of the relay socket to the master."""
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self._lock = threading.Lock()
+
+    def send(self, message: Dict[str, Any]) -> None:
+        with self._lock:
+            _send(self.sock, message)
+
+    def publish(self, owner_id: int, kind: str, data: Dict[str, Any]) -> None:
+        self.send({"type": "publish", "owner_id": owner_id, "kind": kind, "data": data})
+
+    def relay_tags(self, op: str, data: Dict[str, Any]) -> None:
+        self.send({"type": "broadcast", "topic": "tags", "op": op, "data": data})
+
+    def listen(self, broker, tag_index) -> None:
+        while True:
+            try:
+                raw = self.sock.recv(_MAX_MESSAGE)
+            except OSError:
+                raw = b""
+            if not raw:
+                break
+            m = json.loads(raw)
+            if m["type"] == "event":
+                broker.deliver(m["id"], m["owner_id"], m["kind"], m["data"])
+            elif m["type"] == "broadcast" and m["topic"] == "tags":
+                if m["op"] == "reload":
+                    # A recount queries every database; keep relaying meanwhile.
+                    threading.Thread(
+                        target=tag_index.apply, args=(m["op"], m["data"]), daemon=True
+                    ).start()
+                else:
+                    tag_index.apply(m["op"], m["data"])
+        # The master is gone; stop rather than serve without the relay.
+        os.kill(os.getpid(), signal.SIGTERM)
+
+
+class _WorkerServer(uvicorn.Server):
+    def __init__(self, config: uvicorn.Config, link: _MasterLink) -> None:
+        super().__init__(config)
+        self.link = link
+
+    async def startup(self, sockets=None) -> None:
+        await super().startup(sockets)
+        if self.started:
+            self.link.send({"type": "ready", "pid": os.getpid()})
+
+    async def shutdown(self, sockets=None) -> None:
+        from .events import broker
+
+        # uvicorn closes connections without a request in progress at once;
+        # one accepted a moment ago whose request is still in flight would be
+        # reset, although the other workers keep serving the same socket.
+        for server in self.servers:
+            server.close()
+        await asyncio.sleep(_ACCEPT_GRACE_SECONDS)
+        # Open SSE streams would hold the drain until the timeout; clients
+        # reconnect to another worker with Last-Event-ID instead.
+        broker.close()
+        await super().shutdown(sockets)
+
+
+def _run_worker(
+    listener: socket.socket,
+    relay: socket.socket,
+    graceful_timeout: float,
+    log_level: str,
+    reload_tags: bool = False,
+) -> None:
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+
+    from . import main
+
+    _warm_pool()
+    if reload_tags:
+        # The index inherited from the master predates updates relayed since.
+        main.tag_index.load(main._tag_usage_rows())
+    link = _MasterLink(relay)
+    main.broker.relay_through(link.publish)
+    main.tag_index.relay_through(link.relay_tags)
+    threading.Thread(target=link.listen, args=(main.broker, main.tag_index), daemon=True).start()
+    config = uvicorn.Config(
+        main.app,
+        lifespan="on",
+        log_level=log_level,
+        timeout_graceful_shutdown=graceful_timeout,
+    )
+    _WorkerServer(config, link).run(sockets=[listener])
+
+
+@dataclass(eq=False)
+class _Worker:
+    pid: int
+    sock: socket.socket
+    generation: int
+    ready: bool = False
+    retiring: bool = False
+
+
+class Arbiter:
+    """Pre-fork master: owns the listening socket and the worker processes.
+
+    Workers are forked from a preloaded interpreter and accept on the
+    shared socket. The master also relays note events between workers,
+    numbering them once so SSE ids are consistent whichever worker a
+    client reconnects to, and tag index updates, so suggestions agree.
+
+    SIGHUP reloads gracefully: the master re-executes itself (new code)
+    keeping its pid, the socket and the running workers, forks a new
+    generation, and only asks the old one to drain once every new worker
+    is accepting. The socket never closes, so no connection is refused.
+    SIGTERM/SIGINT drain all workers and exit.
+    """
+
+    def __init__(
+        self,
+        listener: socket.socket,
+        workers: int,
+        graceful_timeout: float = SERVE_GRACEFUL_TIMEOUT,
+        ready_timeout: float = SERVE_READY_TIMEOUT,
+        log_level: str = "info",
+        argv: Optional[List[str]] = None,
+    ) -> None:
+        self.listener = listener
+        self.target = max(1, workers)
+        self.graceful_timeout = graceful_timeout
+        self.ready_timeout = ready_timeout
+        self.log_level = log_level
+        self.argv = list(sys.argv[1:] if argv is None else argv)
+        self.event_seq = 0
+        self.generation = 0
+        self.counters: Optional[SharedCounters] = None
+        # Set once workers have changed the tag index the master preloaded.
+        self.tags_changed = False
+        self._workers: Dict[int, _Worker] = {}
+        self._selector = selectors.DefaultSelector()
+        self._signals: List[int] = []
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._rollover_deadline: Optional[float] = None
+        self._stop_deadline: Optional[float] = None
+        self._respawn_after = 0.0
+
+    def adopt(self, pid: int, fd: int) -> None:
+        """Take over a running worker from the master image before a reload."""
+        sock = socket.socket(fileno=fd)
+        self._register(_Worker(pid, sock, self.generation, ready=True))
+
+    def run(self) -> int:
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(sig, self._on_signal)
+        signal.set_wakeup_fd(self._wakeup_w)
+        self._start_generation()
+        while True:
+            for key, _ in self._selector.select(timeout=1.0):
+                if key.fileobj == self._wakeup_r:
+                    self._drain_wakeup()
+                else:
+                    self._read(key.data)
+            while self._signals:
+                self._handle_signal(self._signals.pop(0))
+            self._reap()
+            if self._stop_deadline is not None:
+                if not self._workers:
+                    return 0
+                if time.monotonic() > self._stop_deadline:
+                    self._kill_all(signal.SIGKILL)
+            else:
+                self._check_rollover()
+                self._maintain()
+
+    def _on_signal(self, sig: int, _frame) -> None:
+        self._signals.append(sig)
+
+    def _drain_wakeup(self) -> None:
+        try:
+            while os.read(self._wakeup_r, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _handle_signal(self, sig: int) -> None:
+        if sig in (signal.SIGTERM, signal.SIGINT) and self._stop_deadline is None:
+            logger.info("stopping %d worker(s)", len(self._workers))
+            self._stop_deadline = time.monotonic() + self.graceful_timeout + 5
+            self._kill_all(signal.SIGTERM)
+        elif sig == signal.SIGHUP and self._stop_deadline is None:
+            self._reload()
+
+    def _start_generation(self) -> None:
+        self.generation += 1
+        for _ in range(self.target):
+            self._spawn()
+        if any(w.generation < self.generation for w in self._workers.values()):
+            self._rollover_deadline = time.monotonic() + self.ready_timeout
+
+    def _check_rollover(self) -> None:
+        if self._rollover_deadline is None:
+            return
+        current = [w for w in self._workers.values() if w.generation == self.generation]
+        old = [w for w in self._workers.values() if w.generation < self.generation]
+        if sum(w.ready for w in current) >= self.target:
+            logger.info("generation %d ready, draining %d old worker(s)", self.generation, len(old))
+            for w in old:
+                self._retire(w)
+            self._rollover_deadline = None
+        elif time.monotonic() > self._rollover_deadline:
+            # The new code does not come up: keep serving with the old workers.
+            logger.error(
+                "generation %d not ready in time, keeping the old workers", self.generation
+            )
+            for w in current:
+                self._retire(w)
+            self.generation = max(w.generation for w in old)
+            self._rollover_deadline = None
+
+    def _maintain(self) -> None:
+        live = [w for w in self._workers.values() if not w.retiring]
+        current = [w for w in live if w.generation == self.generation]
+        if self._rollover_deadline is not None or time.monotonic() < self._respawn_after:
+            return
+        for _ in range(self.target - len(current)):
+            self._spawn()
+
+    def _spawn(self) -> None:
+        master_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                master_end.close()
+                self._close_in_child()
+                _run_worker(
+                    self.listener,
+                    worker_end,
+                    self.graceful_timeout,
+                    self.log_level,
+                    reload_tags=self.tags_changed,
+                )
+                code = 0
+            except SystemExit as exc:
+                code = exc.code if isinstance(exc.code, int) else 1
+            except BaseException:
+                logger.exception("worker %d crashed", os.getpid())
+            finally:
+                os._exit(code)
+        worker_end.close()
+        self._register(_Worker(pid, master_end, self.generation))
+
+    def _register(self, worker: _Worker) -> None:
+        worker.sock.settimeout(5)
+        self._workers[worker.pid] = worker
+        self._selector.register(worker.sock, selectors.EVENT_READ, worker)
+
+    def _close_in_child(self) -> None:
+        self._selector.close()
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+        for w in self._workers.values():
+            w.sock.close()
+
+    def _read(self, worker: _Worker) -> None:
+        try:
+            raw = worker.sock.recv(_MAX_MESSAGE)
+        except OSError:
+            raw = b""
+        if not raw:
+            self._selector.unregister(worker.sock)
+            return
+        m = json.loads(raw)
+        if m["type"] == "ready":
+            worker.ready = True
+        elif m["type"] == "publish":
+            self.event_seq += 1
+            event = {**m, "type": "event", "id": self.event_seq}
+            for w in list(self._workers.values()):
+                try:
+                    _send(w.sock, event)
+                except OSError:
+                    logger.warning("could not relay event to worker %d", w.pid)
+        elif m["type"] == "broadcast":
+            # The sender has applied it already.
+            self.tags_changed = True
+            for w in list(self._workers.values()):
+                if w is worker:
+                    continue
+                try:
+                    _send(w.sock, m)
+                except OSError:
+                    logger.warning("could not relay update to worker %d", w.pid)
+
+    def _retire(self, worker: _Worker) -> None:
+        if not worker.retiring:
+            worker.retiring = True
+            self._signal(worker.pid, signal.SIGTERM)
+
+    def _kill_all(self, sig: int) -> None:
+        for w in list(self._workers.values()):
+            w.retiring = True
+            self._signal(w.pid, sig)
+
+    @staticmethod
+    def _signal(pid: int, sig: int) -> None:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self._workers.pop(pid, None)
+            if worker is None:
+                continue
+            try:
+                self._selector.unregister(worker.sock)
+            except (KeyError, ValueError):
+                pass
+            worker.sock.close()
+            if not worker.retiring:
+                logger.warning("worker %d exited unexpectedly (status %d)", pid, status)
+                if not worker.ready:
+                    # Do not spin if the app cannot start at all.
+                    self._respawn_after = time.monotonic() + 1
+
+    def _reload(self) -> None:
+        # Make sure the new code imports before handing this process to it.
+        check = subprocess.run([sys.executable, "-c", "import studynotes.main"])
+        if check.returncode != 0:
+            logger.error("reload aborted: the application failed to import")
+            return
+        keep = [w for w in self._workers.values() if not w.retiring]
+        env = dict(os.environ)
+        env[_ENV_LISTEN_FD] = str(self.listener.fileno())
+        env[_ENV_WORKERS] = ",".join(f"{w.pid}:{w.sock.fileno()}" for w in keep)
+        env[_ENV_EVENT_SEQ] = str(self.event_seq)
+        if self.counters is not None:
+            env[_ENV_CACHE_FD] = str(self.counters.fd)
+            os.set_inheritable(self.counters.fd, True)
+        for w in keep:
+            w.sock.set_inheritable(True)
+        signal.set_wakeup_fd(-1)
+        logger.info("reloading: handing %d worker(s) to a new master image", len(keep))
+        os.execve(sys.executable, [sys.executable, "-m", "studynotes.serve", *self.argv], env)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m studynotes.serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=SERVE_WORKERS or None, help="default: one per CPU"
+    )
+    parser.add_argument("--graceful-timeout", type=float, default=SERVE_GRACEFUL_TIMEOUT)
+    parser.add_argument("--ready-timeout", type=float, default=SERVE_READY_TIMEOUT)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="[%(process)d] %(message)s")
+
+    inherited_fd = os.environ.pop(_ENV_LISTEN_FD, None)
+    if inherited_fd is not None:
+        listener = socket.socket(fileno=int(inherited_fd))
+    else:
+        listener = bind_socket(args.host, args.port)
+        logger.info("listening on http://%s:%d", args.host, args.port)
+    arbiter = Arbiter(
+        listener,
+        args.workers or default_workers(),
+        graceful_timeout=args.graceful_timeout,
+        ready_timeout=args.ready_timeout,
+        log_level=args.log_level,
+        argv=argv,
+    )
+    for item in filter(None, os.environ.pop(_ENV_WORKERS, "").split(",")):
+        pid, fd = (int(x) for x in item.split(":"))
+        arbiter.adopt(pid, fd)
+    arbiter.event_seq = int(os.environ.pop(_ENV_EVENT_SEQ, "0"))
+    cache_fd = os.environ.pop(_ENV_CACHE_FD, None)
+    arbiter.counters = preload(int(cache_fd) if cache_fd is not None else None)
+    sys.exit(arbiter.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+import argparse
+import glob
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, TypeVar
+
+from sqlalchemy import (
+    Column,
+    Engine,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    delete,
+    event,
+    func,
+    select,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, sessionmaker
+
+from .batching import GroupCommitter
+from .database import (
+    SQL_CACHE_SIZE,
+    SessionLocal,
+    add_missing_columns,
+    create_missing_indexes,
+    create_read_engine,
+    set_sqlite_pragmas,
+)
+from .models import ArchivedNote, IdempotencyKey, Note, NoteTag, Tag, UserUsage
+
+T = TypeVar("T")
+
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+SHARD_DIR = os.getenv("SHARD_DIR", "./shards")
+
+# Shard i allocates note ids from ((i + 1) * SPAN, (i + 2) * SPAN]. Ids below
+# SPAN belong to the unsharded database, so migrated rows keep their ids and
+# ids stay globally unique after rebalancing (they no longer imply a shard).
+SHARD_ID_SPAN = 10**12
+# Idempotency records, archive stubs and quota counters live next to the
+# notes they describe.
+SHARD_TABLES = [
+    Note.__table__,
+    Tag.__table__,
+    NoteTag.__table__,
+    IdempotencyKey.__table__,
+    ArchivedNote.__table__,
+    UserUsage.__table__,
+]
+
+_shard_meta = MetaData()
+shard_meta = Table(
+    "shard_meta",
+    _shard_meta,
+    Column("key", String(32), primary_key=True),
+    Column("value", Integer, nullable=False),
+)
+
+_SHARD_FILE = re.compile(r"notes-(\d+)\.db$")
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash: growing N to N+1 moves only ~1/(N+1) of the keys."""
+    key &= 0xFFFFFFFFFFFFFFFF
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+def shard_path(directory: str, index: int) -> str:
+    return os.path.join(directory, f"notes-{index}.db")
+
+
+def open_shard_engine(directory: str, index: int) -> Engine:
+    engine = create_engine(
+        f"sqlite:///{shard_path(directory, index)}",
+        connect_args={"check_same_thread": False},
+        execution_options={"studynotes_shard": index, "studynotes_note_ids": True},
+        query_cache_size=SQL_CACHE_SIZE,
+    )
+    set_sqlite_pragmas(engine, "journal_mode = WAL")
+    Note.metadata.create_all(bind=engine, tables=SHARD_TABLES)
+    add_missing_columns(engine, SHARD_TABLES)
+    create_missing_indexes(engine, SHARD_TABLES)
+    _shard_meta.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            sqlite_insert(shard_meta)
+            .values(key="next_note_id", value=(index + 1) * SHARD_ID_SPAN)
+            .on_conflict_do_nothing()
+        )
+    return engine
+
+
+def init_note_id_counter(bind: Engine) -> None:
+    """Give an unsharded database the persistent note id counter shards have.
+
+    Without it SQLite hands out max(rowid) + 1, which reuses the ids of
+    deleted notes and collides with ids that live on in the archive.
+    """
+    _shard_meta.create_all(bind=bind)
+    with bind.begin() as conn:
+        used = max(
+            conn.execute(select(func.max(Note.id))).scalar() or 0,
+            conn.execute(select(func.max(ArchivedNote.note_id))).scalar() or 0,
+        )
+        conn.execute(
+            sqlite_insert(shard_meta)
+            .values(key="next_note_id", value=used)
+            .on_conflict_do_nothing()
+        )
+
+
+@event.listens_for(Note, "before_insert")
+def _allocate_note_id(mapper, connection, target) -> None:
+    if target.id is not None or not connection.get_execution_options().get("studynotes_note_ids"):
+        return
+    # Runs inside the inserting transaction, so the database's write lock makes
+    # the counter bump atomic across threads and processes.
+    target.id = connection.execute(
+        update(shard_meta)
+        .where(shard_meta.c.key == "next_note_id")
+        .values(value=shard_meta.c.value + 1)
+        .returning(shard_meta.c.value)
+    ).scalar_one()
+
+
+class ShardRouter:
+    def __init__(self, count: int = SHARD_COUNT, directory: str = SHARD_DIR) -> None:
+        if count < 1:
+            raise ValueError("ShardRouter needs at least one shard")
+        os.makedirs(directory, exist_ok=True)
+        self.count = count
+        self.directory = directory
+        self.engines = [open_shard_engine(directory, i) for i in range(count)]
+        self._factories = [
+            sessionmaker(bind=e, autoflush=False, autocommit=False) for e in self.engines
+        ]
+        self.read_engines = [
+            create_read_engine(f"sqlite:///file:{shard_path(directory, i)}?mode=ro&uri=true")
+            for i in range(count)
+        ]
+        self._read_factories = [
+            sessionmaker(bind=e, autoflush=False, autocommit=False) for e in self.read_engines
+        ]
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_pid = 0
+        self._writers: Dict[int, GroupCommitter] = {}
+        self._lock = threading.Lock()
+
+    def shard_for(self, owner_id: int) -> int:
+        return jump_hash(owner_id, self.count)
+
+    def session(self, index: int) -> Session:
+        return self._factories[index]()
+
+    def session_for(self, owner_id: int) -> Session:
+        return self.session(self.shard_for(owner_id))
+
+    def read_session(self, index: int) -> Session:
+        return self._read_factories[index]()
+
+    def writer_for(self, owner_id: int) -> GroupCommitter:
+        index = self.shard_for(owner_id)
+        with self._lock:
+            writer = self._writers.get(index)
+            if writer is None:
+                writer = self._writers[index] = GroupCommitter(self._factories[index])
+            return writer
+
+    def fan_out(self, fn: Callable[[Session], T]) -> List[T]:
+        # Fan-out is only used for reads, so it runs on read-only sessions.
+        def run(index: int) -> T:
+            db = self.read_session(index)
+            try:
+                return fn(db)
+            finally:
+                db.close()
+
+        return list(self._executor().map(run, range(self.count)))
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool_pid != os.getpid():
+                # Threads do not survive fork(): a pre-forked worker would
+                # inherit a pool whose workers are gone and wait forever.
+                self._pool = ThreadPoolExecutor(max_workers=self.count, thread_name_prefix="shard")
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def locate_note(self, note_id: int) -> Optional[int]:
+        # Archived notes are restored on access, so their stubs count too.
+        probe = union_all(
+            select(Note.id).where(Note.id == note_id),
+            select(ArchivedNote.note_id).where(ArchivedNote.note_id == note_id),
+        )
+        found = self.fan_out(lambda db: db.execute(probe).first() is not None)
+        return next((i for i, hit in enumerate(found) if hit), None)
+
+    def close(self) -> None:
+        for writer in self._writers.values():
+            writer.close()
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=True)
+        for engine in self.engines + self.read_engines:
+            engine.dispose()
+
+
+def _move_notes(src: Session, dst: Session, note_ids: List[int]) -> None:
+    notes = src.execute(select(Note).where(Note.id.in_(note_ids))).scalars().all()
+    existing = set(dst.execute(select(Note.id).where(Note.id.in_(note_ids))).scalars())
+    tags_by_note: Dict[int, List[str]] = {}
+    for note_id, name in src.execute(
+        select(NoteTag.note_id, Tag.name)
+        .join(Tag, Tag.id == NoteTag.tag_id)
+        .where(NoteTag.note_id.in_(note_ids))
+    ):
+        tags_by_note.setdefault(note_id, []).append(name)
+
+    tag_ids: Dict[str, int] = {}
+    for n in notes:
+        if n.id in existing:
+            continue  # copied by an interrupted earlier run
+        dst.add(
+            Note(
+                id=n.id,
+                title=n.title,
+                body=n.body,
+                owner_id=n.owner_id,
+                touched_at=n.touched_at,
+            )
+        )
+        dst.flush()
+        for name in tags_by_note.get(n.id, []):
+            if name not in tag_ids:
+                tag = dst.execute(select(Tag).where(Tag.name == name)).scalar_one_or_none()
+                if tag is None:
+                    # The owner's own tags were moved with created_by already.
+                    tag = Tag(name=name)
+                    dst.add(tag)
+                    dst.flush()
+                tag_ids[name] = tag.id
+            dst.add(NoteTag(note_id=n.id, tag_id=tag_ids[name]))
+    dst.commit()
+    # Only delete once the copy is durable; a crash in between leaves a
+    # duplicate that the next run skips and cleans up.
+    src.execute(delete(NoteTag).where(NoteTag.note_id.in_(note_ids)))
+    src.execute(delete(Note).where(Note.id.in_(note_ids)))
+    src.commit()
+
+
+def _move_owned_tags(src: Session, dst: Session, owner_id: int) -> None:
+    # The tag counter is measured from created_by next to the owner's notes.
+    names = src.execute(select(Tag.name).where(Tag.created_by == owner_id)).scalars().all()
+    if not names:
+        return
+    dst.execute(
+        sqlite_insert(Tag).on_conflict_do_nothing(index_elements=["name"]),
+        [{"name": name, "created_by": owner_id} for name in names],
+    )
+    dst.execute(
+        update(Tag).where(Tag.name.in_(names), Tag.created_by.is_(None)).values(created_by=owner_id)
+    )
+    dst.commit()
+    # Other notes on the source may still use these tags; only ownership leaves.
+    src.execute(update(Tag).where(Tag.created_by == owner_id).values(created_by=None))
+    src.commit()
+
+
+def _move_idempotency_keys(src: Session, dst: Session, owner_id: int) -> None:
+    # A retry after the move must still find the stored response.
+    keys = src.execute(select(IdempotencyKey).where(IdempotencyKey.user_id == owner_id)).scalars()
+    rows = [
+        {c.key: getattr(k, c.key) for c in IdempotencyKey.__table__.columns if c.key != "id"}
+        for k in keys
+    ]
+    if not rows:
+        return
+    dst.execute(sqlite_insert(IdempotencyKey).on_conflict_do_nothing(), rows)
+    dst.commit()
+    src.execute(delete(IdempotencyKey).where(IdempotencyKey.user_id == owner_id))
+    src.commit()
+
+
+def _move_archive_stubs(src: Session, dst: Session, owner_id: int) -> int:
+    # Segment files are shared by every database; only the stubs move.
+    stubs = src.execute(select(ArchivedNote).where(ArchivedNote.owner_id == owner_id)).scalars()
+    rows = [{c.key: getattr(stub, c.key) for c in ArchivedNote.__table__.columns} for stub in stubs]
+    if not rows:
+        return 0
+    dst.execute(sqlite_insert(ArchivedNote).on_conflict_do_nothing(), rows)
+    dst.commit()
+    src.execute(delete(ArchivedNote).where(ArchivedNote.owner_id == owner_id))
+    src.commit()
+    return len(rows)
+
+
+def rebalance(router: ShardRouter, include_main: bool = True, chunk: int = 500) -> Dict[str, int]:
+    """Move every note to the shard its owner hashes to under ``router``.
+
+    Sources are the unsharded database and every shard file in the shard
+    directory, including files left over from a larger shard count.
+    """
+    sources: List[tuple[str, sessionmaker, Optional[Engine]]] = []
+    if include_main:
+        sources.append(("main", SessionLocal, None))
+    for path in sorted(glob.glob(os.path.join(router.directory, "notes-*.db"))):
+        match = _SHARD_FILE.search(path)
+        if not match:
+            continue
+        index = int(match.group(1))
+        if index < router.count:
+            sources.append((f"shard-{index}", router._factories[index], None))
+        else:
+            engine = open_shard_engine(router.directory, index)
+            sources.append((f"shard-{index}", sessionmaker(bind=engine), engine))
+
+    moved: Dict[str, int] = {}
+    for name, factory, engine in sources:
+        src = factory()
+        current = int(name.split("-")[1]) if name.startswith("shard-") else None
+        try:
+            owners = (
+                src.execute(select(Note.owner_id).union(select(ArchivedNote.owner_id)))
+                .scalars()
+                .all()
+            )
+            for owner_id in owners:
+                target = router.shard_for(owner_id)
+                if target == current:
+                    continue
+                ids = src.execute(select(Note.id).where(Note.owner_id == owner_id)).scalars().all()
+                dst = router.session(target)
+                try:
+                    _move_owned_tags(src, dst, owner_id)
+                    for start in range(0, len(ids), chunk):
+                        _move_notes(src, dst, ids[start : start + chunk])
+                    _move_archive_stubs(src, dst, owner_id)
+                    _move_idempotency_keys(src, dst, owner_id)
+                    # Counters are seeded again from the moved rows on the next write.
+                    for session in (src, dst):
+                        session.execute(delete(UserUsage).where(UserUsage.user_id == owner_id))
+                        session.commit()
+                finally:
+                    dst.close()
+                moved[name] = moved.get(name, 0) + len(ids)
+        finally:
+            src.close()
+            if engine is not None:
+                engine.dispose()
+    return moved
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m studynotes.sharding")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rb = sub.add_parser("rebalance", help="move notes into the shards their owners hash to")
+    rb.add_argument("--shards", type=int, default=SHARD_COUNT or None, required=not SHARD_COUNT)
+    rb.add_argument("--dir", default=SHARD_DIR)
+    rb.add_argument("--skip-main", action="store_true", help="do not migrate the unsharded DB")
+    rb.add_argument("--chunk", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    router = ShardRouter(args.shards, args.dir)
+    try:
+        moved = rebalance(router, include_main=not args.skip_main, chunk=args.chunk)
+    finally:
+        router.close()
+    for source, count in sorted(moved.items()):
+        print(f"{source}: moved {count} notes")
+    print(f"done, {sum(moved.values())} notes moved into {args.shards} shards")
+
+
+shard_router: Optional[ShardRouter] = ShardRouter() if SHARD_COUNT > 0 else None
+
+
+if __name__ == "__main__":
+    main()
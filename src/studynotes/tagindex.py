@@ -0,0 +1,103 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+_MAX_CHAR = chr(0x10FFFF)
+
+
+class TagPrefixIndex:
+    """In-memory autocomplete index over tag names, ranked by usage.
+
+    Names are kept in a casefolded sorted array, so a prefix is two bisects.
+    Short prefixes match huge ranges; for those the top ``top_k`` tags are
+    computed once and cached until a tag under that prefix changes.
+    """
+
+    def __init__(self, top_k: int = 20, scan_limit: int = 2000) -> None:
+        self.top_k = top_k
+        self.scan_limit = scan_limit
+        self._lock = threading.Lock()
+        self._keys: List[Tuple[str, str]] = []
+        self._usage: Dict[str, int] = {}
+        self._top: Dict[str, List[Tuple[str, str]]] = {}
+        self._loader: Optional[Callable[[], Iterable[Tuple[str, int]]]] = None
+        self._relay: Optional[Callable[[str, Dict[str, Any]], None]] = None
+        self.loaded = False
+
+    def load(self, rows: Iterable[Tuple[str, int]]) -> None:
+        usage: Dict[str, int] = {}
+        for name, count in rows:
+            usage[name] = usage.get(name, 0) + count
+        keys = sorted((name.casefold(), name) for name in usage)
+        with self._lock:
+            self._usage = usage
+            self._keys = keys
+            self._top = {}
+            self.loaded = True
+
+    def ensure_loaded(self, loader: Callable[[], Iterable[Tuple[str, int]]]) -> None:
+        self._loader = loader
+        if not self.loaded:
+            self.load(loader())
+
+    def refresh(self, rows: Iterable[Tuple[str, int]]) -> None:
+        """Load a fresh recount here and have every other process reload too."""
+        self.load(rows)
+        if self._relay is not None:
+            self._relay("reload", {})
+
+    def relay_through(self, send: Callable[[str, Dict[str, Any]], None]) -> None:
+        """Also hand every update to ``send``.
+
+        Used when several processes serve the API: updates apply here at
+        once and reach the other processes' indexes through ``apply``.
+        """
+        self._relay = send
+
+    def apply(self, op: str, data: Dict[str, Any]) -> None:
+        """Apply an update relayed from another process."""
+        if op == "add":
+            self._add(data["name"], data["delta"])
+        elif op == "reload" and self._loader is not None:
+            self.load(self._loader())
+
+    def add(self, name: str, delta: int = 0) -> None:
+        self._add(name, delta)
+        if self._relay is not None:
+            self._relay("add", {"name": name, "delta": delta})
+
+    def _add(self, name: str, delta: int) -> None:
+        with self._lock:
+            if not self.loaded:
+                return  # the initial load will see this tag
+            key = (name.casefold(), name)
+            if name not in self._usage:
+                self._usage[name] = 0
+                insort(self._keys, key)
+            self._usage[name] = max(0, self._usage[name] + delta)
+            for i in range(1, len(key[0]) + 1):
+                self._top.pop(key[0][:i], None)
+
+    def suggest(self, prefix: str, limit: int) -> List[Tuple[str, int]]:
+        p = prefix.casefold()
+        with self._lock:
+            lo = bisect_left(self._keys, (p,))
+            hi = bisect_left(self._keys, (p + _MAX_CHAR,))
+            if hi - lo <= self.scan_limit:
+                best = self._rank(self._keys[lo:hi], limit)
+            else:
+                best = self._top.get(p)
+                if best is None:
+                    best = self._top[p] = self._rank(self._keys[lo:hi], self.top_k)
+            return [(name, self._usage[name]) for _, name in best[:limit]]
+
+    def usage(self, name: str) -> Optional[int]:
+        with self._lock:
+            return self._usage.get(name)
+
+    def _rank(self, keys: List[Tuple[str, str]], n: int) -> List[Tuple[str, str]]:
+        return heapq.nsmallest(n, keys, key=lambda k: (-self._usage[k[1]], k[1]))
+
+
+tag_index = TagPrefixIndex()
@@ -0,0 +1,236 @@
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, delete, inspect, select, text, update
+from sqlalchemy.orm import sessionmaker
+
+from studynotes.archive import ArchiveStore, SegmentWriter, TouchTracker, archive_store
+from studynotes.cache import note_cache
+from studynotes.database import Base, SessionLocal, add_missing_columns
+from studynotes.main import app
+from studynotes.models import ArchivedNote, Note, NoteTag, Tag
+from studynotes.quotas import usage_for
+
+client = TestClient(app)
+
+
+def register_and_login(email: str) -> dict:
+    password = "Password123"
+    r = client.post("/api/v1/auth/register", json={"email": email, "password": password})
+    assert r.status_code in (200, 400)
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": password})
+    assert r.status_code == 200
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'notes.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def app_archive(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_store, "directory", str(tmp_path / "archive"))
+    note_cache.clear()
+    yield archive_store
+    note_cache.clear()
+
+
+def _add_notes(db, count, touched_at, tags=("a",)):
+    tag_rows = [Tag(name=name) for name in tags]
+    db.add_all(tag_rows)
+    notes = [
+        Note(title=f"n{i}", body="x" * 200, owner_id=1, touched_at=touched_at) for i in range(count)
+    ]
+    db.add_all(notes)
+    db.flush()
+    db.add_all(NoteTag(note_id=n.id, tag_id=t.id) for n in notes for t in tag_rows)
+    db.commit()
+    return [n.id for n in notes]
+
+
+def test_archive_moves_inactive_notes_into_segments(db, tmp_path):
+    store = ArchiveStore(str(tmp_path / "segments"))
+    old = _add_notes(db, 20, touched_at=1_000)
+    fresh = _add_notes(db, 3, touched_at=10_000, tags=("b",))
+
+    assert store.archive(db, "test", older_than=5_000, now=10_000, batch=7) == 20
+    assert db.execute(select(Note.id)).scalars().all() == fresh
+    assert not db.execute(select(NoteTag).where(NoteTag.note_id.in_(old))).first()
+    record = store.get(db, old[3])
+    assert record == {"id": old[3], "title": "n3", "body": "x" * 200, "owner_id": 1, "tags": ["a"]}
+    assert [r["id"] for r in store.scan(db, owner_id=1)] == sorted(old, reverse=True)
+    assert store.get(db, fresh[0]) is None
+
+
+def test_note_edited_during_archiving_stays_live(db, tmp_path, monkeypatch):
+    store = ArchiveStore(str(tmp_path / "segments"))
+    ids = _add_notes(db, 3, touched_at=1)
+    other = sessionmaker(bind=db.get_bind())()
+    sync = SegmentWriter.sync
+
+    def edit_then_sync(writer):
+        # Commits between the batch being read and its DELETE.
+        other.execute(update(Note).where(Note.id == ids[1]).values(title="edited", touched_at=9))
+        other.commit()
+        sync(writer)
+
+    monkeypatch.setattr(SegmentWriter, "sync", edit_then_sync)
+    assert store.archive(db, "test", older_than=5, now=10) == 2
+    other.close()
+    assert db.get(Note, ids[1]).title == "edited"
+    assert store.get(db, ids[1]) is None
+    assert sorted(db.execute(select(ArchivedNote.note_id)).scalars()) == [ids[0], ids[2]]
+
+
+def test_segments_roll_over_and_restore_brings_note_back(db, tmp_path):
+    store = ArchiveStore(str(tmp_path / "segments"), segment_max_bytes=0)
+    ids = _add_notes(db, 4, touched_at=1, tags=("a", "b"))
+    assert store.archive(db, "test", older_than=0) == 4
+    segments = {s.segment for s in db.execute(select(ArchivedNote)).scalars()}
+    assert len(segments) == 4
+
+    note = store.restore(db, ids[0])
+    db.commit()
+    assert note.id == ids[0] and sorted(nt.tag.name for nt in note.tags) == ["a", "b"]
+    assert db.get(ArchivedNote, ids[0]) is None
+
+
+def test_restore_recreates_missing_tags_for_the_owner(db, tmp_path):
+    store = ArchiveStore(str(tmp_path / "segments"))
+    ids = _add_notes(db, 1, touched_at=1, tags=("gone",))
+    assert store.archive(db, "test", older_than=0) == 1
+    db.execute(delete(Tag))
+    db.commit()
+
+    note = store.restore(db, ids[0])
+    db.commit()
+    assert [(nt.tag.name, nt.tag.created_by) for nt in note.tags] == [("gone", 1)]
+    assert usage_for(db, 1)["tags"] == 1
+
+
+def test_archiving_updates_tag_suggestions(app_archive):
+    headers = register_and_login(f"archive-{uuid4().hex[:8]}@example.com")
+    tag = f"archsug-{uuid4().hex[:6]}"
+
+    def usage():
+        r = client.get("/api/v1/tags/suggest", headers=headers, params={"prefix": tag})
+        return r.json()[0]["usage"]
+
+    client.get("/api/v1/tags/suggest", headers=headers, params={"prefix": tag})
+    ids = [
+        client.post(
+            "/api/v1/notes", headers=headers, json={"title": "t", "body": "b", "tags": [tag]}
+        ).json()["id"]
+        for _ in range(3)
+    ]
+    db = SessionLocal()
+    db.execute(update(Note).where(Note.id.in_(ids[:2])).values(touched_at=1))
+    db.commit()
+    app_archive.archive(db, "app", older_than=3600)
+    db.close()
+    assert usage() == 1
+
+    client.patch(f"/api/v1/notes/{ids[0]}", headers=headers, json={"title": "back"})
+    assert usage() == 2
+    client.delete(f"/api/v1/notes/{ids[1]}", headers=headers)
+    assert usage() == 2
+
+
+def test_archived_notes_are_served_transparently(app_archive):
+    headers = register_and_login(f"archive-{uuid4().hex[:8]}@example.com")
+    tag = f"arch-{uuid4().hex[:6]}"
+    ids = [
+        client.post(
+            "/api/v1/notes", headers=headers, json={"title": f"t{i}", "body": "b", "tags": [tag]}
+        ).json()["id"]
+        for i in range(4)
+    ]
+    db = SessionLocal()
+    db.execute(update(Note).where(Note.id.in_(ids[:2])).values(touched_at=1))
+    db.commit()
+    assert app_archive.archive(db, "app", older_than=3600) >= 2
+    db.close()
+
+    assert client.get(f"/api/v1/notes/{ids[0]}", headers=headers).json()["title"] == "t0"
+    live = client.get("/api/v1/notes", headers=headers, params={"tag": tag}).json()
+    assert [n["id"] for n in live] == ids[:1:-1]
+    everything = client.get(
+        "/api/v1/notes",
+        headers=headers,
+        params={"tag": tag, "include_archived": "true", "fields": "id,tags", "limit": 3},
+    ).json()
+    assert everything == [{"id": i, "tags": [tag]} for i in ids[:0:-1]]
+
+    r = client.patch(f"/api/v1/notes/{ids[1]}", headers=headers, json={"title": "back"})
+    assert r.status_code == 200 and r.json()["tags"] == [tag]
+    assert client.delete(f"/api/v1/notes/{ids[0]}", headers=headers).status_code == 204
+    live = client.get("/api/v1/notes", headers=headers, params={"tag": tag}).json()
+    assert [n["id"] for n in live] == ids[:0:-1]
+    assert client.get(f"/api/v1/notes/{ids[0]}", headers=headers).status_code == 404
+
+
+def test_ids_of_archived_notes_are_never_reused(app_archive):
+    headers = register_and_login(f"archive-{uuid4().hex[:8]}@example.com")
+    ids = [
+        client.post("/api/v1/notes", headers=headers, json={"title": f"r{i}", "body": "b"}).json()[
+            "id"
+        ]
+        for i in range(3)
+    ]
+    db = SessionLocal()
+    db.execute(update(Note).where(Note.id.in_(ids)).values(touched_at=1))
+    db.commit()
+    app_archive.archive(db, "app", older_than=3600)
+    db.close()
+
+    assert client.delete(f"/api/v1/notes/{ids[2]}", headers=headers).status_code == 204
+    r = client.post("/api/v1/notes", headers=headers, json={"title": "new", "body": "b"})
+    assert r.json()["id"] > ids[2]
+    assert client.get(f"/api/v1/notes/{ids[0]}", headers=headers).json()["title"] == "r0"
+
+
+def test_archived_notes_stay_private(app_archive):
+    owner = register_and_login(f"archive-{uuid4().hex[:8]}@example.com")
+    other = register_and_login(f"archive-{uuid4().hex[:8]}@example.com")
+    ids = [
+        client.post("/api/v1/notes", headers=owner, json={"title": "p", "body": "b"}).json()["id"]
+        for _ in range(2)
+    ]
+    db = SessionLocal()
+    db.execute(update(Note).where(Note.id == ids[0]).values(touched_at=1))
+    db.commit()
+    app_archive.archive(db, "app", older_than=3600)
+    db.close()
+    assert client.get(f"/api/v1/notes/{ids[0]}", headers=other).status_code == 404
+    r = client.get("/api/v1/notes", headers=other, params={"include_archived": "true"})
+    assert ids[0] not in [n["id"] for n in r.json()]
+
+
+def test_touch_tracker_flushes_reads_in_one_batch(monkeypatch, db):
+    ids = _add_notes(db, 3, touched_at=1)
+    factory = sessionmaker(bind=db.get_bind())
+    monkeypatch.setattr("studynotes.archive._session_factories", lambda: {"test": factory})
+    tracker = TouchTracker(flush_interval=0)
+    tracker.touch(ids[0])
+    tracker.touch(ids[2])
+    assert tracker.flush_due()
+    assert tracker.flush() == 2
+    db.expire_all()
+    touched = dict(db.execute(select(Note.id, Note.touched_at)).all())
+    assert touched[ids[1]] == 1
+    assert touched[ids[0]] > 1 and touched[ids[2]] > 1
+
+
+def test_add_missing_columns(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE notes (id INTEGER PRIMARY KEY, title VARCHAR(255))"))
+    add_missing_columns(engine, [Note.__table__])
+    columns = {c["name"] for c in inspect(engine).get_columns("notes")}
+    assert "touched_at" in columns
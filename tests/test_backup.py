@@ -0,0 +1,125 @@
+import gzip
+import sqlite3
+import threading
+import time
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+
+from studynotes.backup import BackupRunner, backup_engine
+from studynotes.database import SessionLocal, set_sqlite_pragmas
+from studynotes.main import app
+from studynotes.models import User
+
+client = TestClient(app)
+
+
+def register_and_login(email: str, admin: bool = False) -> dict:
+    password = "Password123"
+    client.post("/api/v1/auth/register", json={"email": email, "password": password})
+    if admin:
+        db = SessionLocal()
+        db.execute(select(User).where(User.email == email)).scalar_one().role = "admin"
+        db.commit()
+        db.close()
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": password})
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "src.db"
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    set_sqlite_pragmas(engine, "journal_mode = WAL")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE t (id INTEGER PRIMARY KEY, x TEXT)")
+        conn.exec_driver_sql(
+            "WITH RECURSIVE s(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM s WHERE n < 4000) "
+            "INSERT INTO t (x) SELECT printf('%0500d', n) FROM s"
+        )
+    yield engine
+    engine.dispose()
+
+
+def _rows(path) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("PRAGMA integrity_check").fetchone() == ("ok",)
+        return conn.execute("SELECT count(*) FROM t").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_backup_is_consistent_while_writers_commit(source, tmp_path):
+    stop = threading.Event()
+    writes = []
+
+    def writer():
+        while not stop.is_set():
+            with source.begin() as conn:
+                conn.exec_driver_sql("INSERT INTO t (x) VALUES ('w')")
+            writes.append(1)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        result = backup_engine(
+            source, str(tmp_path / "out.db"), pages_per_step=16, step_sleep=0.001
+        )
+    finally:
+        stop.set()
+        thread.join()
+    assert writes, "writers must not be blocked by the backup"
+    assert result.pages > 16
+    assert _rows(result.path) >= 4000
+
+
+def test_backup_is_throttled(source, tmp_path):
+    with source.connect() as conn:
+        size = conn.exec_driver_sql("PRAGMA page_count").scalar() * 4096
+    t0 = time.monotonic()
+    backup_engine(source, str(tmp_path / "out.db"), pages_per_step=32, max_bytes_per_sec=size * 4)
+    # Roughly a quarter of a second for the whole file at 4x its size per second.
+    assert time.monotonic() - t0 >= 0.15
+
+
+def test_compressed_backup(source, tmp_path):
+    result = backup_engine(source, str(tmp_path / "out.db.gz"), compress=True)
+    assert result.compressed
+    restored = tmp_path / "restored.db"
+    with gzip.open(result.path) as f_in:
+        restored.write_bytes(f_in.read())
+    assert _rows(restored) == 4000
+    assert not (tmp_path / "out.db.gz.part").exists()
+
+
+def test_backup_runners_share_state_through_the_directory(tmp_path):
+    # Separate runners stand in for the runners of separate worker processes.
+    first, second = BackupRunner(str(tmp_path)), BackupRunner(str(tmp_path))
+    assert second.status() == {"running": False, "last": None}
+    assert first.try_start()
+    assert not second.try_start()
+    assert second.status()["running"] is True
+    first.run()
+    status = second.status()
+    assert status["running"] is False and status["last"]["ok"] is True
+    assert second.try_start()
+    second.run()
+
+
+def test_admin_backup_endpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr("studynotes.backup.BACKUP_DIR", str(tmp_path))
+    user = register_and_login(f"backup-{uuid4().hex[:8]}@example.com")
+    assert client.post("/api/v1/admin/backups", headers=user).status_code == 403
+
+    admin = register_and_login(f"backup-{uuid4().hex[:8]}@example.com", admin=True)
+    r = client.post("/api/v1/admin/backups", headers=admin, params={"compress": "true"})
+    assert r.status_code == 202
+    status = client.get("/api/v1/admin/backups", headers=admin).json()
+    assert status["running"] is False
+    assert status["last"]["ok"] is True
+    (app_copy,) = status["last"]["files"]
+    assert app_copy["name"] == "app" and app_copy["compressed"]
+    assert app_copy["path"].startswith(str(tmp_path))
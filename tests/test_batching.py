@@ -0,0 +1,93 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from studynotes.batching import GroupCommitter
+from studynotes.database import Base
+from studynotes.main import app
+from studynotes.models import Tag
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def factory(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'batch.db'}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+
+def _add_tag(name):
+    def write(db):
+        tag = Tag(name=name)
+        db.add(tag)
+        db.flush()
+        return tag.id
+
+    return write
+
+
+def test_concurrent_writes_share_commits(factory):
+    committer = GroupCommitter(factory, max_batch=16, max_wait=0.01)
+    gate = threading.Barrier(16)
+
+    def submit(i):
+        gate.wait()
+        return committer.submit(_add_tag(f"tag-{i}"))
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        ids = list(pool.map(submit, range(16)))
+    committer.close()
+
+    assert len(set(ids)) == 16
+    assert committer.writes == 16
+    assert committer.commits < 16
+    db = factory()
+    assert db.query(Tag).count() == 16
+    db.close()
+
+
+def test_failing_write_only_fails_its_caller(factory):
+    committer = GroupCommitter(factory, max_batch=8, max_wait=0.05)
+    gate = threading.Barrier(3)
+    names = ["dup", "dup", "unique"]
+
+    def submit(name):
+        gate.wait()
+        try:
+            return committer.submit(_add_tag(name))
+        except Exception as exc:
+            return exc
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        results = list(pool.map(submit, names))
+    committer.close()
+
+    assert sum(isinstance(r, Exception) for r in results) == 1
+    db = factory()
+    assert sorted(t.name for t in db.query(Tag)) == ["dup", "unique"]
+    db.close()
+
+
+def test_create_note_in_batching_mode(monkeypatch):
+    monkeypatch.setattr("studynotes.main.NOTE_WRITE_BATCHING", True)
+    email = f"batch-{uuid4().hex[:8]}@example.com"
+    client.post("/api/v1/auth/register", json={"email": email, "password": "Password123"})
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": "Password123"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    r = client.post(
+        "/api/v1/notes", headers=headers, json={"title": "t", "body": "b", "tags": ["batched"]}
+    )
+    assert r.status_code == 200
+    note = r.json()
+    assert note["tags"] == ["batched"]
+    r = client.get(f"/api/v1/notes/{note['id']}", headers=headers)
+    assert r.json()["tags"] == ["batched"]
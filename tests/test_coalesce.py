@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from studynotes.cache import SharedCounters
+from studynotes.coalesce import SingleFlight, list_coalescer
+from studynotes.database import SessionLocal
+from studynotes.main import app
+from studynotes.models import User
+
+client = TestClient(app)
+
+
+def register_and_login(email: str) -> dict:
+    password = "Password123"
+    r = client.post("/api/v1/auth/register", json={"email": email, "password": password})
+    assert r.status_code in (200, 400)
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": password})
+    assert r.status_code == 200
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    sf = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return b"result"
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(sf.do, (1, "q"), slow) for _ in range(8)]
+        while sf.stats()["coalesced"] < 7:
+            time.sleep(0.001)
+        release.set()
+        assert {f.result() for f in futures} == {b"result"}
+    assert len(calls) == 1
+    assert sf.stats()["executions"] == 1
+
+
+def test_errors_propagate_and_are_not_cached():
+    sf = SingleFlight(window=60)
+
+    def boom():
+        raise ValueError("db down")
+
+    with pytest.raises(ValueError):
+        sf.do((1,), boom)
+    assert sf.do((1,), lambda: "ok") == "ok"
+
+
+def test_window_reuses_result_until_forgotten():
+    sf = SingleFlight(window=60)
+    assert sf.do((1, "a"), lambda: "first") == "first"
+    assert sf.do((1, "a"), lambda: "second") == "first"
+    assert sf.stats()["window_hits"] == 1
+    sf.forget(1)
+    assert sf.do((1, "a"), lambda: "third") == "third"
+
+
+def test_window_disabled_runs_each_call():
+    sf = SingleFlight(window=0)
+    assert sf.do((1,), lambda: "a") == "a"
+    assert sf.do((1,), lambda: "b") == "b"
+
+
+def test_forget_reaches_other_processes_through_shared_versions():
+    sf = SingleFlight(window=60)
+    sf.share_versions(SharedCounters(slots=64))
+    assert sf.do((1, "a"), lambda: "old") == "old"
+    assert sf.do((2, "a"), lambda: "other") == "other"
+    pid = os.fork()
+    if pid == 0:
+        sf.forget(1)
+        os._exit(0)
+    assert os.waitpid(pid, 0)[1] == 0
+    assert sf.do((1, "a"), lambda: "new") == "new"
+    assert sf.do((2, "a"), lambda: "recomputed") == "other"
+
+
+def test_list_sees_own_writes_with_micro_cache(monkeypatch):
+    monkeypatch.setattr(list_coalescer, "window", 60)
+    headers = register_and_login(f"coalesce-{uuid4().hex[:8]}@example.com")
+    assert client.get("/api/v1/notes", headers=headers).json() == []
+    client.post("/api/v1/notes", headers=headers, json={"title": "fresh", "body": "b"})
+    items = client.get("/api/v1/notes", headers=headers).json()
+    assert [n["title"] for n in items] == ["fresh"]
+
+
+def test_admin_list_sees_other_users_writes_with_micro_cache(monkeypatch):
+    monkeypatch.setattr(list_coalescer, "window", 60)
+    email = f"coalesce-admin-{uuid4().hex[:8]}@example.com"
+    admin = register_and_login(email)
+    db = SessionLocal()
+    db.execute(update(User).where(User.email == email).values(role="admin"))
+    db.commit()
+    db.close()
+    headers = register_and_login(f"coalesce-{uuid4().hex[:8]}@example.com")
+    params = {"q": f"marker-{uuid4().hex[:8]}"}
+    assert client.get("/api/v1/notes", headers=admin, params=params).json() == []
+    r = client.post("/api/v1/notes", headers=headers, json={"title": params["q"], "body": "b"})
+    note_id = r.json()["id"]
+    items = client.get("/api/v1/notes", headers=admin, params=params).json()
+    assert [n["id"] for n in items] == [note_id]
+    client.delete(f"/api/v1/notes/{note_id}", headers=headers)
+    assert client.get("/api/v1/notes", headers=admin, params=params).json() == []
@@ -0,0 +1,112 @@
+import asyncio
+import zlib
+
+from fastapi.testclient import TestClient
+
+from studynotes.compression import CompressionMiddleware, negotiate_encoding
+from studynotes.main import app
+
+client = TestClient(app)
+
+
+def _run(app, headers):
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+def _ndjson_app(chunks):
+    async def inner(scope, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/x-ndjson")],
+            }
+        )
+        for i, chunk in enumerate(chunks):
+            await send(
+                {"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1}
+            )
+
+    return inner
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip, deflate", ["br", "gzip"]) == "gzip"
+    assert negotiate_encoding("br;q=0.5, gzip", ["br", "gzip"]) == "gzip"
+    assert negotiate_encoding("gzip;q=0", ["gzip"]) is None
+    assert negotiate_encoding("*", ["br", "gzip"]) == "br"
+    assert negotiate_encoding("", ["gzip"]) is None
+
+
+def test_small_json_not_compressed():
+    r = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert "content-encoding" not in r.headers
+
+
+def test_streaming_ndjson_is_flushed_per_chunk():
+    chunks = [b'{"id":%d,"body":"%s"}\n' % (i, b"x" * 600) for i in range(4)]
+    mw = CompressionMiddleware(_ndjson_app(chunks), minimum_size=1000, encodings=["gzip"])
+    sent = _run(mw, {"accept-encoding": "gzip"})
+
+    start = sent[0]
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+
+    d = zlib.decompressobj(31)
+    bodies = [m["body"] for m in sent[1:]]
+    # First two chunks are buffered to reach the threshold, then one per chunk.
+    assert len(bodies) == 3
+    assert d.decompress(bodies[0]) == b"".join(chunks[:2])
+    assert d.decompress(bodies[1]) == chunks[2]
+    assert d.decompress(bodies[2]) + d.flush() == chunks[3]
+
+
+def test_non_compressible_type_passes_through():
+    async def inner(scope, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/event-stream")],
+            }
+        )
+        await send({"type": "http.response.body", "body": b"x" * 5000})
+
+    sent = _run(CompressionMiddleware(inner, minimum_size=10), {"accept-encoding": "gzip"})
+    assert b"content-encoding" not in dict(sent[0]["headers"])
+    assert sent[1]["body"] == b"x" * 5000
+
+
+def test_large_note_list_compressed():
+    r = client.post(
+        "/api/v1/auth/register", json={"email": "gzip@example.com", "password": "password123"}
+    )
+    r = client.post(
+        "/api/v1/auth/login", json={"email": "gzip@example.com", "password": "password123"}
+    )
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    for _ in range(3):
+        client.post("/api/v1/notes", headers=headers, json={"title": "t", "body": "a" * 800})
+
+    r = client.get("/api/v1/notes", headers={**headers, "Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in r.headers["vary"]
+    assert len(r.json()) >= 3
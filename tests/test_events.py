@@ -0,0 +1,136 @@
+import asyncio
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+
+from studynotes.events import NoteEventBroker, parse_last_event_id, sse_stream
+from studynotes.main import app
+
+client = TestClient(app)
+
+
+def register_and_login(email: str) -> dict:
+    password = "Password123"
+    r = client.post("/api/v1/auth/register", json={"email": email, "password": password})
+    assert r.status_code in (200, 400)
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": password})
+    assert r.status_code == 200
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+async def _never_disconnected() -> bool:
+    return False
+
+
+async def _collect(gen, n: int) -> list[str]:
+    out = []
+    async for chunk in gen:
+        out.append(chunk)
+        if len(out) == n:
+            break
+    await gen.aclose()
+    return out
+
+
+def test_events_require_auth():
+    r = client.get("/api/v1/notes/events")
+    assert r.status_code == 401
+
+
+def test_publish_fans_out_only_to_owner():
+    async def scenario():
+        b = NoteEventBroker()
+        mine = b.subscribe(1)
+        other = b.subscribe(2)
+        b.publish(1, "note.created", {"id": 10})
+        await asyncio.sleep(0)
+        assert (await mine.queue.get()).data == {"id": 10}
+        assert other.queue.empty()
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_is_closed_on_overflow():
+    async def scenario():
+        b = NoteEventBroker(buffer_size=2)
+        sub = b.subscribe(1)
+        for i in range(3):
+            b.publish(1, "note.updated", {"id": i})
+        await asyncio.sleep(0)
+        assert sub.closed
+        assert await sub.queue.get() is None
+
+    asyncio.run(scenario())
+
+
+def test_stream_resumes_from_last_event_id():
+    async def scenario():
+        b = NoteEventBroker()
+        first = b.publish(1, "note.created", {"id": 1})
+        b.publish(2, "note.created", {"id": 2})
+        b.publish(1, "note.deleted", {"id": 1})
+        chunks = await _collect(sse_stream(b, 1, first.id, _never_disconnected), 2)
+        assert chunks[0].startswith("retry:")
+        assert chunks[1] == 'id: 3\nevent: note.deleted\ndata: {"id":1}\n\n'
+        assert b.subscriber_count() == 0
+
+    asyncio.run(scenario())
+
+
+def test_stream_reports_gap_and_heartbeats():
+    async def scenario():
+        b = NoteEventBroker(history_size=1)
+        b.publish(1, "note.created", {"id": 1})
+        b.publish(1, "note.created", {"id": 2})
+        chunks = await _collect(sse_stream(b, 1, 0, _never_disconnected, heartbeat=0.01), 3)
+        assert chunks[1].startswith("event: reset")
+        assert chunks[2] == ": keep-alive\n\n"
+
+    asyncio.run(scenario())
+
+
+def test_parse_last_event_id():
+    assert parse_last_event_id(None) is None
+    assert parse_last_event_id(" 42 ") == 42
+    assert parse_last_event_id("abc") is None
+    assert parse_last_event_id("-1") is None
+
+
+def test_write_handlers_publish_events():
+    from studynotes.events import broker
+
+    headers = register_and_login(f"sse-{uuid4().hex[:8]}@example.com")
+    r = client.post("/api/v1/notes", headers=headers, json={"title": "t", "body": "b"})
+    assert r.status_code == 200
+    note = r.json()
+    client.patch(f"/api/v1/notes/{note['id']}", headers=headers, json={"title": "t2"})
+    client.delete(f"/api/v1/notes/{note['id']}", headers=headers)
+
+    async def scenario():
+        sub = broker.subscribe(note["owner_id"], 0)
+        broker.unsubscribe(sub)
+        return [(e.kind, e.data["id"]) for e in sub.backlog if e.data["id"] == note["id"]]
+
+    assert asyncio.run(scenario()) == [
+        ("note.created", note["id"]),
+        ("note.updated", note["id"]),
+        ("note.deleted", note["id"]),
+    ]
+
+
+def test_relayed_broker_delivers_only_numbered_events():
+    async def scenario():
+        b = NoteEventBroker()
+        sent = []
+        b.relay_through(lambda owner_id, kind, data: sent.append((owner_id, kind, data)))
+        assert b.publish(1, "note.created", {"id": 1}) is None
+        assert sent == [(1, "note.created", {"id": 1})]
+        sub = b.subscribe(1)
+        b.deliver(7, 1, "note.created", {"id": 1})
+        b.deliver(8, 1, "note.updated", {"id": 1})
+        await asyncio.sleep(0)
+        assert [(await sub.queue.get()).id for _ in range(2)] == [7, 8]
+        chunks = await _collect(sse_stream(b, 1, 7, _never_disconnected), 2)
+        assert chunks[1].startswith("id: 8\n")
+
+    asyncio.run(scenario())
@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from studynotes.database import Base, SessionLocal
+from studynotes.idempotency import IdempotencyStore, KeyReuseError
+from studynotes.main import app
+from studynotes.models import IdempotencyKey, Note
+
+client = TestClient(app)
+
+
+def register_and_login(email: str) -> dict:
+    password = "Password123"
+    r = client.post("/api/v1/auth/register", json={"email": email, "password": password})
+    assert r.status_code in (200, 400)
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": password})
+    assert r.status_code == 200
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def _count_notes(title: str) -> int:
+    db = SessionLocal()
+    try:
+        return db.execute(select(func.count()).where(Note.title == title)).scalar_one()
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'keys.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+
+def test_retry_returns_original_response():
+    headers = register_and_login(f"idem-{uuid4().hex[:8]}@example.com")
+    title = f"idem-{uuid4().hex}"
+    h = {**headers, "Idempotency-Key": uuid4().hex}
+    payload = {"title": title, "body": "x", "tags": ["idem"]}
+    first = client.post("/api/v1/notes", headers=h, json=payload)
+    second = client.post("/api/v1/notes", headers=h, json=payload)
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert _count_notes(title) == 1
+
+
+def test_concurrent_retries_create_one_note():
+    headers = register_and_login(f"idem-{uuid4().hex[:8]}@example.com")
+    title = f"idem-{uuid4().hex}"
+    h = {**headers, "Idempotency-Key": uuid4().hex}
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(
+            pool.map(
+                lambda _: client.post(
+                    "/api/v1/notes", headers=h, json={"title": title, "body": "x"}
+                ),
+                range(8),
+            )
+        )
+    assert {r.status_code for r in responses} == {200}
+    assert len({r.json()["id"] for r in responses}) == 1
+    assert _count_notes(title) == 1
+
+
+def test_key_reused_for_different_request():
+    headers = {**register_and_login(f"idem-{uuid4().hex[:8]}@example.com")}
+    headers["Idempotency-Key"] = uuid4().hex
+    client.post("/api/v1/notes", headers=headers, json={"title": "a", "body": "x"})
+    r = client.post("/api/v1/notes", headers=headers, json={"title": "b", "body": "x"})
+    assert r.status_code == 422
+    assert r.headers["content-type"].startswith("application/problem+json")
+    assert r.json()["code"] == "IDEMPOTENCY_KEY_REUSED"
+
+
+def test_keys_are_scoped_per_user():
+    key = uuid4().hex
+    title = f"idem-{uuid4().hex}"
+    for _ in range(2):
+        h = {**register_and_login(f"idem-{uuid4().hex[:8]}@example.com"), "Idempotency-Key": key}
+        r = client.post("/api/v1/notes", headers=h, json={"title": title, "body": "x"})
+        assert "Idempotent-Replayed" not in r.headers
+    assert _count_notes(title) == 2
+
+
+def test_delete_retry_replays_204():
+    headers = register_and_login(f"idem-{uuid4().hex[:8]}@example.com")
+    note_id = client.post(
+        "/api/v1/notes", headers=headers, json={"title": "t", "body": "x"}
+    ).json()["id"]
+    h = {**headers, "Idempotency-Key": uuid4().hex}
+    assert client.delete(f"/api/v1/notes/{note_id}", headers=h).status_code == 204
+    r = client.delete(f"/api/v1/notes/{note_id}", headers=h)
+    assert r.status_code == 204
+    assert r.headers["Idempotent-Replayed"] == "true"
+    assert client.delete(f"/api/v1/notes/{note_id}", headers=headers).status_code == 404
+
+
+def test_expired_key_is_reusable(factory):
+    store = IdempotencyStore(ttl=10)
+    db = factory()
+    store.record(db, 1, "k", "fp-a", 200, b"{}", now=1000)
+    db.commit()
+    assert store.lookup(db, 1, "k", "fp-a", now=1005).body == b"{}"
+    with pytest.raises(KeyReuseError):
+        store.lookup(db, 1, "k", "fp-b", now=1005)
+    assert store.lookup(db, 1, "k", "fp-b", now=1010) is None
+    store.record(db, 1, "k", "fp-b", 201, b"", now=1010)
+    db.commit()
+    assert store.lookup(db, 1, "k", "fp-b", now=1011).status_code == 201
+
+
+def test_purge_expired_in_batches(factory):
+    store = IdempotencyStore(ttl=10, purge_batch=7)
+    db = factory()
+    for i in range(30):
+        store.record(db, 1, f"k{i}", "fp", 200, b"", now=1000 if i < 25 else 2000)
+    db.commit()
+    assert store.purge_expired(db, now=1500) == 25
+    assert db.execute(select(func.count()).select_from(IdempotencyKey)).scalar_one() == 5
+
+
+def test_purge_due_is_throttled():
+    store = IdempotencyStore(purge_interval=3600)
+    assert store.purge_due()
+    assert not store.purge_due()
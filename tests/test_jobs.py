@@ -0,0 +1,238 @@
+import threading
+import time
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from studynotes import jobs
+from studynotes.database import Base, SessionLocal
+from studynotes.jobs import JobRunner, job_runner
+from studynotes.main import app
+from studynotes.models import Job, User
+
+client = TestClient(app)
+
+
+def register_and_login(email: str, admin: bool = False) -> dict:
+    password = "Password123"
+    client.post("/api/v1/auth/register", json={"email": email, "password": password})
+    if admin:
+        db = SessionLocal()
+        db.execute(select(User).where(User.email == email)).scalar_one().role = "admin"
+        db.commit()
+        db.close()
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": password})
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+@pytest.fixture
+def factory(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    def register(kind, fn):
+        monkeypatch.setitem(jobs._handlers, kind, fn)
+
+    return register
+
+
+def _job(factory, job_id) -> Job:
+    db = factory()
+    try:
+        return db.get(Job, job_id)
+    finally:
+        db.close()
+
+
+def test_job_runs_with_progress_and_result(factory, handler):
+    seen = []
+
+    def count(ctx, params):
+        for i in range(params["n"]):
+            ctx.progress(i + 1, total=params["n"], message=f"step {i}")
+            seen.append(i)
+        return {"counted": params["n"]}
+
+    handler("count", count)
+    runner = JobRunner(factory, workers=0, progress_interval=0)
+    db = factory()
+    job_id = runner.submit(db, "count", {"n": 5}).id
+    db.close()
+    assert _job(factory, job_id).status == "queued"
+
+    assert runner.run_pending()
+    assert not runner.run_pending()
+    job = jobs.as_dict(_job(factory, job_id))
+    assert job["status"] == "succeeded"
+    assert job["result"] == {"counted": 5}
+    assert job["progress"] == 1.0 and job["message"] == "step 4"
+    assert seen == list(range(5))
+
+
+def test_failed_and_unknown_jobs(factory, handler):
+    def boom(ctx, params):
+        raise RuntimeError("disk full")
+
+    handler("boom", boom)
+    runner = JobRunner(factory, workers=0)
+    db = factory()
+    job_id = runner.submit(db, "boom").id
+    with pytest.raises(jobs.UnknownJobKind):
+        runner.submit(db, "nope")
+    db.close()
+    runner.run_pending()
+    job = _job(factory, job_id)
+    assert job.status == "failed" and job.error == "RuntimeError: disk full"
+    assert job.finished_at is not None
+
+
+def test_cancel_queued_and_running_jobs(factory, handler):
+    runner = JobRunner(factory, workers=0, progress_interval=0)
+
+    def slow(ctx, params):
+        for i in range(100):
+            if i == 3:
+                db = factory()
+                runner.cancel(db, ctx.job_id)
+                db.close()
+            ctx.progress(i)
+        return {"finished": True}
+
+    handler("slow", slow)
+    db = factory()
+    running = runner.submit(db, "slow").id
+    queued = runner.submit(db, "slow").id
+    runner.cancel(db, queued)
+    db.close()
+
+    assert runner.run_pending()
+    job = _job(factory, running)
+    assert job.status == "cancelled" and job.done == 3 and job.result is None
+    assert _job(factory, queued).status == "cancelled"
+    assert not runner.run_pending()
+
+
+def test_shutdown_and_stale_workers_requeue_jobs(factory, handler):
+    runner = JobRunner(factory, workers=0, progress_interval=0, stale_after=60)
+
+    def interrupted(ctx, params):
+        runner._stop.set()
+        ctx.progress(1)
+
+    handler("interrupted", interrupted)
+    db = factory()
+    job_id = runner.submit(db, "interrupted").id
+    runner.run_pending()
+    assert _job(factory, job_id).status == "queued"
+
+    now = int(time.time())
+    db.add(Job(kind="interrupted", status="running", created_at=now, heartbeat_at=now - 120))
+    db.add(Job(kind="interrupted", status="running", created_at=now, heartbeat_at=now))
+    db.commit()
+    db.close()
+    assert runner.requeue_stale() == 1
+
+
+def test_silent_handler_keeps_heartbeating(factory, handler):
+    runner = JobRunner(factory, workers=0, stale_after=0.3)
+    other = JobRunner(factory, workers=0, stale_after=0.3)
+    requeued = []
+
+    def silent(ctx, params):
+        time.sleep(1.2)  # never reports progress
+        requeued.append(other.requeue_stale(now=time.time() + 0.2))
+
+    handler("silent", silent)
+    db = factory()
+    job_id = runner.submit(db, "silent").id
+    db.close()
+    runner.run_pending()
+    assert requeued == [0]
+    assert _job(factory, job_id).status == "succeeded"
+
+
+def test_worker_loop_requeues_stale_jobs(factory, handler):
+    handler("orphan", lambda ctx, params: {"rerun": True})
+    db = factory()
+    now = int(time.time())
+    db.add(Job(kind="orphan", status="running", created_at=now, heartbeat_at=now - 120))
+    db.commit()
+    job_id = db.execute(select(Job.id)).scalar_one()
+    db.close()
+    runner = JobRunner(factory, workers=1, poll_interval=0.05, stale_after=60)
+    # Not through start(): that requeues once up front.
+    runner._threads = [threading.Thread(target=runner._loop, daemon=True)]
+    runner._threads[0].start()
+    try:
+        deadline = time.monotonic() + 10
+        while _job(factory, job_id).status != "succeeded" and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        runner.stop()
+    assert jobs.as_dict(_job(factory, job_id))["result"] == {"rerun": True}
+
+
+def test_a_job_is_claimed_by_one_runner_only(factory, handler):
+    handler("noop", lambda ctx, params: None)
+    first, second = JobRunner(factory, workers=0), JobRunner(factory, workers=0)
+    db = factory()
+    first.submit(db, "noop")
+    db.close()
+    assert first._claim() is not None
+    assert second._claim() is None
+
+
+def test_worker_pool_drains_the_queue(factory, handler):
+    handler("square", lambda ctx, params: {"value": params["x"] ** 2})
+    runner = JobRunner(factory, workers=2, poll_interval=0.05)
+    runner.start()
+    try:
+        db = factory()
+        ids = [runner.submit(db, "square", {"x": x}).id for x in range(6)]
+        db.close()
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            if all(_job(factory, i).status == "succeeded" for i in ids):
+                break
+            time.sleep(0.05)
+    finally:
+        runner.stop()
+    assert [jobs.as_dict(_job(factory, i))["result"] for i in ids] == [
+        {"value": x**2} for x in range(6)
+    ]
+
+
+def test_admin_job_endpoints():
+    admin = register_and_login(f"jobs-{uuid4().hex[:8]}@example.com", admin=True)
+    user = register_and_login(f"jobs-{uuid4().hex[:8]}@example.com")
+    assert client.post("/api/v1/admin/jobs", headers=user, json={"kind": "x"}).status_code == 403
+    r = client.post("/api/v1/admin/jobs", headers=admin, json={"kind": "nope"})
+    assert r.status_code == 422 and r.json()["code"] == "UNKNOWN_JOB_KIND"
+
+    r = client.post("/api/v1/admin/archive", headers=admin, params={"older_than_days": 9999})
+    assert r.status_code == 202 and r.json()["kind"] == "archive"
+    archive_id = r.json()["id"]
+    r = client.post(f"/api/v1/admin/jobs/{archive_id}/cancel", headers=admin)
+    assert r.status_code == 202 and r.json()["status"] == "cancelled"
+
+    r = client.post("/api/v1/admin/jobs", headers=admin, json={"kind": "tag_recount"})
+    assert r.status_code == 202 and r.json()["status"] == "queued"
+    job_id = r.json()["id"]
+    assert job_runner.run_pending()
+    job = client.get(f"/api/v1/admin/jobs/{job_id}", headers=admin).json()
+    assert job["status"] == "succeeded" and job["result"]["tags"] >= 0
+
+    r = client.post(f"/api/v1/admin/jobs/{job_id}/cancel", headers=admin)
+    assert r.status_code == 409 and r.json()["code"] == "JOB_FINISHED"
+    assert client.get("/api/v1/admin/jobs/999999999", headers=admin).status_code == 404
+    listed = client.get("/api/v1/admin/jobs", headers=admin, params={"limit": 5}).json()
+    assert [j["id"] for j in listed][:2] == [job_id, archive_id]
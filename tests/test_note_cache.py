@@ -0,0 +1,126 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+
+from studynotes.cache import NoteCache, SharedCounters, note_cache
+from studynotes.main import app
+
+client = TestClient(app)
+
+
+def register_and_login(email: str) -> dict:
+    password = "Password123"
+    r = client.post("/api/v1/auth/register", json={"email": email, "password": password})
+    assert r.status_code in (200, 400)
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": password})
+    assert r.status_code == 200
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def test_lru_evicts_by_bytes():
+    cache = NoteCache(max_bytes=10)
+    for i in range(3):
+        cache.put(i, cache.version(i), 1, b"abcd")
+    assert cache.get(0) is None
+    assert cache.get(2).payload == b"abcd"
+    stats = cache.stats()
+    assert stats["bytes"] == 8
+    assert stats["evictions"] == 1
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("studynotes.cache.time.monotonic", lambda: now[0])
+    cache = NoteCache(ttl_seconds=60)
+    cache.put(1, cache.version(1), 1, b"x")
+    assert cache.get(1) is not None
+    now[0] += 61
+    assert cache.get(1) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_stale_version_not_stored():
+    cache = NoteCache()
+    version = cache.version(1)
+    cache.invalidate(1)  # a write lands while the reader is querying
+    cache.put(1, version, 1, b"old")
+    assert cache.get(1) is None
+    cache.put(1, cache.version(1), 1, b"new")
+    assert cache.get(1).payload == b"new"
+
+
+def test_forgotten_versions_retire_outstanding_reads():
+    cache = NoteCache(max_versions=1)
+    version = cache.version(1)
+    cache.invalidate(1)
+    cache.invalidate(2)  # pushes note 1 out of the version map
+    cache.put(1, version, 1, b"old")
+    assert cache.get(1) is None
+
+
+def test_get_note_served_from_cache_and_invalidated():
+    headers = register_and_login(f"cache-{uuid4().hex[:8]}@example.com")
+    r = client.post("/api/v1/notes", headers=headers, json={"title": "v1", "body": "b"})
+    note_id = r.json()["id"]
+
+    hits = note_cache.stats()["hits"]
+    assert client.get(f"/api/v1/notes/{note_id}", headers=headers).json()["title"] == "v1"
+    assert client.get(f"/api/v1/notes/{note_id}", headers=headers).json()["title"] == "v1"
+    assert note_cache.stats()["hits"] == hits + 1
+
+    client.patch(f"/api/v1/notes/{note_id}", headers=headers, json={"title": "v2"})
+    assert client.get(f"/api/v1/notes/{note_id}", headers=headers).json()["title"] == "v2"
+
+    client.delete(f"/api/v1/notes/{note_id}", headers=headers)
+    assert client.get(f"/api/v1/notes/{note_id}", headers=headers).status_code == 404
+
+
+def test_cached_note_still_checks_owner():
+    owner = register_and_login(f"cache-{uuid4().hex[:8]}@example.com")
+    other = register_and_login(f"cache-{uuid4().hex[:8]}@example.com")
+    r = client.post("/api/v1/notes", headers=owner, json={"title": "secret", "body": "b"})
+    note_id = r.json()["id"]
+    assert client.get(f"/api/v1/notes/{note_id}", headers=owner).status_code == 200
+
+    r = client.get(f"/api/v1/notes/{note_id}", headers=other)
+    assert r.status_code == 404
+    assert r.json()["code"] == "NOT_FOUND"
+
+
+def test_shared_versions_invalidate_across_processes():
+    cache = NoteCache()
+    cache.share_versions(SharedCounters(slots=64))
+    cache.put(1, cache.version(1), 1, b"old")
+    cache.put(2, cache.version(2), 1, b"other")
+    pid = os.fork()
+    if pid == 0:
+        cache.invalidate(1)
+        os._exit(0)
+    assert os.waitpid(pid, 0)[1] == 0
+    assert cache.get(1) is None
+    assert cache.get(2).payload == b"other"
+    version = cache.version(1)
+    assert cache.put(1, version, 1, b"new") and cache.get(1).payload == b"new"
+
+
+def test_shared_versions_survive_exec_through_their_fd():
+    # A reloaded master reopens the counters from the inherited fd, so its
+    # workers and the previous generation's keep invalidating each other.
+    counters = SharedCounters(slots=64)
+    counters.bump(5)
+    code = (
+        "import sys; from studynotes.cache import SharedCounters; "
+        "c = SharedCounters(fd=int(sys.argv[1])); assert c.get(5) == 1; c.bump(5)"
+    )
+    src = str(Path(__file__).resolve().parents[1] / "src")
+    subprocess.run(
+        [sys.executable, "-c", code, str(counters.fd)],
+        pass_fds=[counters.fd],
+        env=dict(os.environ, PYTHONPATH=src),
+        check=True,
+    )
+    assert counters.get(5) == 2
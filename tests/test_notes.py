@@ -51,3 +51,51 @@ def test_crud_flow():
     # delete
     r = client.delete(f"/api/v1/notes/{note['id']}", headers=headers)
     assert r.status_code == 204
+
+
+def test_list_sparse_fields_and_excerpt():
+    headers = register_and_login("sparse@example.com", PASS)
+    body = "x" * 500
+    r = client.post("/api/v1/notes", headers=headers, json={"title": "Long", "body": body})
+    assert r.status_code == 200
+
+    r = client.get("/api/v1/notes", headers=headers, params={"fields": "id,title,tags"})
+    assert r.status_code == 200
+    item = r.json()[0]
+    assert set(item) == {"id", "title", "tags"}
+
+    r = client.get("/api/v1/notes", headers=headers, params={"excerpt": 20})
+    assert r.status_code == 200
+    item = r.json()[0]
+    assert item["body"] == body[:20]
+    assert set(item) == {"id", "title", "body", "owner_id", "tags"}
+
+
+def test_list_without_body_does_not_select_body_column():
+    from sqlalchemy import event
+
+    from studynotes.database import read_engine
+
+    headers = register_and_login("sparse@example.com", PASS)
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(read_engine, "before_cursor_execute", capture)
+    try:
+        r = client.get("/api/v1/notes", headers=headers, params={"fields": "id,title"})
+    finally:
+        event.remove(read_engine, "before_cursor_execute", capture)
+    assert r.status_code == 200
+    note_selects = [s for s in statements if "FROM notes" in s]
+    assert note_selects
+    assert all("notes.body" not in s for s in note_selects)
+
+
+def test_list_unknown_field_rejected():
+    headers = register_and_login()
+    r = client.get("/api/v1/notes", headers=headers, params={"fields": "id,password"})
+    assert r.status_code == 422
+    assert r.headers["content-type"].startswith("application/problem+json")
+    assert r.json()["details"]["unknown"] == ["password"]
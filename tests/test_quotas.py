@@ -0,0 +1,160 @@
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, delete, select, update
+from sqlalchemy.orm import sessionmaker
+
+from studynotes.database import Base, SessionLocal
+from studynotes.jobs import job_runner
+from studynotes.main import app
+from studynotes.models import Note, Tag, User, UserUsage
+from studynotes.quotas import Limits, QuotaExceeded, charge, reconcile
+
+client = TestClient(app)
+
+
+def register_and_login(email: str, admin: bool = False) -> tuple[dict, int]:
+    password = "Password123"
+    r = client.post("/api/v1/auth/register", json={"email": email, "password": password})
+    user_id = r.json()["id"]
+    if admin:
+        db = SessionLocal()
+        db.execute(update(User).where(User.id == user_id).values(role="admin"))
+        db.commit()
+        db.close()
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": password})
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}, user_id
+
+
+def _users(**limits) -> tuple[dict, dict, int]:
+    admin, _ = register_and_login(f"qa-{uuid4().hex[:8]}@example.com", admin=True)
+    user, user_id = register_and_login(f"quota-{uuid4().hex[:8]}@example.com")
+    r = client.patch(f"/api/v1/admin/quotas/{user_id}", headers=admin, json=limits)
+    assert r.status_code == 200
+    return admin, user, user_id
+
+
+def _note(headers: dict, body: str = "body", tags=()):
+    return client.post(
+        "/api/v1/notes", headers=headers, json={"title": "t", "body": body, "tags": list(tags)}
+    )
+
+
+def test_note_count_quota():
+    admin, user, user_id = _users(max_notes=2)
+    ids = [_note(user).json()["id"] for _ in range(2)]
+    r = _note(user)
+    assert r.status_code == 409
+    assert r.headers["content-type"].startswith("application/problem+json")
+    assert r.json()["code"] == "QUOTA_EXCEEDED"
+    assert r.json()["details"] == {"resource": "notes", "limit": 2, "used": 2, "requested": 1}
+
+    assert client.delete(f"/api/v1/notes/{ids[0]}", headers=user).status_code == 204
+    assert _note(user).status_code == 200
+    quota = client.get(f"/api/v1/admin/quotas/{user_id}", headers=admin).json()
+    assert quota["notes"] == 2 and quota["max_notes"] == 2 and quota["body_bytes"] == 8
+
+
+def test_body_bytes_quota_counts_edits():
+    admin, user, user_id = _users(max_body_bytes=12)
+    note_id = _note(user, "ünïcode").json()["id"]  # 9 bytes in UTF-8
+    r = client.patch(f"/api/v1/notes/{note_id}", headers=user, json={"body": "x" * 13})
+    assert r.status_code == 409 and r.json()["details"]["resource"] == "body_bytes"
+    assert _note(user, "abcd").status_code == 409
+
+    # Lowering a limit below current usage still lets the user shrink.
+    client.patch(f"/api/v1/admin/quotas/{user_id}", headers=admin, json={"max_body_bytes": 1})
+    r = client.patch(f"/api/v1/notes/{note_id}", headers=user, json={"body": "abc"})
+    assert r.status_code == 200
+    quota = client.get(f"/api/v1/admin/quotas/{user_id}", headers=admin).json()
+    assert quota["body_bytes"] == 3 and quota["max_body_bytes"] == 1
+
+    # null restores the server default, 0 lifts the limit.
+    r = client.patch(f"/api/v1/admin/quotas/{user_id}", headers=admin, json={"max_body_bytes": 0})
+    assert r.json()["max_body_bytes"] is None and r.json()["max_notes"] == 10000
+    assert _note(user, "y" * 500).status_code == 200
+
+
+def test_tag_quota_only_counts_new_tags():
+    admin, user, user_id = _users(max_tags=1)
+    other, _ = register_and_login(f"quota-{uuid4().hex[:8]}@example.com")
+    shared = f"shared-{uuid4().hex[:8]}"
+    assert client.post("/api/v1/tags", headers=other, json={"name": shared}).status_code == 200
+
+    assert client.post("/api/v1/tags", headers=user, json={"name": shared}).status_code == 200
+    own = f"own-{uuid4().hex[:8]}"
+    assert client.post("/api/v1/tags", headers=user, json={"name": own}).status_code == 200
+    r = client.post("/api/v1/tags", headers=user, json={"name": f"x-{uuid4().hex[:8]}"})
+    assert r.status_code == 409 and r.json()["details"]["resource"] == "tags"
+
+    # The whole note is rejected, not just its new tag.
+    assert _note(user, tags=[own, f"y-{uuid4().hex[:8]}"]).status_code == 409
+    assert _note(user, tags=[own, shared]).status_code == 200
+    quota = client.get(f"/api/v1/admin/quotas/{user_id}", headers=admin).json()
+    assert (quota["notes"], quota["tags"]) == (1, 1)
+
+
+def test_counters_are_seeded_and_reconciled():
+    admin, user, user_id = _users()
+    for body in ("aa", "bbb"):
+        _note(user, body, tags=[f"t-{uuid4().hex[:8]}"])
+    db = SessionLocal()
+    # As if the notes were written before counters existed: seeded on next write.
+    db.execute(delete(UserUsage).where(UserUsage.user_id == user_id))
+    db.commit()
+    assert client.get(f"/api/v1/admin/quotas/{user_id}", headers=admin).json()["notes"] == 2
+    _note(user, "c")
+    db.execute(update(UserUsage).where(UserUsage.user_id == user_id).values(notes=99, tags=0))
+    db.commit()
+
+    r = client.post("/api/v1/admin/quotas/reconcile", headers=admin, params={"user_id": user_id})
+    assert r.status_code == 202 and r.json()["kind"] == "quota_reconcile"
+    while job_runner.run_pending():
+        pass
+    job = client.get(f"/api/v1/admin/jobs/{r.json()['id']}", headers=admin).json()
+    assert job["status"] == "succeeded" and job["result"]["users"] == 1
+    row = db.execute(select(UserUsage).where(UserUsage.user_id == user_id)).scalar_one()
+    assert (row.notes, row.body_bytes, row.tags) == (3, 6, 2)
+    db.close()
+
+
+def test_quota_admin_endpoints_are_admin_only():
+    user, user_id = register_and_login(f"quota-{uuid4().hex[:8]}@example.com")
+    assert client.get(f"/api/v1/admin/quotas/{user_id}", headers=user).status_code == 403
+    admin, _ = register_and_login(f"qa-{uuid4().hex[:8]}@example.com", admin=True)
+    assert client.get("/api/v1/admin/quotas/999999999", headers=admin).status_code == 404
+    r = client.patch(f"/api/v1/admin/quotas/{user_id}", headers=admin, json={"max_notes": -1})
+    assert r.status_code == 422
+
+
+def test_quota_applies_to_group_committed_writes(monkeypatch):
+    monkeypatch.setattr("studynotes.main.NOTE_WRITE_BATCHING", True)
+    _, user, _ = _users(max_notes=1)
+    assert _note(user).status_code == 200
+    r = _note(user)
+    assert r.status_code == 409 and r.json()["code"] == "QUOTA_EXCEEDED"
+
+
+def test_bulk_reconcile_and_charge(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'usage.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all(Note(title="t", body="x" * (uid + 1), owner_id=uid) for uid in (1, 2, 2, 3))
+    db.add_all([Tag(name="a", created_by=3), Tag(name="b")])
+    db.add(UserUsage(user_id=4, notes=7, body_bytes=7, tags=7))
+    db.commit()
+
+    assert reconcile(db, batch=2) == 4
+    rows = db.execute(select(UserUsage).order_by(UserUsage.user_id)).scalars()
+    assert [(r.user_id, r.notes, r.body_bytes, r.tags) for r in rows] == [
+        (1, 1, 2, 0),
+        (2, 2, 6, 0),
+        (3, 1, 4, 1),
+        (4, 0, 0, 0),
+    ]
+    charge(db, 2, Limits(notes=3), notes=1, body_bytes=10)
+    with pytest.raises(QuotaExceeded) as exc:
+        charge(db, 2, Limits(notes=3), notes=1)
+    assert (exc.value.resource, exc.value.used) == ("notes", 3)
+    db.close()
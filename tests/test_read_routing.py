@@ -0,0 +1,62 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from studynotes.archive import touch_tracker
+from studynotes.database import ReadSessionLocal, engine, read_engine
+from studynotes.main import app
+
+client = TestClient(app)
+
+
+def register_and_login(email: str) -> dict:
+    password = "Password123"
+    r = client.post("/api/v1/auth/register", json={"email": email, "password": password})
+    assert r.status_code in (200, 400)
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": password})
+    assert r.status_code == 200
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def test_read_session_rejects_writes():
+    db = ReadSessionLocal()
+    try:
+        with pytest.raises(OperationalError):
+            db.execute(text("INSERT INTO tags (name) VALUES ('ro-test')"))
+    finally:
+        db.rollback()
+        db.close()
+
+
+def test_write_engine_uses_wal():
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+
+
+def test_get_handlers_only_use_read_engine(monkeypatch):
+    # The batched touched_at write-back may come due during a long test run.
+    monkeypatch.setattr(touch_tracker, "flush_due", lambda: False)
+    headers = register_and_login("read-routing@example.com")
+    r = client.post("/api/v1/notes", headers=headers, json={"title": "ro", "body": "b"})
+    note_id = r.json()["id"]
+
+    writes, reads = [], []
+
+    def on_write(conn, cursor, statement, parameters, context, executemany):
+        writes.append(statement)
+
+    def on_read(conn, cursor, statement, parameters, context, executemany):
+        reads.append(statement)
+
+    event.listen(engine, "before_cursor_execute", on_write)
+    event.listen(read_engine, "before_cursor_execute", on_read)
+    try:
+        assert client.get("/api/v1/notes", headers=headers).status_code == 200
+        assert client.get(f"/api/v1/notes/{note_id}", headers=headers).status_code == 200
+        assert client.get("/api/v1/tags", headers=headers).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", on_write)
+        event.remove(read_engine, "before_cursor_execute", on_read)
+    assert writes == []
+    assert reads
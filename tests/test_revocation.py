@@ -0,0 +1,112 @@
+import time
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from jose import jwt
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from studynotes.database import Base, SessionLocal
+from studynotes.main import app
+from studynotes.models import RevokedToken, User
+from studynotes.revocation import BloomFilter, RevocationList
+
+client = TestClient(app)
+
+
+def register_and_login(email: str, admin: bool = False) -> tuple[dict, str]:
+    password = "Password123"
+    client.post("/api/v1/auth/register", json={"email": email, "password": password})
+    if admin:
+        db = SessionLocal()
+        db.execute(select(User).where(User.email == email)).scalar_one().role = "admin"
+        db.commit()
+        db.close()
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": password})
+    token = r.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}, token
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'revoked.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000)
+    items = [uuid4().hex for _ in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    false_positives = sum(uuid4().hex in bloom for _ in range(10_000))
+    assert false_positives < 50
+
+
+def test_logout_revokes_only_that_token():
+    email = f"revoke-{uuid4().hex[:8]}@example.com"
+    headers, token = register_and_login(email)
+    other, _ = register_and_login(email)
+    assert jwt.get_unverified_claims(token)["jti"]
+    assert client.get("/api/v1/notes", headers=headers).status_code == 200
+
+    assert client.post("/api/v1/auth/logout", headers=headers).status_code == 204
+    assert client.get("/api/v1/notes", headers=headers).status_code == 401
+    assert client.get("/api/v1/notes", headers=other).status_code == 200
+
+
+def test_admin_revokes_by_jti():
+    admin, _ = register_and_login(f"revoke-{uuid4().hex[:8]}@example.com", admin=True)
+    headers, token = register_and_login(f"revoke-{uuid4().hex[:8]}@example.com")
+    jti = jwt.get_unverified_claims(token)["jti"]
+    r = client.post("/api/v1/admin/revocations", headers=headers, json={"jti": jti})
+    assert r.status_code == 403
+    r = client.post("/api/v1/admin/revocations", headers=admin, json={"jti": jti})
+    assert r.status_code == 204
+    assert client.get("/api/v1/notes", headers=headers).status_code == 401
+    assert client.get("/api/v1/admin/revocations", headers=admin).json()["revoked"] >= 1
+
+
+def test_refresh_reads_only_new_rows_and_drops_expired(db):
+    revoked = RevocationList(refresh_interval=3600)
+    now = int(time.time())
+    db.add_all(
+        [RevokedToken(jti="a", expires_at=now + 60), RevokedToken(jti="b", expires_at=now + 5)]
+    )
+    db.commit()
+    revoked.refresh(db)
+    assert revoked.is_revoked("a", db) and revoked.is_revoked("b", db)
+
+    # Another worker revokes "c"; "b" expires.
+    db.add(RevokedToken(jti="c", expires_at=now + 60))
+    db.commit()
+    revoked.refresh(db, now=now + 10)
+    assert revoked.is_revoked("c", db)
+    assert not revoked.is_revoked("b", db)
+    assert revoked.stats()["revoked"] == 2
+    assert revoked.stats()["last_id"] == 3
+
+
+def test_live_tokens_are_checked_without_the_database(db):
+    class NoQueries:
+        def execute(self, *args, **kwargs):
+            raise AssertionError("hot path must not query the database")
+
+    revoked = RevocationList(refresh_interval=3600)
+    revoked.revoke(db, "gone", 1, int(time.time()) + 60)
+    revoked.refresh(db)
+    assert not revoked.is_revoked(uuid4().hex, NoQueries())
+    assert revoked.is_revoked("gone", NoQueries())
+
+
+def test_revoke_prunes_expired_rows_without_reusing_ids(db):
+    revoked = RevocationList()
+    now = int(time.time())
+    revoked.revoke(db, "old", 1, now - 1)
+    revoked.revoke(db, "new", 1, now + 60)
+    ids = dict(db.execute(select(RevokedToken.jti, RevokedToken.id)).all())
+    assert ids == {"new": 2}
@@ -1,6 +1,23 @@
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
 from jose import jwt
+from sqlalchemy import select
 
-from studynotes.security import create_access_token, hash_password, verify_password
+from studynotes import security
+from studynotes.database import SessionLocal
+from studynotes.main import app
+from studynotes.models import User
+from studynotes.security import (
+    Argon2Params,
+    calibrate_argon2,
+    configure_password_hashing,
+    create_access_token,
+    hash_password,
+    password_needs_rehash,
+    verify_password,
+)
 
 
 def test_argon2_hash_and_verify_ok():
@@ -35,3 +52,65 @@ def test_jwt_created_and_decodable(monkeypatch):
     assert header.get("kid") == "kid-1"
     assert claims["sub"] == "user-1"
     assert "exp" in claims and "iat" in claims
+
+
+def _fake_timer(ms_per_pass_per_256mib):
+    def timer(params):
+        return ms_per_pass_per_256mib * params.time_cost * params.memory_cost / 262_144
+
+    return timer
+
+
+def test_calibration_fills_latency_budget_memory_first():
+    found = calibrate_argon2(target_ms=500, max_memory_kib=1024 * 1024, timer=_fake_timer(10))
+    assert found.memory_cost == 1024 * 1024
+    assert found.time_cost == 12  # 40 ms per pass at 1 GiB
+    assert found.parallelism == 1
+
+
+def test_calibration_never_goes_below_nfr_floor():
+    found = calibrate_argon2(target_ms=100, max_memory_kib=64 * 1024, timer=_fake_timer(300))
+    assert found == Argon2Params(262_144, 3, 1)
+
+
+@pytest.fixture
+def stronger_params():
+    previous = security.argon2_params
+    configure_password_hashing(Argon2Params(previous.memory_cost, previous.time_cost + 1))
+    yield security.argon2_params
+    configure_password_hashing(previous)
+
+
+def test_login_rehashes_stale_hash(stronger_params):
+    client = TestClient(app)
+    email = f"rehash-{uuid4().hex[:8]}@example.com"
+    old_hash = security._make_context(Argon2Params(262_144, 3)).hash("Password123")
+    db = SessionLocal()
+    db.add(User(email=email, hashed_password=old_hash))
+    db.commit()
+    db.close()
+    assert password_needs_rehash(old_hash)
+
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": "Password123"})
+    assert r.status_code == 200
+    db = SessionLocal()
+    new_hash = db.execute(select(User.hashed_password).where(User.email == email)).scalar_one()
+    db.close()
+    assert new_hash != old_hash
+    assert f"t={stronger_params.time_cost}" in new_hash
+    assert not password_needs_rehash(new_hash)
+    assert verify_password("Password123", new_hash)
+
+
+def test_stronger_hashes_are_not_rewritten():
+    current = security.argon2_params
+    stronger = security._make_context(Argon2Params(current.memory_cost, current.time_cost + 1))
+    assert not password_needs_rehash(stronger.hash("Password123"))
+    assert password_needs_rehash("$2b$12$notanargon2hashatall")
+
+
+def test_concurrent_hashing_stays_within_memory_budget(monkeypatch):
+    monkeypatch.setattr(security, "ARGON2_MEMORY_BUDGET_KIB", 1024 * 1024)
+    monkeypatch.setattr(security.os, "cpu_count", lambda: 16)
+    assert security._hash_slots(Argon2Params(262_144, 3))._value == 4
+    assert security._hash_slots(Argon2Params(2 * 1024 * 1024, 3))._value == 1
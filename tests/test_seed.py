@@ -0,0 +1,88 @@
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func, select
+
+from studynotes.database import SessionLocal
+from studynotes.main import app
+from studynotes.models import Note, NoteTag, Tag, User
+from studynotes.schemas import NOTE_BODY_MAX_LENGTH
+from studynotes.seed import seed, tag_names
+from studynotes.sharding import SHARD_ID_SPAN, ShardRouter
+
+client = TestClient(app)
+
+
+def _count(engine, stmt) -> int:
+    with engine.connect() as conn:
+        return conn.execute(stmt).scalar_one()
+
+
+def test_seed_bulk_inserts_users_notes_and_zipf_tags(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'seed.db'}")
+    stats = seed(50, 40, tags=30, engine=engine, router=None, batch=300)
+    assert stats.users == 50
+    assert _count(engine, select(func.count()).select_from(User)) == 50
+    assert _count(engine, select(func.count()).select_from(Note)) == stats.notes > 0
+    assert _count(engine, select(func.count()).select_from(NoteTag)) == stats.links
+
+    names = tag_names(30)
+    with engine.connect() as conn:
+        usage = dict(
+            conn.execute(
+                select(Tag.name, func.count(NoteTag.id)).join(NoteTag).group_by(Tag.name)
+            ).all()
+        )
+        hashes = conn.execute(select(func.count(func.distinct(User.hashed_password)))).scalar()
+    assert usage[names[0]] > 5 * usage.get(names[-1], 0)
+    assert hashes == 1
+
+    # Seeding again appends instead of colliding on ids or emails.
+    seed(5, 2, tags=30, engine=engine, router=None)
+    assert _count(engine, select(func.count()).select_from(User)) == 55
+
+
+def test_seed_places_notes_in_owner_shards(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'seed.db'}")
+    router = ShardRouter(3, str(tmp_path / "shards"))
+    try:
+        stats = seed(30, 10, tags=10, engine=engine, router=router)
+        assert _count(engine, select(func.count()).select_from(Note)) == 0
+        total = 0
+        for i, shard in enumerate(router.engines):
+            with shard.connect() as conn:
+                rows = conn.execute(select(Note.id, Note.owner_id)).all()
+            assert all(router.shard_for(owner) == i for _, owner in rows)
+            assert all(note_id > (i + 1) * SHARD_ID_SPAN for note_id, _ in rows)
+            total += len(rows)
+        assert total == stats.notes
+    finally:
+        router.close()
+
+
+def test_seeded_user_can_log_in():
+    prefix = f"seed-{uuid4().hex[:8]}-"
+    seed(1, 3, tags=5, email_prefix=prefix, password="Seeded123", router=None)
+    db = SessionLocal()
+    email = db.execute(select(User.email).where(User.email.like(f"{prefix}%"))).scalar_one()
+    db.close()
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": "Seeded123"})
+    assert r.status_code == 200
+
+
+def test_seeded_notes_are_readable_through_the_api():
+    prefix = f"seed-{uuid4().hex[:8]}-"
+    seed(3, 30, tags=20, body_median=9000, email_prefix=prefix, password="Seeded123", router=None)
+    db = SessionLocal()
+    emails = db.execute(select(User.email).where(User.email.like(f"{prefix}%"))).scalars().all()
+    db.close()
+    longest = 0
+    for email in emails:
+        r = client.post("/api/v1/auth/login", json={"email": email, "password": "Seeded123"})
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        listed = client.get("/api/v1/notes", headers=headers, params={"limit": 100}).json()
+        for note in listed:
+            r = client.get(f"/api/v1/notes/{note['id']}", headers=headers)
+            assert r.status_code == 200
+            longest = max(longest, len(r.json()["body"]))
+    assert longest == NOTE_BODY_MAX_LENGTH
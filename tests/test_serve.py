@@ -0,0 +1,183 @@
+import http.client
+import json
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+SRC = str(Path(__file__).resolve().parents[1] / "src")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    def __init__(self, tmp_path, workers: int, **extra_env: str) -> None:
+        self.port = _free_port()
+        env = dict(os.environ, PYTHONPATH=SRC, JWT_SECRET="ci_super_secret_1234567890")
+        env.update(extra_env)
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "studynotes.serve", "--workers", str(workers)]
+            + ["--port", str(self.port), "--graceful-timeout", "5", "--log-level", "warning"],
+            cwd=tmp_path,
+            env=env,
+        )
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                if self.request("GET", "/health")[0] == 200:
+                    return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError("server did not start")
+
+    def request(self, method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+        try:
+            headers = dict(headers or {})
+            payload = None
+            if body is not None:
+                payload = json.dumps(body)
+                headers["Content-Type"] = "application/json"
+            conn.request(method, path, body=payload, headers=headers)
+            r = conn.getresponse()
+            return r.status, r.read()
+        finally:
+            conn.close()
+
+    def login(self, email: str) -> dict:
+        creds = {"email": email, "password": "Password123"}
+        self.request("POST", "/api/v1/auth/register", creds)
+        token = json.loads(self.request("POST", "/api/v1/auth/login", creds)[1])["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+
+    def workers(self) -> set[str]:
+        out = subprocess.run(["pgrep", "-P", str(self.proc.pid)], capture_output=True, text=True)
+        return set(out.stdout.split())
+
+
+@pytest.fixture
+def server(tmp_path):
+    srv = Server(tmp_path, workers=2)
+    yield srv
+    if srv.proc.poll() is None:
+        srv.proc.kill()
+        srv.proc.wait()
+
+
+def _sse_events(port: int, headers: dict, n: int, out: list, ready: threading.Event) -> None:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=20)
+    conn.request("GET", "/api/v1/notes/events", headers=headers)
+    r = conn.getresponse()
+    ready.set()
+    while len(out) < n:
+        line = r.fp.readline().decode()
+        if line.startswith("id: "):
+            out.append(int(line[4:]))
+    conn.close()
+
+
+def test_workers_share_cache_invalidations_and_events(server):
+    assert len(server.workers()) == 2
+    headers = server.login("serve@example.com")
+    events, ready = [], threading.Event()
+    listener = threading.Thread(
+        target=_sse_events, args=(server.port, headers, 6, events, ready), daemon=True
+    )
+    listener.start()
+    ready.wait(10)
+    time.sleep(0.2)
+
+    status, body = server.request("POST", "/api/v1/notes", {"title": "v0", "body": "b"}, headers)
+    note_id = json.loads(body)["id"]
+    for i in range(1, 6):
+        # Warm both workers' caches, write through one, read through all.
+        for _ in range(4):
+            server.request("GET", f"/api/v1/notes/{note_id}", headers=headers)
+        server.request("PATCH", f"/api/v1/notes/{note_id}", {"title": f"v{i}"}, headers)
+        titles = {
+            json.loads(server.request("GET", f"/api/v1/notes/{note_id}", headers=headers)[1])[
+                "title"
+            ]
+            for _ in range(6)
+        }
+        assert titles == {f"v{i}"}
+    listener.join(10)
+    assert events == [1, 2, 3, 4, 5, 6]
+
+    # Tag usage counted in one worker reaches the other's suggestions.
+    tag = f"served-{os.getpid()}"
+    server.request("POST", "/api/v1/notes", {"title": "t", "body": "b", "tags": [tag]}, headers)
+    deadline = time.monotonic() + 5
+    while True:
+        answers = {
+            server.request("GET", f"/api/v1/tags/suggest?prefix={tag}", headers=headers)[1]
+            for _ in range(6)
+        }
+        if len(answers) == 1 or time.monotonic() > deadline:
+            break
+        time.sleep(0.1)
+    assert [json.loads(a) for a in answers] == [[{"name": tag, "usage": 1}]]
+
+
+def test_reload_replaces_workers_without_failed_requests(server):
+    headers = server.login("reload@example.com")
+    before = server.workers()
+    errors, done, stop = [], [0], threading.Event()
+
+    def load():
+        while not stop.is_set():
+            try:
+                status, _ = server.request("GET", "/api/v1/notes?limit=5", headers=headers)
+                done[0] += 1
+                if status != 200:
+                    errors.append(status)
+            except OSError as exc:
+                errors.append(repr(exc))
+
+    threads = [threading.Thread(target=load) for _ in range(4)]
+    for t in threads:
+        t.start()
+    try:
+        os.kill(server.proc.pid, signal.SIGHUP)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            after = server.workers()
+            if len(after) == 2 and not after & before:
+                break
+            time.sleep(0.2)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    assert len(after) == 2 and not after & before
+    assert done[0] > 0 and errors == []
+
+    server.proc.send_signal(signal.SIGTERM)
+    assert server.proc.wait(timeout=30) == 0
+
+
+def test_sharded_fan_out_works_in_forked_workers(tmp_path):
+    srv = Server(tmp_path, workers=1, SHARD_COUNT="2")
+    try:
+        headers = srv.login("shards@example.com")
+        db = sqlite3.connect(tmp_path / "app.db")
+        with db:
+            db.execute("UPDATE users SET role = 'admin' WHERE email = 'shards@example.com'")
+        db.close()
+        # The master fans out while preloading; the worker must not reuse its pool.
+        status, body = srv.request("GET", "/api/v1/notes", headers=headers)
+        assert status == 200, body
+    finally:
+        srv.proc.kill()
+        srv.proc.wait()
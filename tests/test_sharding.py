@@ -0,0 +1,225 @@
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select, update
+
+from studynotes.archive import archive_store
+from studynotes.cache import note_cache
+from studynotes.database import SessionLocal
+from studynotes.main import app
+from studynotes.models import IdempotencyKey, Note, NoteTag, Tag, User
+from studynotes.quotas import reconcile, usage_for
+from studynotes.sharding import SHARD_ID_SPAN, ShardRouter, jump_hash, rebalance
+
+client = TestClient(app)
+
+
+def register_and_login(email: str, admin: bool = False) -> tuple[dict, int]:
+    password = "Password123"
+    client.post("/api/v1/auth/register", json={"email": email, "password": password})
+    db = SessionLocal()
+    user = db.execute(select(User).where(User.email == email)).scalar_one()
+    if admin:
+        user.role = "admin"
+        db.commit()
+    user_id = user.id
+    db.close()
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": password})
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}, user_id
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    r = ShardRouter(3, str(tmp_path))
+    monkeypatch.setattr("studynotes.main.shard_router", r)
+    note_cache.clear()
+    yield r
+    note_cache.clear()
+    r.close()
+
+
+def test_jump_hash_is_stable_and_moves_few_keys():
+    assert [jump_hash(k, 8) for k in range(5)] == [jump_hash(k, 8) for k in range(5)]
+    moved = sum(jump_hash(k, 8) != jump_hash(k, 9) for k in range(10_000))
+    assert moved < 10_000 * 0.2
+    assert all(0 <= jump_hash(k, 3) < 3 for k in range(1000))
+
+
+def test_shards_allocate_disjoint_note_ids(router):
+    ids = {}
+    for index in range(router.count):
+        db = router.session(index)
+        note = Note(title="t", body="b", owner_id=1)
+        db.add(note)
+        db.commit()
+        ids[index] = note.id
+        db.close()
+    for index, note_id in ids.items():
+        assert (index + 1) * SHARD_ID_SPAN < note_id <= (index + 2) * SHARD_ID_SPAN
+
+
+def test_note_crud_is_routed_to_owner_shard(router):
+    headers, user_id = register_and_login(f"shard-{uuid4().hex[:8]}@example.com")
+    r = client.post(
+        "/api/v1/notes", headers=headers, json={"title": "s", "body": "b", "tags": ["sharded"]}
+    )
+    assert r.status_code == 200
+    note_id = r.json()["id"]
+
+    db = router.session_for(user_id)
+    assert db.get(Note, note_id) is not None
+    db.close()
+    assert client.get(f"/api/v1/notes/{note_id}", headers=headers).json()["tags"] == ["sharded"]
+    items = client.get("/api/v1/notes", headers=headers, params={"tag": "sharded"}).json()
+    assert [n["id"] for n in items] == [note_id]
+    r = client.patch(f"/api/v1/notes/{note_id}", headers=headers, json={"title": "s2"})
+    assert r.json()["title"] == "s2"
+    assert client.delete(f"/api/v1/notes/{note_id}", headers=headers).status_code == 204
+    assert client.get(f"/api/v1/notes/{note_id}", headers=headers).status_code == 404
+
+
+def test_tags_known_to_the_catalogue_are_not_charged_on_a_shard(router):
+    known, fresh = f"known-{uuid4().hex[:8]}", f"fresh-{uuid4().hex[:8]}"
+    db = SessionLocal()
+    db.add(Tag(name=known))
+    db.commit()
+    db.close()
+    headers, user_id = register_and_login(f"shard-{uuid4().hex[:8]}@example.com")
+    r = client.post(
+        "/api/v1/notes", headers=headers, json={"title": "t", "body": "b", "tags": [known, fresh]}
+    )
+    assert r.status_code == 200
+
+    db = router.session_for(user_id)
+    try:
+        assert usage_for(db, user_id)["tags"] == 1
+        reconcile(db, [user_id])
+        assert usage_for(db, user_id)["tags"] == 1
+    finally:
+        db.close()
+
+
+def test_tag_registered_concurrently_does_not_fail_the_write(router, monkeypatch):
+    name = f"race-{uuid4().hex[:8]}"
+
+    def register_meanwhile(names):
+        # Another request puts the name into the catalogue before this one syncs.
+        db = SessionLocal()
+        db.add(Tag(name=name))
+        db.commit()
+        db.close()
+        return set()
+
+    monkeypatch.setattr("studynotes.main._catalogued", register_meanwhile)
+    headers, _ = register_and_login(f"shard-{uuid4().hex[:8]}@example.com")
+    r = client.post(
+        "/api/v1/notes", headers=headers, json={"title": "t", "body": "b", "tags": [name]}
+    )
+    assert r.status_code == 200
+    db = SessionLocal()
+    assert len(db.execute(select(Tag).where(Tag.name == name)).all()) == 1
+    db.close()
+
+
+def test_admin_fans_out_across_shards(router):
+    created = []
+    for _ in range(4):
+        headers, user_id = register_and_login(f"shard-{uuid4().hex[:8]}@example.com")
+        r = client.post("/api/v1/notes", headers=headers, json={"title": "x", "body": "b"})
+        created.append(r.json()["id"])
+    admin, _ = register_and_login(f"shard-admin-{uuid4().hex[:8]}@example.com", admin=True)
+
+    items = client.get("/api/v1/notes", headers=admin, params={"limit": 100}).json()
+    ids = [n["id"] for n in items]
+    assert set(created) <= set(ids)
+    assert ids == sorted(ids, reverse=True)
+    page = client.get("/api/v1/notes", headers=admin, params={"limit": 2, "offset": 1}).json()
+    assert [n["id"] for n in page] == ids[1:3]
+
+    r = client.patch(f"/api/v1/notes/{created[0]}", headers=admin, json={"title": "by admin"})
+    assert r.status_code == 200
+    assert client.get(f"/api/v1/notes/{created[0]}", headers=admin).json()["title"] == "by admin"
+
+
+def test_admin_reaches_archived_notes_on_other_shards(router, tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_store, "directory", str(tmp_path / "archive"))
+    headers, user_id = register_and_login(f"shard-{uuid4().hex[:8]}@example.com")
+    note_id = client.post(
+        "/api/v1/notes", headers=headers, json={"title": "cold", "body": "b"}
+    ).json()["id"]
+    db = router.session_for(user_id)
+    db.execute(update(Note).where(Note.id == note_id).values(touched_at=1))
+    db.commit()
+    assert archive_store.archive(db, "test", older_than=60) == 1
+    db.close()
+    note_cache.clear()
+    while True:  # an admin whose own shard does not hold the note
+        admin, admin_id = register_and_login(
+            f"shard-admin-{uuid4().hex[:8]}@example.com", admin=True
+        )
+        if router.shard_for(admin_id) != router.shard_for(user_id):
+            break
+
+    r = client.patch(f"/api/v1/notes/{note_id}", headers=admin, json={"title": "warm"})
+    assert r.status_code == 200
+    assert client.get(f"/api/v1/notes/{note_id}", headers=headers).json()["title"] == "warm"
+
+
+def test_rebalance_moves_notes_to_new_owner_shards(tmp_path):
+    single = ShardRouter(1, str(tmp_path))
+    db = single.session(0)
+    for owner_id in range(1, 21):
+        db.add(Note(title=f"n{owner_id}", body="b", owner_id=owner_id, touched_at=owner_id))
+    db.commit()
+    db.close()
+    single.close()
+
+    router = ShardRouter(4, str(tmp_path))
+    moved = rebalance(router, include_main=False)
+    assert sum(moved.values()) > 0
+    for index in range(router.count):
+        db = router.session(index)
+        rows = db.execute(select(Note.owner_id, Note.touched_at)).all()
+        assert all(router.shard_for(o) == index and t == o for o, t in rows)
+        db.close()
+    assert sum(len(router.fan_out(lambda s: s.query(Note).all())[i]) for i in range(4)) == 20
+    assert rebalance(router, include_main=False) == {}
+    router.close()
+
+
+def test_rebalance_moves_tag_ownership_and_idempotency_keys(tmp_path):
+    single = ShardRouter(1, str(tmp_path))
+    router = ShardRouter(4, str(tmp_path))
+    owner_id = next(o for o in range(1, 100) if router.shard_for(o) != 0)
+    db = single.session(0)
+    tag = Tag(name="mine", created_by=owner_id)
+    note = Note(title="n", body="b", owner_id=owner_id)
+    db.add_all([tag, note])
+    db.flush()
+    db.add(NoteTag(note_id=note.id, tag_id=tag.id))
+    db.add(
+        IdempotencyKey(
+            user_id=owner_id,
+            key="k1",
+            fingerprint="f",
+            status_code=200,
+            response_body=b"{}",
+            expires_at=2**40,
+        )
+    )
+    db.commit()
+    db.close()
+    single.close()
+
+    assert rebalance(router, include_main=False) == {"shard-0": 1}
+    dst = router.session_for(owner_id)
+    assert dst.execute(select(Tag.created_by).where(Tag.name == "mine")).scalar_one() == owner_id
+    assert usage_for(dst, owner_id)["tags"] == 1
+    assert dst.execute(select(IdempotencyKey.key)).scalars().all() == ["k1"]
+    dst.close()
+    src = router.session(0)
+    assert src.execute(select(Tag.created_by)).scalars().all() == [None]
+    assert src.execute(select(IdempotencyKey)).first() is None
+    src.close()
+    router.close()
@@ -0,0 +1,99 @@
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+
+from studynotes.main import _list_statement, app
+
+client = TestClient(app)
+
+
+def register_and_login(email: str) -> dict:
+    password = "Password123"
+    r = client.post("/api/v1/auth/register", json={"email": email, "password": password})
+    assert r.status_code in (200, 400)
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": password})
+    assert r.status_code == 200
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def _setup():
+    headers = register_and_login(f"tags-{uuid4().hex[:8]}@example.com")
+    p = uuid4().hex[:6]
+    a, b, c = f"{p}-a", f"{p}-b", f"{p}-c"
+    ids = {}
+    for title, tags in {"ab": [a, b], "a": [a], "bc": [b, c], "none": []}.items():
+        r = client.post(
+            "/api/v1/notes", headers=headers, json={"title": title, "body": "x", "tags": tags}
+        )
+        ids[title] = r.json()["id"]
+    return headers, (a, b, c)
+
+
+def _titles(headers, **params):
+    r = client.get("/api/v1/notes", headers=headers, params=params)
+    assert r.status_code == 200
+    return sorted(n["title"] for n in r.json())
+
+
+def test_match_all_and_any():
+    headers, (a, b, c) = _setup()
+    assert _titles(headers, tag=[a, b]) == ["ab"]
+    assert _titles(headers, tag=[a, b], match="all") == ["ab"]
+    assert _titles(headers, tag=[a, c], match="any") == ["a", "ab", "bc"]
+    assert _titles(headers, tag=a) == ["a", "ab"]
+
+
+def test_exclude_tag():
+    headers, (a, b, c) = _setup()
+    assert _titles(headers, exclude_tag=b) == ["a", "none"]
+    assert _titles(headers, tag=a, exclude_tag=b) == ["a"]
+    assert _titles(headers, tag=b, match="any", exclude_tag=[a, c]) == []
+
+
+def test_common_tags_use_same_results(monkeypatch):
+    # Every tag counts as common, so filters go through the EXISTS plan.
+    monkeypatch.setattr("studynotes.main.SELECTIVE_TAG_USAGE", -1)
+    headers, (a, b, c) = _setup()
+    assert _titles(headers, tag=[a, b]) == ["ab"]
+    assert _titles(headers, tag=[a, c], match="any") == ["a", "ab", "bc"]
+    assert _titles(headers, tag=a, exclude_tag=b) == ["a"]
+
+
+def test_unknown_tags():
+    headers, (a, b, c) = _setup()
+    assert _titles(headers, tag=[a, "no-such-tag"]) == []
+    assert _titles(headers, tag=[a, "no-such-tag"], match="any") == ["a", "ab"]
+    assert _titles(headers, exclude_tag="no-such-tag") == ["a", "ab", "bc", "none"]
+
+
+def test_other_users_notes_not_matched():
+    headers, (a, b, c) = _setup()
+    other = register_and_login(f"tags-{uuid4().hex[:8]}@example.com")
+    client.post("/api/v1/notes", headers=other, json={"title": "theirs", "body": "x", "tags": [a]})
+    assert _titles(headers, tag=a) == ["a", "ab"]
+    assert _titles(other, tag=a) == ["theirs"]
+
+
+def test_invalid_match_rejected():
+    headers = register_and_login("tags-invalid@example.com")
+    r = client.get("/api/v1/notes", headers=headers, params={"tag": "x", "match": "some"})
+    assert r.status_code == 422
+
+
+def test_prebuilt_statements_are_reused_with_fresh_values():
+    headers, (a, b, c) = _setup()
+    other, (x, y, _) = _setup()
+    assert _titles(headers, tag=a, q="b") == ["ab"]
+    hits = _list_statement.cache_info().hits
+    assert _titles(other, tag=x, q="a") == ["a", "ab"]
+    assert _titles(other, tag=y, q="c") == ["bc"]
+    assert _list_statement.cache_info().hits == hits + 2
+
+
+def test_existing_and_new_tags_keep_request_order():
+    headers, (a, b, c) = _setup()
+    new = f"{a}-new"
+    body = {"title": "t", "body": "x", "tags": [f" {new} ", c, a]}
+    r = client.post("/api/v1/notes", headers=headers, json=body)
+    assert r.status_code == 200 and r.json()["tags"] == [new, c, a]
+    assert _titles(headers, tag=[new, a]) == ["t"]
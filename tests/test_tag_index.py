@@ -0,0 +1,82 @@
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+
+from studynotes.main import app
+from studynotes.tagindex import TagPrefixIndex
+
+client = TestClient(app)
+
+
+def register_and_login(email: str) -> dict:
+    password = "Password123"
+    r = client.post("/api/v1/auth/register", json={"email": email, "password": password})
+    assert r.status_code in (200, 400)
+    r = client.post("/api/v1/auth/login", json={"email": email, "password": password})
+    assert r.status_code == 200
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def test_suggest_ranks_by_usage_and_ignores_case():
+    index = TagPrefixIndex()
+    index.load([("Graphs", 5), ("graph-theory", 9), ("grammar", 1), ("algebra", 50)])
+    assert index.suggest("gr", 10) == [("graph-theory", 9), ("Graphs", 5), ("grammar", 1)]
+    assert index.suggest("GRAPH", 1) == [("graph-theory", 9)]
+    assert index.suggest("z", 10) == []
+
+
+def test_cached_top_k_is_invalidated_on_updates():
+    index = TagPrefixIndex(top_k=2, scan_limit=1)
+    index.load([("aa", 3), ("ab", 2), ("ac", 1)])
+    assert index.suggest("a", 2) == [("aa", 3), ("ab", 2)]
+    index.add("ac", 5)
+    index.add("ad")
+    assert index.suggest("a", 2) == [("ac", 6), ("aa", 3)]
+    index.add("ac", -6)
+    assert index.suggest("a", 2) == [("aa", 3), ("ab", 2)]
+
+
+def test_updates_before_load_are_ignored():
+    index = TagPrefixIndex()
+    index.add("early", 1)
+    index.ensure_loaded(lambda: [("early", 1)])
+    assert index.suggest("ea", 5) == [("early", 1)]
+
+
+def test_relayed_updates_keep_processes_in_step():
+    sent = []
+    here, there = TagPrefixIndex(), TagPrefixIndex()
+    here.ensure_loaded(lambda: [("graphs", 1)])
+    there.ensure_loaded(lambda: [("graphs", 1), ("graph-theory", 4)])
+    here.relay_through(lambda op, data: sent.append((op, data)))
+    here.add("graphs", 2)
+    assert here.usage("graphs") == 3
+    for op, data in sent:
+        there.apply(op, data)
+    assert there.usage("graphs") == 3
+
+    here.refresh([("graphs", 7)])
+    assert sent[-1] == ("reload", {})
+    there.apply(*sent[-1])
+    assert there.suggest("gr", 5) == [("graph-theory", 4), ("graphs", 1)]
+
+
+def test_suggest_endpoint_tracks_note_tags():
+    headers = register_and_login("suggest@example.com")
+    tag = f"zz{uuid4().hex[:6]}"
+    r = client.post("/api/v1/tags", headers=headers, json={"name": tag + "-unused"})
+    assert r.status_code == 200
+    for _ in range(2):
+        client.post(
+            "/api/v1/notes", headers=headers, json={"title": "t", "body": "b", "tags": [tag]}
+        )
+
+    r = client.get("/api/v1/tags/suggest", headers=headers, params={"prefix": tag.upper()})
+    assert r.status_code == 200
+    assert r.json() == [{"name": tag, "usage": 2}, {"name": tag + "-unused", "usage": 0}]
+
+
+def test_suggest_requires_prefix():
+    headers = register_and_login("suggest@example.com")
+    r = client.get("/api/v1/tags/suggest", headers=headers)
+    assert r.status_code == 422